@@ -0,0 +1,14 @@
+import os
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Route the I/O-bound endpoints to their async views (config/urls_async.py).
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+
+application = get_asgi_application()
+
+# Deploys without separate worker processes (render.yaml) run the jobs here.
+if settings.IN_PROCESS_JOBS:
+    from rentals.jobs import start
+    start()
@@ -27,6 +27,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'rentals.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -36,7 +37,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'config.urls'
+# Serve checkout, the Stripe webhook and the username check from async views
+# (rentals/async_views.py). On by default under config/asgi.py; under WSGI
+# each async view would run in its own event loop for no gain.
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+ROOT_URLCONF = 'config.urls_async' if ASYNC_VIEWS else 'config.urls'
 
 TEMPLATES = [
     {
@@ -72,6 +77,51 @@ else:
         }
     }
 
+# Cache
+# CACHE_URL accepts django-environ cache URLs, e.g. locmemcache://,
+# filecache:///var/tmp/bike-rental-cache (shared by the processes on one
+# host) or dbcache://rentals_cache (shared through the database; run
+# `manage.py createcachetable` once).
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://'),
+}
+# Whether every process (web workers, worker, scheduler) sees the same default
+# cache. Features that invalidate through cached version counters fall back
+# to the database when it does not. Set it to False for a filecache that the
+# processes do not all share.
+SHARED_CACHE = env.bool(
+    'SHARED_CACHE', default=not CACHES['default']['BACKEND'].endswith(('.LocMemCache', '.DummyCache')),
+)
+# Run the webhook worker, hold expiry and rollup refresh on a thread of each
+# web process (rentals/jobs.py), for deploys without the Procfile's worker,
+# scheduler and rollups processes. Each pass takes a lease in the default
+# cache, so several web processes need SHARED_CACHE to run it only once.
+IN_PROCESS_JOBS = env.bool('IN_PROCESS_JOBS', default=False)
+# Seconds a rendered vehicle list/detail payload stays cached.
+CATALOG_CACHE_TIMEOUT = env.int('CATALOG_CACHE_TIMEOUT', default=300)
+# Seconds a vehicle's month calendar stays cached; booking changes invalidate it sooner.
+CALENDAR_CACHE_TIMEOUT = env.int('CALENDAR_CACHE_TIMEOUT', default=3600)
+
+# Per-view request metrics (rentals/metrics.py). Point METRICS_DIR at a
+# directory shared by the gunicorn workers so /metrics covers all of them;
+# wipe it on deploy. Unset keeps metrics per process.
+METRICS_DIR = env('METRICS_DIR', default='')
+# /metrics and /api/metrics/* answer staff sessions and requests sending
+# "Authorization: Bearer <METRICS_TOKEN>" (the Prometheus bearer_token).
+# Unset leaves them to staff only.
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+# Seconds between a worker's snapshot writes to METRICS_DIR.
+METRICS_FLUSH_INTERVAL = env.float('METRICS_FLUSH_INTERVAL', default=5)
+# Log requests slower than this many milliseconds with their SQL (0 disables).
+SLOW_REQUEST_MS = env.int('SLOW_REQUEST_MS', default=0)
+
+# Token -> user lookups (rentals/authentication.py): 'local' keeps a per-process
+# LRU, 'shared' uses the default cache, 'off' queries on every request. Both
+# caching modes need SHARED_CACHE, which carries their invalidations.
+TOKEN_AUTH_CACHE = env('TOKEN_AUTH_CACHE', default='local')
+TOKEN_AUTH_CACHE_SIZE = env.int('TOKEN_AUTH_CACHE_SIZE', default=10000)
+TOKEN_AUTH_CACHE_TTL = env.int('TOKEN_AUTH_CACHE_TTL', default=60)
+
 AUTH_PASSWORD_VALIDATORS = []
 
 LANGUAGE_CODE = 'en-us'
@@ -83,18 +133,36 @@ STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Background threads per process that resize uploaded vehicle photos
+# (rentals/images.py); 0 resizes in the saving request after commit.
+IMAGE_WORKERS = env.int('IMAGE_WORKERS', default=2)
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Minutes a new pending booking holds its vehicle before checkout; starting
+# checkout extends a shorter remaining hold to cover the Stripe session.
+BOOKING_HOLD_MINUTES = env.int('BOOKING_HOLD_MINUTES', default=30)
+# Cancelled and completed bookings that ended more than this many months ago
+# are moved to the archive tables by archive_bookings (rentals/archive.py).
+ARCHIVE_AFTER_MONTHS = env.int('ARCHIVE_AFTER_MONTHS', default=6)
+
 # Stripe
 STRIPE_SECRET_KEY = env('STRIPE_SECRET_KEY', default='')
 STRIPE_WEBHOOK_SECRET = env('STRIPE_WEBHOOK_SECRET', default='')
+# Keep-alive connection pool and timeouts for calls to the Stripe API.
+STRIPE_HTTP_POOL_SIZE = env.int('STRIPE_HTTP_POOL_SIZE', default=10)
+STRIPE_TIMEOUT = env.float('STRIPE_TIMEOUT', default=30)
+STRIPE_MAX_NETWORK_RETRIES = env.int('STRIPE_MAX_NETWORK_RETRIES', default=2)
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'rentals.authentication.CachedTokenAuthentication',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'rentals.pagination.KeysetPagination',
     'PAGE_SIZE': 10,
+    'DEFAULT_THROTTLE_RATES': {
+        # Per client IP (per user when logged in) for /api/auth/check-username/.
+        'username-check': env('USERNAME_CHECK_RATE', default='60/min'),
+    },
 }
@@ -0,0 +1,12 @@
+from django.urls import path
+
+from rentals import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+# Used instead of config/urls.py when ASYNC_VIEWS is on (config/asgi.py).
+# The async views come first, so they shadow the sync views at the same URLs.
+urlpatterns = [
+    path('api/payments/create-checkout/', async_views.create_checkout_session, name='create-checkout'),
+    path('api/webhooks/stripe/', async_views.stripe_webhook, name='stripe-webhook'),
+    path('api/auth/check-username/', async_views.check_username, name='api-check-username'),
+] + sync_urlpatterns
@@ -1,6 +1,12 @@
 import os
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Deploys without separate worker processes (render.yaml) run the jobs here.
+if settings.IN_PROCESS_JOBS:
+    from rentals.jobs import start
+    start()
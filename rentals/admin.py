@@ -1,7 +1,10 @@
 from django.contrib import admin
-from .models import Vehicle, VehicleImage, Booking, Payment, Review
-import csv
-from django.http import HttpResponse
+from .models import ArchivedBooking, Vehicle, VehicleImage, Booking, Payment, Review, WebhookEvent
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .exports import iter_csv
+from .rollups import mark_bookings
+from .vehicle_stats import add_completed, completed_per_vehicle
 
 
 @admin.register(Vehicle)
@@ -17,19 +20,19 @@ class VehicleImageAdmin(admin.ModelAdmin):
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
     list_display = ('id', 'vehicle', 'user', 'start_date', 'end_date', 'status')
+    list_select_related = ('vehicle', 'user')
     actions = ['confirm_bookings', 'export_csv']
 
     def confirm_bookings(self, request, queryset):
-        queryset.update(status='confirmed')
+        # update() skips auto_now and the receivers that keep bookings_completed and the rollups in step.
+        uncompleted = completed_per_vehicle(queryset)
+        mark_bookings(queryset)
+        queryset.update(status='confirmed', updated_at=timezone.now())
+        add_completed({vehicle_id: -count for vehicle_id, count in uncompleted.items()})
 
     def export_csv(self, request, queryset):
-        fields = ['id', 'vehicle', 'user', 'start_date', 'end_date', 'total_price', 'status']
-        response = HttpResponse(content_type='text/csv')
+        response = StreamingHttpResponse(iter_csv(queryset), content_type='text/csv')
         response['Content-Disposition'] = 'attachment; filename="bookings.csv"'
-        writer = csv.writer(response)
-        writer.writerow(fields)
-        for b in queryset:
-            writer.writerow([getattr(b, f) for f in fields])
         return response
 
 
@@ -41,3 +44,21 @@ class PaymentAdmin(admin.ModelAdmin):
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ('booking', 'rating')
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'type', 'received_at', 'processed_at', 'attempts')
+    list_filter = ('type',)
+
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(admin.ModelAdmin):
+    list_display = ('id', 'vehicle', 'user', 'start_date', 'end_date', 'status', 'archived_at')
+    list_select_related = ('vehicle', 'user')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
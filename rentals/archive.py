@@ -0,0 +1,74 @@
+"""Archival of finished bookings.
+
+Cancelled and completed bookings whose end date is more than
+ARCHIVE_AFTER_MONTHS months old are moved, with their Payment and Review,
+into the ArchivedBooking/ArchivedPayment/ArchivedReview tables by the
+archive_bookings command. Booking then holds little more than the current
+booking window, which keeps availability checks, booking lists and the
+admin changelist small. Users read their older bookings from
+/api/bookings/history/.
+
+Each batch copies and deletes its rows in one transaction, so a booking is
+always in exactly one of the two tables.
+"""
+import calendar
+from datetime import date
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedBooking, ArchivedPayment, ArchivedReview, Booking, Payment, Review
+from .vehicle_stats import frozen
+
+ARCHIVABLE_STATUSES = ['cancelled', 'completed']
+
+
+def months_before(day, months):
+    """The same day ``months`` months earlier, clamped to the end of shorter months."""
+    year, month = divmod(day.year * 12 + day.month - 1 - months, 12)
+    month += 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def archivable(cutoff):
+    """Bookings that ended before ``cutoff`` and can no longer change."""
+    return Booking.objects.filter(status__in=ARCHIVABLE_STATUSES, end_date__lt=cutoff)
+
+
+def _copy(archive_model, instance):
+    return archive_model(**{field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields})
+
+
+def archive_batch(cutoff, batch_size=500):
+    """Move up to ``batch_size`` archivable bookings; returns (bookings, payments, reviews) moved."""
+    with transaction.atomic():
+        queryset = archivable(cutoff).order_by('pk')
+        if transaction.get_connection().features.has_select_for_update_skip_locked:
+            # Several archivers can run at once, and a booking cannot change underneath one.
+            queryset = queryset.select_for_update(skip_locked=True)
+        bookings = list(queryset[:batch_size])
+        if not bookings:
+            return 0, 0, 0
+        ids = [booking.pk for booking in bookings]
+        payments = list(Payment.objects.filter(booking_id__in=ids))
+        reviews = list(Review.objects.filter(booking_id__in=ids))
+
+        ArchivedBooking.objects.bulk_create([_copy(ArchivedBooking, booking) for booking in bookings])
+        ArchivedPayment.objects.bulk_create([_copy(ArchivedPayment, payment) for payment in payments])
+        ArchivedReview.objects.bulk_create([_copy(ArchivedReview, review) for review in reviews])
+        # The delete cascades to the copied payments and reviews. The vehicle
+        # counters include archived rows, so the deletes must not decrement them.
+        with frozen():
+            Booking.objects.filter(pk__in=ids).delete()
+    return len(bookings), len(payments), len(reviews)
+
+
+def archive_bookings(months, batch_size=500, today=None):
+    """Archive every booking that ended more than ``months`` months ago; returns the totals moved."""
+    cutoff = months_before(today or timezone.localdate(), months)
+    totals = [0, 0, 0]
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        totals = [total + count for total, count in zip(totals, moved)]
+        if moved[0] < batch_size:
+            return tuple(totals)
@@ -0,0 +1,143 @@
+"""Async versions of the I/O-bound API views, served under ASGI.
+
+config/urls_async.py routes the checkout, Stripe webhook and username check
+URLs here when ASYNC_VIEWS is on (the default in config/asgi.py). While a
+view awaits Stripe or the database, the worker's event loop keeps serving
+other requests instead of one blocked thread per request. Responses match
+the DRF views in views.py. DRF 3.14 has no async views, so these are plain
+Django views; authentication still runs DRF's configured authenticators,
+in a thread.
+"""
+import json
+
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .models import Booking
+from .payments import aget_or_create_checkout_session
+from .usernames import username_index
+from .views import CheckUsernameView
+from .webhooks import arecord_event
+
+_renderer = JSONRenderer()
+
+
+def _csrf_exempt(view):
+    # django.views.decorators.csrf.csrf_exempt hides coroutines before Django 5.0.
+    view.csrf_exempt = True
+    return view
+
+
+def _json(data=None, status=200, headers=None):
+    content = _renderer.render(data) if data is not None else b''
+    return HttpResponse(content, status=status, headers=headers, content_type='application/json')
+
+
+def _method_not_allowed(request, allowed):
+    detail = exceptions.MethodNotAllowed(request.method).detail
+    return _json({'detail': detail}, status=405, headers={'Allow': ', '.join(allowed)})
+
+
+def _authenticate(request):
+    """The request's user from DRF's configured authenticators, or an APIException."""
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    user = Request(request, authenticators=authenticators).user
+    if not user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    return user
+
+
+def _error(request, exc):
+    headers = {}
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        # Same choice as APIView.handle_exception: 401 only if the first
+        # authenticator can name a scheme for WWW-Authenticate.
+        classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        header = classes[0]().authenticate_header(request) if classes else None
+        if header:
+            headers['WWW-Authenticate'] = header
+        else:
+            exc.status_code = 403
+    if getattr(exc, 'wait', None) is not None:
+        headers['Retry-After'] = '%d' % exc.wait
+    return _json({'detail': exc.detail}, status=exc.status_code, headers=headers)
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            raise exceptions.ParseError()
+    return request.POST
+
+
+@_csrf_exempt
+async def create_checkout_session(request):
+    if request.method != 'POST':
+        return _method_not_allowed(request, ['POST'])
+    try:
+        user = await sync_to_async(_authenticate)(request)
+        data = _request_data(request)
+    except exceptions.APIException as exc:
+        return _error(request, exc)
+    try:
+        booking = await Booking.objects.select_related('vehicle').aget(pk=data.get('booking_id'), user=user)
+    except (Booking.DoesNotExist, ValueError, TypeError):
+        return _json({'detail': 'Not found.'}, status=404)
+    try:
+        session_id = await aget_or_create_checkout_session(
+            booking,
+            success_url=request.build_absolute_uri('/payments/success/'),
+            cancel_url=request.build_absolute_uri('/payments/cancel/'),
+        )
+        return _json({'sessionId': session_id})
+    except Exception as e:
+        return _json({'error': str(e)}, status=400)
+
+
+@_csrf_exempt
+async def stripe_webhook(request):
+    if request.method != 'POST':
+        return _method_not_allowed(request, ['POST'])
+    sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
+    try:
+        # Signature checking is CPU only; no need to leave the event loop.
+        event = stripe.Webhook.construct_event(request.body, sig_header, settings.STRIPE_WEBHOOK_SECRET)
+    except ValueError:
+        return _json(status=400)
+    except stripe.SignatureVerificationError:
+        return _json(status=400)
+
+    # Applied later by the process_webhooks command; duplicates are dropped.
+    await arecord_event(event)
+    return _json({'status': 'received'})
+
+
+def _check_throttle(request, view):
+    for throttle_class in view.throttle_classes:
+        throttle = throttle_class()
+        if not throttle.allow_request(Request(request), view):
+            raise exceptions.Throttled(throttle.wait())
+
+
+async def check_username(request):
+    """Check whether a username is available (GET ?username=...)."""
+    if request.method not in ('GET', 'HEAD'):
+        return _method_not_allowed(request, ['GET', 'HEAD'])
+    try:
+        # Same scope and rate as CheckUsernameView.
+        await sync_to_async(_check_throttle)(request, CheckUsernameView)
+    except exceptions.Throttled as exc:
+        return _error(request, exc)
+    username = request.GET.get('username', '')
+    if not username:
+        return _json({'available': False, 'error': 'username required'}, status=400)
+    is_taken = await sync_to_async(username_index.is_taken)(username)
+    return _json({'available': not is_taken})
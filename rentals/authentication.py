@@ -0,0 +1,131 @@
+"""Token authentication without a database query per request.
+
+DRF's TokenAuthentication looks up ``Token JOIN User`` on every request.
+CachedTokenAuthentication keeps that result for TOKEN_AUTH_CACHE_TTL
+seconds: in a per-process LRU of TOKEN_AUTH_CACHE_SIZE entries, or with
+TOKEN_AUTH_CACHE='shared' in the default cache that all workers share.
+
+Each entry remembers the user's auth version, a counter in the default
+cache (see cache.py). Saving or deleting the user, or deleting one of their
+tokens, bumps it (signals.py). A hit re-reads the version at most every
+VERSION_CHECK_SECONDS, so most hits cost no cache round trip beyond the
+entry itself, and an entry whose version moved is dropped. Other processes only see the bump through a
+shared cache, so without SHARED_CACHE both modes are off and every request
+queries: a deleted token or deactivated user would otherwise keep
+authenticating on other workers for the whole TTL. Bulk
+``queryset.update()`` calls skip the signals; the TTL bounds how long such
+a change goes unnoticed. Hits and misses are counted in /metrics as
+``rentals_token_auth_cache_total``.
+"""
+import copy
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import get_version, user_auth_version_key
+from .metrics import get_store as get_metrics_store
+
+# Longest a change to a user or their token can go unseen by a cached entry.
+VERSION_CHECK_SECONDS = 5
+
+
+class TokenLRU:
+    """Bounded, thread-safe map whose entries expire ``ttl`` seconds after insertion."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local = None
+_local_lock = threading.Lock()
+
+
+def get_local_cache():
+    global _local
+    if _local is None:
+        with _local_lock:
+            if _local is None:
+                _local = TokenLRU(settings.TOKEN_AUTH_CACHE_SIZE, settings.TOKEN_AUTH_CACHE_TTL)
+    return _local
+
+
+def _shared_key(key):
+    # Raw tokens stay out of cache keys (and out of a shared cache's key listing).
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        mode = settings.TOKEN_AUTH_CACHE
+        if mode not in ('local', 'shared') or not settings.SHARED_CACHE:
+            return super().authenticate_credentials(key)
+
+        entry = cache.get(_shared_key(key)) if mode == 'shared' else get_local_cache().get(key)
+        now = time.time()
+        # Re-storing a checked entry keeps its original expiry.
+        if entry is not None and now - entry[3] < settings.TOKEN_AUTH_CACHE_TTL:
+            user, created, version, cached_at, checked = entry
+            fresh = now - checked < VERSION_CHECK_SECONDS
+            if not fresh and version == get_version(user_auth_version_key(user.pk)):
+                self._store(mode, key, (user, created, version, cached_at, now))
+                fresh = True
+            if fresh:
+                self._count('hit')
+                # Views may modify request.user; never hand out the cached instance.
+                user = copy.copy(user)
+                return user, self.get_model()(key=key, user=user, created=created)
+        self._count('miss')
+
+        user, token = super().authenticate_credentials(key)
+        # A change that commits between the query and this read is only
+        # noticed when the entry expires.
+        version = get_version(user_auth_version_key(user.pk))
+        self._store(mode, key, (copy.copy(user), token.created, version, now, now))
+        return user, token
+
+    def _store(self, mode, key, entry):
+        """Cache ``(user, created, version, cached_at, checked_at)`` for the rest of its TTL."""
+        if mode == 'shared':
+            ttl = settings.TOKEN_AUTH_CACHE_TTL - (time.time() - entry[3])
+            cache.set(_shared_key(key), entry, max(1, math.ceil(ttl)))
+        else:
+            get_local_cache().set(key, entry)
+
+    def _count(self, result):
+        get_metrics_store().inc('rentals_token_auth_cache_total', {'result': result})
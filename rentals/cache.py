@@ -0,0 +1,202 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from .models import Booking
+from .utils import blocking_q, overlap_q
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_STATS_KEYS = {'hit': 'catalog:hits', 'miss': 'catalog:misses'}
+
+# Query params that never change the payload.
+IGNORED_PARAMS = {'format'}
+# Availability filters depend on bookings, which do not bump the catalog
+# version, so those responses are never cached.
+UNCACHED_PARAMS = {'start_date', 'end_date'}
+
+
+def _incr(key, delta=1):
+    # cache.incr raises ValueError on a missing key; add() is a no-op if a
+    # concurrent worker created it first.
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, None)
+        return delta
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a cache that lost the counter never reuses a
+        # version that older entries were stored under.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """Move a version forward; it doubles as the nanosecond time of the last change."""
+    version = max((cache.get(key) or 0) + 1, time.time_ns())
+    cache.set(key, version, None)
+    return version
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    return bump_version(CATALOG_VERSION_KEY)
+
+
+def user_auth_version_key(user_id):
+    return f'auth:{user_id}:version'
+
+
+def _nanoseconds(moment):
+    return int(moment.timestamp()) * 10**9 + moment.microsecond * 1000 if moment else 0
+
+
+# Bookings change in the worker and scheduler processes too, so their
+# validators are read from the database rather than from version counters,
+# which a process-local cache would never share. The count catches deletes
+# and archiving, which leave no newer updated_at behind.
+
+def user_bookings_state(user_id):
+    """``(tag, version)`` for a user's bookings, from one index-only aggregate."""
+    state = Booking.objects.filter(user_id=user_id).aggregate(changed=Max('updated_at'), count=Count('id'))
+    return f'bookings-{user_id}-{state["count"]}', _nanoseconds(state['changed'])
+
+
+def vehicle_calendar_state(vehicle_id, first, last, now=None):
+    """What a vehicle's calendar between ``first`` and ``last`` depends on.
+
+    Returns ``(tag, version, next_expiry)``. ``tag`` and ``version`` change
+    whenever a booking in the range is saved or deleted, or a hold in it
+    expires (which changes the blocking count); ``next_expiry`` is when the
+    first of the range's live holds lapses, or None.
+    """
+    now = now or timezone.now()
+    state = Booking.objects.filter(vehicle_id=vehicle_id).filter(overlap_q(first, last)).aggregate(
+        changed=Max('updated_at'), count=Count('id'), blocking=Count('id', filter=blocking_q(now)),
+        next_expiry=Min('hold_expires_at', filter=Q(status='pending', hold_expires_at__gt=now)),
+    )
+    tag = f'calendar-{vehicle_id}-{first:%Y-%m}-{state["count"]}-{state["blocking"]}'
+    return tag, _nanoseconds(state['changed']), state['next_expiry']
+
+
+def catalog_cache_key(request):
+    params = sorted(
+        (k, v) for k, values in request.query_params.lists() if k not in IGNORED_PARAMS for v in values
+    )
+    raw = f'{request.get_host()}{request.path}?{urlencode(params)}'
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f'catalog:{get_catalog_version()}:{digest}'
+
+
+def record_lookup(outcome):
+    _incr(CATALOG_STATS_KEYS[outcome])
+
+
+def catalog_cache_stats():
+    hits = cache.get(CATALOG_STATS_KEYS['hit']) or 0
+    misses = cache.get(CATALOG_STATS_KEYS['miss']) or 0
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else 0.0}
+
+
+class CatalogCacheMixin:
+    """Serve GETs from the cache under the current catalog version.
+
+    Entries are never deleted explicitly: saving or deleting a Vehicle or
+    VehicleImage bumps the version (see signals.py), which orphans every key
+    built from the old one until it expires. Without SHARED_CACHE a bump
+    would reach only the process that made it, so nothing is cached.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not settings.SHARED_CACHE or UNCACHED_PARAMS.intersection(request.query_params):
+            return super().get(request, *args, **kwargs)
+
+        key = catalog_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            record_lookup('hit')
+            return Response(data)
+
+        record_lookup('miss')
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+        return response
+
+
+class ConditionalGetMixin:
+    """Answer If-None-Match / If-Modified-Since from get_validators().
+
+    Validators are a version counter or a single aggregate query, so a 304
+    is returned before any queryset or serializer runs. Returning ``None``
+    from get_validators() opts a request out.
+    """
+    private_cache = False
+
+    def get_validators(self, request):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators(request)
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+
+        tag, version = validators
+        etag = quote_etag(f'{tag}-{version}')
+        last_modified = version // 10**9
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Let browsers store the payload but revalidate on every use.
+        if self.private_cache:
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Authorization'])
+        else:
+            patch_cache_control(response, no_cache=True)
+        return response
+
+
+class CatalogConditionalMixin(ConditionalGetMixin):
+    """Validators from the catalog version; none without SHARED_CACHE, where
+    a process would keep answering 304 after another one changed the catalog."""
+
+    def get_validators(self, request):
+        if not settings.SHARED_CACHE or UNCACHED_PARAMS.intersection(request.query_params):
+            return None
+        return 'catalog', get_catalog_version()
+
+
+class UserBookingsConditionalMixin(ConditionalGetMixin):
+    """Validators for a user's bookings, which also embed vehicle data.
+
+    The vehicle part comes from the catalog version, so like the catalog
+    these need SHARED_CACHE.
+    """
+    private_cache = True
+
+    def get_validators(self, request):
+        if not settings.SHARED_CACHE:
+            return None
+        tag, version = user_bookings_state(request.user.pk)
+        return tag, max(version, get_catalog_version())
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if settings.SHARED_CACHE:
+        return []
+    return [Warning(
+        'The default cache is not shared between processes.',
+        hint='Vehicle lists and details are not cached and, like booking lists, carry no ETag; token '
+             'and username lookups query the database every time. Set CACHE_URL to a shared cache, '
+             'e.g. dbcache://rentals_cache.',
+        id='rentals.W001',
+    )]
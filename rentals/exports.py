@@ -0,0 +1,38 @@
+"""Constant-memory booking exports shared by the admin action and export_bookings."""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+BOOKING_EXPORT_FIELDS = ['id', 'vehicle', 'user', 'start_date', 'end_date', 'total_price', 'status']
+
+# Columns fetched per booking; vehicle and user are rendered as their __str__.
+_COLUMNS = (
+    'id', 'vehicle__title', 'vehicle__type', 'user__username', 'start_date', 'end_date', 'total_price', 'status',
+)
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def iter_booking_rows(queryset, chunk_size=2000):
+    """Yield one list per booking in BOOKING_EXPORT_FIELDS order, from a single streamed query."""
+    rows = queryset.order_by('id').values_list(*_COLUMNS).iterator(chunk_size=chunk_size)
+    for pk, title, vtype, username, start, end, total, status in rows:
+        yield [pk, f'{title} ({vtype})', username, start, end, total, status]
+
+
+def iter_csv(queryset, chunk_size=2000):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(BOOKING_EXPORT_FIELDS)
+    for row in iter_booking_rows(queryset, chunk_size):
+        yield writer.writerow(row)
+
+
+def iter_jsonl(queryset, chunk_size=2000):
+    for row in iter_booking_rows(queryset, chunk_size):
+        yield json.dumps(dict(zip(BOOKING_EXPORT_FIELDS, row)), cls=DjangoJSONEncoder) + '\n'
@@ -0,0 +1,215 @@
+"""Read-only serializers that render ``.values()`` rows without DRF field objects.
+
+Each class compiles the field list of a DRF ModelSerializer once and then
+turns plain row dicts into the exact payload that serializer would produce,
+so list/detail endpoints skip per-instance ``to_representation`` calls and
+model instantiation. Output must stay byte-identical to the DRF serializers
+(see FastSerializerTests); a field type without a known conversion is
+rejected when the class is compiled rather than rendered differently.
+"""
+from collections import defaultdict
+
+from django.core.exceptions import ImproperlyConfigured
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .images import srcset, variant_urls
+from .models import VehicleImage
+from .serializers import (
+    BookingSerializer, DashboardBookingSerializer, PaymentStatusSerializer, VehicleImageSerializer, VehicleSerializer,
+)
+
+# DRF fields whose representation of a database value is the value itself.
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.IntegerField,
+)
+
+
+def _decimal_converter(field):
+    exponent = -field.decimal_places
+
+    def convert(value):
+        # Database values normally arrive already quantized to the column's
+        # scale; anything else takes DRF's own (slower) rounding path.
+        if value.as_tuple().exponent == exponent:
+            return '{:f}'.format(value)
+        return field.to_representation(value)
+    return convert
+
+
+def _datetime(value):
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _date(value):
+    return value.isoformat()
+
+
+def _compile_field(name, field):
+    """Return the ``.values()`` column and converter that reproduce ``field``."""
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        return f'{name}_id', None
+    if isinstance(field, serializers.DecimalField):
+        if not api_settings.COERCE_DECIMAL_TO_STRING or field.localize:
+            raise ImproperlyConfigured(f'Unsupported decimal options on {name!r}')
+        return name, _decimal_converter(field)
+    if isinstance(field, serializers.DateTimeField):
+        return name, _datetime
+    if isinstance(field, serializers.DateField):
+        return name, _date
+    if isinstance(field, PASSTHROUGH_FIELDS):
+        return name, None
+    raise ImproperlyConfigured(f'No fast conversion for {type(field).__name__} {name!r}')
+
+
+class ValuesSerializer:
+    serializer_class = None
+    # Declared fields filled in by the subclass rather than read from a column.
+    nested_fields = ()
+
+    def __init__(self, prefix=''):
+        self.plan = []
+        for name, field in self.serializer_class().fields.items():
+            if name in self.nested_fields:
+                self.plan.append((name, None, None))
+                continue
+            column, convert = _compile_field(name, field)
+            self.plan.append((name, prefix + column, convert))
+
+    @property
+    def columns(self):
+        return [column for _, column, _ in self.plan if column is not None]
+
+    def rows(self, queryset):
+        return queryset.prefetch_related(None).values(*self.columns)
+
+    def render(self, row, nested):
+        out = {}
+        for key, column, convert in self.plan:
+            if column is None:
+                out[key] = nested[key]
+                continue
+            value = row[column]
+            if value is not None and convert is not None:
+                value = convert(value)
+            out[key] = value
+        return out
+
+
+class VehicleImageValuesSerializer(ValuesSerializer):
+    serializer_class = VehicleImageSerializer
+    nested_fields = ('image', 'variants', 'srcset')
+
+    def for_vehicles(self, vehicle_ids, request=None):
+        """Rendered images per vehicle id, fetched in one query."""
+        storage = VehicleImage._meta.get_field('image').storage
+
+        def absolute(name):
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+
+        images = defaultdict(list)
+        queryset = VehicleImage.objects.filter(vehicle_id__in=vehicle_ids).order_by('pk')
+        for row in queryset.values('vehicle_id', 'image', 'variants', 'variants_source', *self.columns):
+            variants = variant_urls(row['image'], row['variants'], row['variants_source'], absolute)
+            nested = {
+                'image': absolute(row['image']) if row['image'] else None,
+                'variants': variants,
+                'srcset': srcset(variants),
+            }
+            images[row['vehicle_id']].append(self.render(row, nested))
+        return images
+
+
+class VehicleValuesSerializer(ValuesSerializer):
+    """Fast equivalent of VehicleSerializer."""
+    serializer_class = VehicleSerializer
+    nested_fields = ('images',)
+
+    def __init__(self, prefix=''):
+        super().__init__(prefix)
+        self.id_column = prefix + 'id'
+        self.images = VehicleImageValuesSerializer()
+
+    def serialize(self, rows, request=None):
+        images = self.images.for_vehicles({row[self.id_column] for row in rows}, request)
+        return [self.render(row, {'images': images.get(row[self.id_column], [])}) for row in rows]
+
+
+class BookingValuesSerializer(ValuesSerializer):
+    """Fast equivalent of BookingSerializer; vehicle columns come from the same query."""
+    serializer_class = BookingSerializer
+    nested_fields = ('vehicle',)
+
+    def __init__(self):
+        super().__init__()
+        self.vehicle = VehicleValuesSerializer(prefix='vehicle__')
+
+    @property
+    def columns(self):
+        return super().columns + self.vehicle.columns
+
+    def serialize(self, rows, request=None):
+        vehicles = self.vehicle.serialize(rows, request)
+        return [self.render(row, {'vehicle': vehicle}) for row, vehicle in zip(rows, vehicles)]
+
+
+class PaymentValuesSerializer(ValuesSerializer):
+    serializer_class = PaymentStatusSerializer
+
+
+class DashboardBookingValuesSerializer(BookingValuesSerializer):
+    """Fast equivalent of DashboardBookingSerializer; the payment is LEFT JOINed into the same query."""
+    serializer_class = DashboardBookingSerializer
+    nested_fields = ('vehicle', 'payment')
+
+    def __init__(self):
+        super().__init__()
+        self.payment = PaymentValuesSerializer(prefix='payment__')
+
+    @property
+    def columns(self):
+        # payment__id tells a booking without a Payment row apart from an unpaid one.
+        return super().columns + self.payment.columns + ['payment__id']
+
+    def serialize(self, rows, request=None):
+        vehicles = self.vehicle.serialize(rows, request)
+        return [
+            self.render(row, {
+                'vehicle': vehicle,
+                'payment': None if row['payment__id'] is None else self.payment.render(row, {}),
+            })
+            for row, vehicle in zip(rows, vehicles)
+        ]
+
+
+vehicle_values_serializer = VehicleValuesSerializer()
+booking_values_serializer = BookingValuesSerializer()
+dashboard_booking_values_serializer = DashboardBookingValuesSerializer()
+
+
+class FastReadMixin:
+    """Serve list/retrieve from ``values_serializer`` instead of ``serializer_class``."""
+    values_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        rows = self.values_serializer.rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(self.values_serializer.serialize(list(rows), request))
+        return self.get_paginated_response(self.values_serializer.serialize(page, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        rows = self.values_serializer.rows(self.filter_queryset(self.get_queryset()))
+        row = get_object_or_404(rows, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return Response(self.values_serializer.serialize([row], request)[0])
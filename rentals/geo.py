@@ -0,0 +1,152 @@
+"""Geohash cells for proximity search without a spatial database.
+
+Every vehicle with coordinates stores its geohash (``Vehicle.geohash``). A
+geohash prefix is a lat/lng rectangle and all points inside it sort next to
+each other, so an area is covered by a handful of geohash cells, adjacent
+cells merge into contiguous ranges, and each range is one ordinary B-tree
+range scan. The cover is a superset of the area; callers refine the
+candidates with the exact distance (or box test) in Python.
+"""
+import math
+
+from django.db.models import FloatField, Q
+from django.db.models.functions import Cast
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# ~4.8 m cells: finer than any search needs, coarse enough to stay short.
+GEOHASH_PRECISION = 9
+# Upper bound on cells per cover; more, smaller cells mean fewer false candidates.
+MAX_COVER_CELLS = 16
+# Most cover rows one search reads; a wider area returns matches among these only.
+MAX_CANDIDATES = 5000
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+
+def encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(lat degrees, lng degrees) spanned by a cell of ``precision`` chars."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def _index_span(low, high, origin, step):
+    return int((low - origin) // step), int((high - origin) // step)
+
+
+def cover(min_lat, min_lng, max_lat, max_lng):
+    """Geohash cells, at the finest precision that needs at most
+    MAX_COVER_CELLS of them, whose union contains the box."""
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0 - 1e-9)
+    min_lng, max_lng = max(min_lng, -180.0), min(max_lng, 180.0 - 1e-9)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lng_step = cell_size(precision)
+        lat_lo, lat_hi = _index_span(min_lat, max_lat, -90.0, lat_step)
+        lng_lo, lng_hi = _index_span(min_lng, max_lng, -180.0, lng_step)
+        if (lat_hi - lat_lo + 1) * (lng_hi - lng_lo + 1) <= MAX_COVER_CELLS or precision == 1:
+            break
+    return sorted({
+        encode(-90.0 + (i + 0.5) * lat_step, -180.0 + (j + 0.5) * lng_step, precision)
+        for i in range(lat_lo, lat_hi + 1)
+        for j in range(lng_lo, lng_hi + 1)
+    })
+
+
+def _cell_number(cell):
+    number = 0
+    for char in cell:
+        number = number * 32 + BASE32.index(char)
+    return number
+
+
+def cell_ranges(cells):
+    """Merge sorted same-length cells into ``(first, last)`` runs of consecutive cells."""
+    ranges = []
+    for cell in cells:
+        if ranges and _cell_number(cell) == _cell_number(ranges[-1][1]) + 1:
+            ranges[-1] = (ranges[-1][0], cell)
+        else:
+            ranges.append((cell, cell))
+    return ranges
+
+
+def cover_q(min_lat, min_lng, max_lat, max_lng, field='geohash'):
+    """Q matching rows whose geohash falls in the box's cover, as index range scans."""
+    q = Q()
+    for first, last in cell_ranges(cover(min_lat, min_lng, max_lat, max_lng)):
+        # '{' sorts after every geohash character, so this ends after all of last's children.
+        q |= Q(**{f'{field}__gte': first, f'{field}__lt': last + '{'})
+    return q
+
+
+def radius_box(lat, lng, radius_km):
+    """(min_lat, min_lng, max_lat, max_lng) enclosing the circle."""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(lat))
+    dlng = 180.0 if cos_lat < 1e-6 else min(180.0, radius_km / (KM_PER_DEGREE_LAT * cos_lat))
+    return lat - dlat, lng - dlng, lat + dlat, lng + dlng
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def nearby(queryset, center=None, radius_km=None, box=None):
+    """``[(pk, distance_km)]`` for rows within ``radius_km`` of ``center`` and/or
+    inside ``box`` (min_lat, min_lng, max_lat, max_lng), in queryset order.
+
+    The database narrows to the geohash cover, at most MAX_CANDIDATES rows
+    of it; the exact test runs here.
+    ``distance_km`` is None without a center. The queryset's ordering is
+    applied in Python too: left in SQL, an ORDER BY that matches another
+    index (e.g. created_at) makes SQLite walk that whole index instead of
+    the geohash ranges.
+    """
+    boxes = [b for b in (radius_box(*center, radius_km) if center else None, box) if b]
+    min_lat, min_lng = max(b[0] for b in boxes), max(b[1] for b in boxes)
+    max_lat, max_lng = min(b[2] for b in boxes), min(b[3] for b in boxes)
+    if min_lat > max_lat or min_lng > max_lng:
+        return []
+    ordering = list(queryset.query.order_by)
+    sort_fields = [field.lstrip('-') for field in ordering]
+    rows = queryset.prefetch_related(None).filter(cover_q(min_lat, min_lng, max_lat, max_lng)).order_by()
+    matches = []
+    # Casting skips the per-row Decimal conversion of the coordinate columns.
+    coordinates = (Cast('latitude', FloatField()), Cast('longitude', FloatField()))
+    for pk, lat, lng, *sort_values in rows.values_list('pk', *coordinates, *sort_fields)[:MAX_CANDIDATES]:
+        if box and not (box[0] <= lat <= box[2] and box[1] <= lng <= box[3]):
+            continue
+        distance = None
+        if center:
+            distance = distance_km(center[0], center[1], lat, lng)
+            if distance > radius_km:
+                continue
+        matches.append((pk, distance, sort_values))
+    # Stable sorts from the last key to the first give a multi-key order with per-key direction.
+    for index in reversed(range(len(ordering))):
+        matches.sort(key=lambda match: match[2][index], reverse=ordering[index].startswith('-'))
+    return [(pk, distance) for pk, distance, _ in matches]
@@ -0,0 +1,100 @@
+"""Expiry of pending bookings.
+
+reserve_vehicle gives each pending booking a ``hold_expires_at`` deadline
+(BOOKING_HOLD_MINUTES). Availability checks stop counting a hold as soon as
+it passes (utils.blocking_q); the expire_bookings command then marks
+expired holds ``cancelled`` and confirmed bookings whose end date has passed
+``completed``. It works in short batches of single UPDATEs, each committed
+on its own, so it never holds locks on more than a batch of rows.
+
+Starting checkout extends a hold that would run out before a Stripe session
+can (sessions last at least 30 minutes), and the session is told to expire
+PAYMENT_GRACE before the hold, so a completed payment normally arrives
+while the dates are still held.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Booking
+from .vehicle_stats import add_completed, completed_per_vehicle
+
+# Stripe's shortest Checkout session, plus a minute for clock differences.
+MIN_CHECKOUT_HOLD = timedelta(minutes=31)
+PAYMENT_GRACE = timedelta(minutes=5)
+# How long a hold is extended to when checkout starts close to its deadline.
+CHECKOUT_HOLD = timedelta(minutes=40)
+
+
+class HoldExpired(Exception):
+    pass
+
+
+def hold_for_checkout(booking, now=None):
+    """Deadline the booking is held until while paying; None if it has none.
+
+    Extends a hold with less than MIN_CHECKOUT_HOLD + PAYMENT_GRACE left.
+    The extension is a conditional UPDATE, so concurrent checkouts of one
+    booking settle on the same deadline. Raises HoldExpired if the booking
+    no longer holds its dates.
+    """
+    now = now or timezone.now()
+    if booking.status == 'cancelled':
+        raise HoldExpired('This booking was cancelled or its hold expired.')
+    if booking.status != 'pending' or booking.hold_expires_at is None:
+        return None
+    if booking.hold_expires_at <= now:
+        raise HoldExpired('This booking was cancelled or its hold expired.')
+    if booking.hold_expires_at < now + MIN_CHECKOUT_HOLD + PAYMENT_GRACE:
+        Booking.objects.filter(
+            pk=booking.pk, status='pending', hold_expires_at__lt=now + MIN_CHECKOUT_HOLD + PAYMENT_GRACE,
+        ).update(hold_expires_at=now + CHECKOUT_HOLD, updated_at=now)
+        current = Booking.objects.filter(pk=booking.pk).values('status', 'hold_expires_at').first()
+        if current is None or current['status'] != 'pending':
+            raise HoldExpired('This booking was cancelled or its hold expired.')
+        booking.hold_expires_at = current['hold_expires_at']
+    return booking.hold_expires_at
+
+
+def _update_in_chunks(queryset, batch_size, after=None, **changes):
+    """Apply ``changes`` to ``queryset`` ``batch_size`` rows per UPDATE; returns the row count.
+
+    The queryset's filter is repeated in each UPDATE, so a row another
+    request changed in between is left alone, and updated rows drop out of
+    the next batch. ``after(ids)`` runs in the same transaction as each
+    UPDATE, with the ids of the rows it changed.
+    """
+    total = 0
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return total
+        # update() skips auto_now, which the booking lists' and calendars' validators read.
+        changes['updated_at'] = timezone.now()
+        if after is None:
+            total += queryset.filter(pk__in=ids).update(**changes)
+        else:
+            with transaction.atomic():
+                # Lock the rows first so the UPDATE changes exactly these.
+                locked = list(queryset.filter(pk__in=ids).select_for_update().values_list('pk', flat=True))
+                total += queryset.filter(pk__in=locked).update(**changes)
+                after(locked)
+        if len(ids) < batch_size:
+            return total
+
+
+def expire_holds(batch_size=500, now=None):
+    """Cancel pending bookings whose hold has passed; returns how many."""
+    expired = Booking.objects.filter(status='pending', hold_expires_at__lte=now or timezone.now())
+    return _update_in_chunks(expired, batch_size, status='cancelled')
+
+
+def complete_finished(batch_size=500, today=None):
+    """Mark confirmed bookings that ended before ``today`` completed; returns how many."""
+    finished = Booking.objects.filter(status='confirmed', end_date__lt=today or timezone.localdate())
+
+    def count_completed(ids):
+        # update() skips the post_save receiver that counts completions.
+        add_completed(completed_per_vehicle(Booking.objects.filter(pk__in=ids)))
+    return _update_in_chunks(finished, batch_size, after=count_completed, status='completed')
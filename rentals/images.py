@@ -0,0 +1,168 @@
+"""Resized WebP/JPEG variants of vehicle photos.
+
+Saving a VehicleImage with a new original schedules generate_variants() on a
+small per-process thread pool once the transaction commits (signals.py), so
+the upload request never waits on Pillow. Each variant fits within a fixed
+box, is never upscaled, and is written next to the originals as
+``vehicles/variants/<image id>-<source hash>/<variant>.<ext>``. The
+finished set is stored on the row with the name of the original it was made
+from; serializers only expose variants that match the current original.
+A new set replaces the previous one's files, and deleting the image removes
+its set (signals.py).
+Images whose variants are missing (worker restarts, old uploads) are filled
+in by ``python manage.py generate_image_variants``.
+"""
+import hashlib
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .cache import bump_catalog_version
+from .models import VehicleImage
+
+logger = logging.getLogger(__name__)
+
+# (name, max width, max height); the card size matches the catalog cards.
+VARIANTS = (('thumb', 160, 100), ('card', 400, 250), ('detail', 1200, 800))
+# (key, Pillow format, save options); listed in order of preference.
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+VARIANTS_DIR = 'vehicles/variants'
+
+
+def variant_dir(image_id, source):
+    digest = hashlib.sha1(source.encode()).hexdigest()[:10]
+    return posixpath.join(VARIANTS_DIR, f'{image_id}-{digest}')
+
+
+def render_variants(original):
+    """``{variant: (width, height, {format: bytes})}`` for an open image file."""
+    with Image.open(original) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        rendered = {}
+        for name, max_width, max_height in VARIANTS:
+            resized = img.copy()
+            resized.thumbnail((max_width, max_height), Image.LANCZOS)
+            encoded = {}
+            for key, pil_format, options in FORMATS:
+                frame = resized
+                if pil_format == 'JPEG' and frame.mode != 'RGB':
+                    # JPEG has no alpha; flatten onto white like the page background.
+                    frame = Image.new('RGB', resized.size, (255, 255, 255))
+                    frame.paste(resized, mask=resized.getchannel('A'))
+                out = BytesIO()
+                frame.save(out, pil_format, **options)
+                encoded[key] = out.getvalue()
+            rendered[name] = (resized.width, resized.height, encoded)
+        return rendered
+
+
+def variant_paths(variants):
+    """Storage names of every file in a stored ``variants`` set."""
+    return {entry[key] for entry in variants.values() for key, _, _ in FORMATS if key in entry}
+
+
+def delete_variants(storage, paths):
+    for path in paths:
+        try:
+            storage.delete(path)
+        except OSError:
+            logger.exception('Deleting image variant %s failed', path)
+
+
+def generate_variants(image_id, force=False):
+    """Render and store the variants of one VehicleImage; returns True if it did."""
+    image = VehicleImage.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return False
+    source = image.image.name
+    if image.variants_source == source and image.variants and not force:
+        return False
+    storage = image.image.storage
+    with storage.open(source, 'rb') as original:
+        rendered = render_variants(original)
+    directory = variant_dir(image.pk, source)
+    variants = {}
+    for name, (width, height, encoded) in rendered.items():
+        entry = {'width': width, 'height': height}
+        for key, data in encoded.items():
+            path = posixpath.join(directory, f'{name}.{key}')
+            # Fixed names, so a rerun replaces rather than adding suffixed copies.
+            if storage.exists(path):
+                storage.delete(path)
+            entry[key] = storage.save(path, ContentFile(data))
+        variants[name] = entry
+    # Skip the write if the original was replaced meanwhile; its own job follows.
+    updated = VehicleImage.objects.filter(pk=image.pk, image=source).update(variants=variants, variants_source=source)
+    written = variant_paths(variants)
+    if updated:
+        # update() skips the signals that invalidate cached catalog payloads.
+        bump_catalog_version()
+        delete_variants(storage, variant_paths(image.variants) - written)
+    else:
+        delete_variants(storage, written)
+    return bool(updated)
+
+
+def variant_urls(image_name, variants, variants_source, url):
+    """Serialized ``variants`` of an image; empty until they match its current file."""
+    if not image_name or variants_source != image_name or not variants:
+        return {}
+    out = {}
+    for name, _, _ in VARIANTS:
+        entry = variants.get(name)
+        if entry is None:
+            continue
+        out[name] = {'width': entry['width'], 'height': entry['height']}
+        for key, _, _ in FORMATS:
+            out[name][key] = url(entry[key])
+    return out
+
+
+def srcset(urls):
+    """``{format: "url 160w, url 400w, ..."}`` for serialized variants."""
+    return {
+        key: ', '.join(f'{entry[key]} {entry["width"]}w' for entry in urls.values())
+        for key, _, _ in FORMATS
+    } if urls else {}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix='image-variants')
+    return _pool
+
+
+def _run(image_id):
+    try:
+        generate_variants(image_id)
+    except Exception:
+        logger.exception('Generating variants for VehicleImage %s failed', image_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(image_id):
+    """Generate variants in the background once the current transaction commits."""
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(lambda: get_pool().submit(_run, image_id))
+    else:
+        transaction.on_commit(lambda: _run(image_id))
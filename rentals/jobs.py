@@ -0,0 +1,86 @@
+"""Background jobs run on a thread of the web process.
+
+A Procfile deploy runs the webhook worker, the hold scheduler and the
+rollup refresh as their own processes. A deploy with only a web service
+(render.yaml) sets IN_PROCESS_JOBS instead: config/wsgi.py and
+config/asgi.py then call start(), and a daemon thread runs each job every
+``interval`` seconds. A pass first takes a lease in the cache, so when
+several web processes share it only one of them runs each pass.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .holds import complete_finished, expire_holds
+from .rollups import refresh as refresh_rollups
+from .webhooks import process_batch
+
+logger = logging.getLogger(__name__)
+
+# Longest a pass may run before another process can take its lease.
+LEASE_SECONDS = 600
+# How often the thread looks for due jobs.
+TICK_SECONDS = 1.0
+
+
+def apply_webhooks():
+    while process_batch():
+        pass
+
+
+def expire_bookings():
+    expire_holds(500)
+    complete_finished(500)
+
+
+# (name, interval in seconds, job); the intervals match the Procfile processes.
+JOBS = (
+    ('webhooks', 2.0, apply_webhooks),
+    ('holds', 60.0, expire_bookings),
+    ('rollups', 300.0, refresh_rollups),
+)
+
+
+def run_job(name, interval, job):
+    """Run one pass unless another process holds its lease; returns True if it ran."""
+    key = f'jobs:{name}'
+    owner = f'{os.getpid()}-{threading.get_ident()}'
+    if not cache.add(key, owner, LEASE_SECONDS):
+        return False
+    try:
+        job()
+    except Exception:
+        logger.exception('Background job %s failed', name)
+    finally:
+        close_old_connections()
+        # Held until the next pass is due, whichever process takes it then.
+        cache.set(key, owner, interval)
+    return True
+
+
+def _loop():
+    due = {name: 0.0 for name, _, _ in JOBS}
+    while True:
+        for name, interval, job in JOBS:
+            if time.monotonic() >= due[name]:
+                due[name] = time.monotonic() + interval
+                run_job(name, interval, job)
+        time.sleep(TICK_SECONDS)
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start():
+    """Start the job thread once per process."""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_loop, name='rentals-jobs', daemon=True).start()
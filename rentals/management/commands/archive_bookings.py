@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rentals.archive import archive_bookings
+
+
+class Command(BaseCommand):
+    help = 'Move cancelled and completed bookings that ended long ago, with their payments and reviews, to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=settings.ARCHIVE_AFTER_MONTHS,
+                            help='Archive bookings that ended more than this many months ago')
+        parser.add_argument('--batch-size', type=int, default=500, help='Bookings moved per transaction')
+
+    def handle(self, *args, **options):
+        bookings, payments, reviews = archive_bookings(options['months'], options['batch_size'])
+        self.stdout.write(f'archived {bookings} bookings, {payments} payments and {reviews} reviews')
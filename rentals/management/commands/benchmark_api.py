@@ -0,0 +1,294 @@
+import json
+import math
+import platform
+import random
+import subprocess
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from rentals.cache import bump_catalog_version
+from rentals.models import Booking, Vehicle
+
+BENCH_USERNAME = 'bench-user'
+BENCH_PASSWORD = 'bench-password'
+
+SCENARIOS = [
+    'vehicle_list', 'vehicle_list_filtered', 'vehicle_list_available', 'vehicle_list_cursor', 'vehicle_detail',
+    'token_auth', 'booking_create', 'my_bookings', 'booking_cancel',
+]
+CATALOG_SCENARIOS = {'vehicle_list', 'vehicle_list_filtered', 'vehicle_list_cursor', 'vehicle_detail'}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    # pct * n first: 0.07 * 100 is 7.000000000000001, which would round up a rank.
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct * len(sorted_values) / 100) - 1))
+    return sorted_values[rank]
+
+
+def bench_token():
+    """Token of the benchmark user, created on first use."""
+    User = get_user_model()
+    user, created = User.objects.get_or_create(username=BENCH_USERNAME)
+    if created or not user.check_password(BENCH_PASSWORD):
+        user.set_password(BENCH_PASSWORD)
+        user.save()
+    return Token.objects.get_or_create(user=user)[0].key
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class WSGITransport:
+    """Calls the project's WSGI application in-process, counting DB queries."""
+
+    def __init__(self):
+        from config.wsgi import application
+        self.app = application
+        hosts = [h for h in settings.ALLOWED_HOSTS if h not in ('*', '')]
+        self.host = hosts[0].lstrip('.') if hosts else 'localhost'
+
+    def request(self, method, path, query='', body=None, token=None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        environ = {
+            'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query, 'HTTP_HOST': self.host,
+            'wsgi.input': BytesIO(payload), 'CONTENT_LENGTH': str(len(payload)), 'CONTENT_TYPE': 'application/json',
+            'HTTP_ACCEPT': 'application/json',
+        }
+        if token:
+            environ['HTTP_AUTHORIZATION'] = f'Token {token}'
+        setup_testing_defaults(environ)
+        status = []
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            result = self.app(environ, lambda s, headers, exc_info=None: status.append(s))
+            try:
+                content = b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        return int(status[0].split()[0]), content, counter.count
+
+    def close_thread(self):
+        connection.close()
+
+
+class HTTPTransport:
+    """Sends requests to a running server (e.g. gunicorn) over keep-alive connections."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.local = threading.local()
+
+    def request(self, method, path, query='', body=None, token=None):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        headers = {'Accept': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        url = f'{self.base_url}{path}' + (f'?{query}' if query else '')
+        resp = session.request(method, url, json=body, headers=headers)
+        return resp.status_code, resp.content, None
+
+    def close_thread(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the API routes in-process through the WSGI app or against a running server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10, help='Untimed requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Run only these (repeatable)')
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--bust-cache', action='store_true', help='Bump the catalog version before catalog requests')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', '-o', help='Write the JSON report here (default: stdout)')
+        parser.add_argument('--keep', action='store_true', help='Keep bookings created by the benchmark')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1')
+        vehicle_ids = list(Vehicle.objects.filter(is_active=True).values_list('id', flat=True)[:5000])
+        if not vehicle_ids:
+            raise CommandError('No active vehicles; seed the database first (generate_load_data)')
+
+        self.token = bench_token()
+        self.vehicle_ids = vehicle_ids
+        self.bust_cache = options['bust_cache'] and not options['url']
+        self.transport = HTTPTransport(options['url']) if options['url'] else WSGITransport()
+        self.created = []
+        self.created_lock = threading.Lock()
+
+        results = {}
+        try:
+            for name in options['scenario'] or SCENARIOS:
+                results[name] = self._run(name, options)
+                self.stderr.write(self._summary(name, results[name]))
+        finally:
+            if not options['keep']:
+                Booking.objects.filter(user__username=BENCH_USERNAME).delete()
+
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'commit': git_commit(),
+                'mode': 'http' if options['url'] else 'wsgi',
+                'url': options['url'],
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'concurrency': options['concurrency'],
+                'requests_per_scenario': options['requests'],
+                'vehicles': Vehicle.objects.count(),
+                'bookings': Booking.objects.count(),
+            },
+            'scenarios': results,
+        }
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as out:
+                out.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+    def _request_for(self, name, rng):
+        """(method, path, query, body, token) for one request of a scenario."""
+        today = date.today()
+        if name == 'vehicle_list':
+            return 'GET', reverse('vehicle-list'), '', None, None
+        if name == 'vehicle_list_filtered':
+            return 'GET', reverse('vehicle-list'), 'type=bike&min_price=300&max_price=1000&city=Pune', None, None
+        if name == 'vehicle_list_available':
+            start = today + timedelta(days=rng.randrange(1, 60))
+            query = f'start_date={start}&end_date={start + timedelta(days=rng.randrange(1, 7))}'
+            return 'GET', reverse('vehicle-list'), query, None, None
+        if name == 'vehicle_list_cursor':
+            return 'GET', reverse('vehicle-list'), 'cursor=', None, None
+        if name == 'vehicle_detail':
+            return 'GET', reverse('vehicle-detail', args=[rng.choice(self.vehicle_ids)]), '', None, None
+        if name == 'token_auth':
+            body = {'username': BENCH_USERNAME, 'password': BENCH_PASSWORD}
+            return 'POST', reverse('api-token-auth'), '', body, None
+        if name == 'booking_create':
+            # Far-future dates keep most attempts clear of seeded bookings.
+            start = today + timedelta(days=rng.randrange(400, 4000))
+            body = {'vehicle': rng.choice(self.vehicle_ids), 'start_date': str(start), 'end_date': str(start + timedelta(days=2))}
+            return 'POST', reverse('booking-create'), '', body, self.token
+        if name == 'my_bookings':
+            return 'GET', reverse('booking-list'), '', None, self.token
+        if name == 'booking_cancel':
+            with self.created_lock:
+                booking_id = self.created.pop() if self.created else 0
+            return 'POST', reverse('cancel-booking', args=[booking_id]), '', None, self.token
+        raise CommandError(f'Unknown scenario {name}')
+
+    def _run(self, name, options):
+        total = options['requests']
+        warmup = options['warmup']
+        if name == 'booking_cancel':
+            # Each cancel consumes a booking made by the booking_create scenario.
+            if not self.created:
+                raise CommandError('booking_cancel needs a successful booking_create run first')
+            warmup, total = 0, min(total, len(self.created))
+        rng = random.Random(f"{options['seed']}-{name}")
+        plan = [self._request_for(name, rng) for _ in range(warmup + total)]
+        latencies, queries, statuses, sizes = [], [], Counter(), []
+        lock = threading.Lock()
+
+        def one(index):
+            method, path, query, body, token = plan[index]
+            if self.bust_cache and name in CATALOG_SCENARIOS:
+                bump_catalog_version()
+            started = time.perf_counter()
+            status, content, query_count = self.transport.request(method, path, query, body, token)
+            elapsed = time.perf_counter() - started
+            if name == 'booking_create' and status == 201:
+                with self.created_lock:
+                    self.created.append(json.loads(content)['id'])
+            if index < warmup:
+                return
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+                sizes.append(len(content))
+                if query_count is not None:
+                    queries.append(query_count)
+
+        def worker(indexes):
+            try:
+                for index in indexes:
+                    one(index)
+            finally:
+                self.transport.close_thread()
+
+        for index in range(warmup):
+            one(index)
+        concurrency = max(1, options['concurrency'])
+        slices = [range(warmup + n, warmup + total, concurrency) for n in range(concurrency)]
+        started = time.perf_counter()
+        if concurrency == 1:
+            # Stay on this thread (and its DB connection) when not measuring contention.
+            for index in slices[0]:
+                one(index)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(worker, slices))
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests': total,
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+            'rps': round(total / wall, 2) if wall else None,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50) * 1000, 3),
+                'p95': round(percentile(latencies, 95) * 1000, 3),
+                'p99': round(percentile(latencies, 99) * 1000, 3),
+                'mean': round(sum(latencies) / len(latencies) * 1000, 3),
+            },
+            'db_queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+            'mean_response_bytes': round(sum(sizes) / len(sizes)),
+        }
+
+    def _summary(self, name, result):
+        latency = result['latency_ms']
+        queries = result['db_queries_per_request']
+        return (
+            f"{name:<24} p50 {latency['p50']:>8.2f}ms  p95 {latency['p95']:>8.2f}ms  p99 {latency['p99']:>8.2f}ms  "
+            f"{result['rps']:>8.1f} req/s  queries {queries if queries is not None else '-'}  {result['statuses']}"
+        )
+
@@ -0,0 +1,266 @@
+import asyncio
+import itertools
+import json
+import platform
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+import stripe
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from rentals.models import Booking, Vehicle
+from .benchmark_api import BENCH_USERNAME, WSGITransport, bench_token, git_commit, percentile
+
+MODES = ['sync', 'async']
+# Far enough ahead that benchmark bookings never meet real ones.
+BOOKING_OFFSET_DAYS = 20000
+
+
+class SlowStripe:
+    """Stands in for Stripe's Checkout Session API, answering after a fixed delay."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.ids = itertools.count(1)
+
+    def _session(self):
+        return SimpleNamespace(id=f'cs_bench_{next(self.ids)}', expires_at=int(time.time()) + 24 * 3600)
+
+    def create(self, **params):
+        time.sleep(self.latency)
+        return self._session()
+
+    async def create_async(self, **params):
+        await asyncio.sleep(self.latency)
+        return self._session()
+
+    @contextmanager
+    def installed(self):
+        with mock.patch.object(stripe.checkout.Session, 'create', self.create), \
+                mock.patch.object(stripe.checkout.Session, 'create_async', self.create_async):
+            yield
+
+
+class ASGITransport:
+    """Calls the project's ASGI application in-process on the running event loop."""
+
+    def __init__(self):
+        self.app = get_asgi_application()
+        hosts = [h for h in settings.ALLOWED_HOSTS if h not in ('*', '')]
+        self.host = hosts[0].lstrip('.') if hosts else 'localhost'
+
+    async def request(self, method, path, body=None, token=None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        headers = [
+            (b'host', self.host.encode()), (b'content-type', b'application/json'),
+            (b'content-length', str(len(payload)).encode()), (b'accept', b'application/json'),
+        ]
+        if token:
+            headers.append((b'authorization', f'Token {token}'.encode()))
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': headers, 'client': ('127.0.0.1', 0), 'server': (self.host, 80),
+        }
+        body_sent = False
+        status, chunks = [], []
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {'type': 'http.request', 'body': payload, 'more_body': False}
+            # The client never disconnects.
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+
+        await self.app(scope, receive, send)
+        return status[0], b''.join(chunks)
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent checkout throughput of the sync (WSGI) and async (ASGI) views against a slow simulated Stripe'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Timed checkouts per mode')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed checkouts per mode')
+        parser.add_argument('--concurrency', type=int, default=50, help='Clients sending checkouts at once')
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Requests the sync server handles at once (gunicorn workers x threads)')
+        parser.add_argument('--latency-ms', type=float, default=300, help='Simulated Stripe response time')
+        parser.add_argument('--mode', action='append', choices=MODES, help='Run only these (repeatable)')
+        parser.add_argument('--output', '-o', help='Write the JSON report here (default: stdout)')
+        parser.add_argument('--keep', action='store_true', help='Keep bookings created by the benchmark')
+
+    def handle(self, *args, **options):
+        vehicle = Vehicle.objects.filter(is_active=True).order_by('id').first()
+        if vehicle is None:
+            raise CommandError('No active vehicles; seed the database first (generate_load_data)')
+        self.token = bench_token()
+        self.user_id = Token.objects.get(key=self.token).user_id
+        self.vehicle = vehicle
+        self.path = reverse('create-checkout')
+        self.offset = 0
+        stripe_stub = SlowStripe(options['latency_ms'] / 1000)
+
+        results = {}
+        try:
+            with stripe_stub.installed():
+                for mode in options['mode'] or MODES:
+                    results[mode] = self._run(mode, options)
+                    self.stderr.write(self._summary(mode, results[mode]))
+        finally:
+            if not options['keep']:
+                Booking.objects.filter(user__username=BENCH_USERNAME).delete()
+
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'commit': git_commit(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'concurrency': options['concurrency'],
+                'sync_threads': options['threads'],
+                'stripe_latency_ms': options['latency_ms'],
+                'requests_per_mode': options['requests'],
+            },
+            'modes': results,
+        }
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as out:
+                out.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+    def _bookings(self, count):
+        """Fresh bookings, so every checkout misses the stored session and calls Stripe."""
+        start = date.today() + timedelta(days=BOOKING_OFFSET_DAYS + self.offset)
+        self.offset += 2 * count
+        price = self.vehicle.price_per_day
+        created = Booking.objects.bulk_create(
+            Booking(user_id=self.user_id, vehicle=self.vehicle, total_price=price,
+                    start_date=start + timedelta(days=2 * i), end_date=start + timedelta(days=2 * i))
+            for i in range(count)
+        )
+        return [booking.id for booking in created]
+
+    def _run(self, mode, options):
+        warmup, total = options['warmup'], options['requests']
+        booking_ids = self._bookings(warmup + total)
+        concurrency = max(1, options['concurrency'])
+        # Each client takes every concurrency-th booking, as in benchmark_api.
+        slices = [booking_ids[warmup + n::concurrency] for n in range(concurrency)]
+        latencies, statuses = [], Counter()
+        if mode == 'sync':
+            with override_settings(ROOT_URLCONF='config.urls'):
+                wall = self._run_sync(booking_ids[:warmup], slices, max(1, options['threads']), latencies, statuses)
+        else:
+            with override_settings(ROOT_URLCONF='config.urls_async'):
+                # async_to_sync keeps the async ORM's thread-sensitive work on
+                # this thread (and its DB connection), like the test client.
+                wall = async_to_sync(self._run_async)(booking_ids[:warmup], slices, latencies, statuses)
+
+        latencies.sort()
+        return {
+            'requests': total,
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+            'rps': round(total / wall, 2) if wall else None,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50) * 1000, 3),
+                'p95': round(percentile(latencies, 95) * 1000, 3),
+                'p99': round(percentile(latencies, 99) * 1000, 3),
+                'mean': round(sum(latencies) / len(latencies) * 1000, 3),
+            },
+        }
+
+    def _run_sync(self, warmup_ids, slices, threads, latencies, statuses):
+        transport = WSGITransport()
+        lock = threading.Lock()
+
+        def checkout(booking_id):
+            return transport.request('POST', self.path, body={'booking_id': booking_id}, token=self.token)[0]
+
+        def record(status, started):
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                statuses[status] += 1
+
+        for booking_id in warmup_ids:
+            checkout(booking_id)
+        if len(slices) == 1:
+            # Stay on this thread (and its DB connection) when not measuring contention.
+            started = time.perf_counter()
+            for booking_id in slices[0]:
+                request_started = time.perf_counter()
+                record(checkout(booking_id), request_started)
+            return time.perf_counter() - started
+
+        # The server: ``threads`` requests at a time, the rest wait in FIFO
+        # order, like connections in a sync gunicorn's accept queue.
+        with ThreadPoolExecutor(max_workers=threads) as server:
+            def client(booking_ids):
+                for booking_id in booking_ids:
+                    request_started = time.perf_counter()
+                    record(server.submit(checkout, booking_id).result(), request_started)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=len(slices)) as clients:
+                list(clients.map(client, slices))
+            wall = time.perf_counter() - started
+
+            # One close per server thread: the barrier keeps a thread from taking two.
+            barrier = threading.Barrier(threads)
+
+            def close_thread():
+                barrier.wait()
+                transport.close_thread()
+            for _ in range(threads):
+                server.submit(close_thread)
+        return wall
+
+    async def _run_async(self, warmup_ids, slices, latencies, statuses):
+        transport = ASGITransport()
+
+        async def one(booking_id, timed=True):
+            started = time.perf_counter()
+            status, _ = await transport.request('POST', self.path, body={'booking_id': booking_id}, token=self.token)
+            if timed:
+                latencies.append(time.perf_counter() - started)
+                statuses[status] += 1
+
+        async def client(booking_ids):
+            for booking_id in booking_ids:
+                await one(booking_id)
+
+        for booking_id in warmup_ids:
+            await one(booking_id, timed=False)
+        started = time.perf_counter()
+        await asyncio.gather(*(client(booking_ids) for booking_ids in slices))
+        return time.perf_counter() - started
+
+    def _summary(self, mode, result):
+        latency = result['latency_ms']
+        return (
+            f"{mode:<6} p50 {latency['p50']:>8.2f}ms  p95 {latency['p95']:>8.2f}ms  p99 {latency['p99']:>8.2f}ms  "
+            f"{result['rps']:>8.1f} req/s  {result['statuses']}"
+        )
@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from rentals.fast_serializers import vehicle_values_serializer
+from rentals.models import Vehicle, VehicleImage
+from rentals.serializers import VehicleSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare DRF and fast vehicle serialization at several page sizes (rolls back its fixtures)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per size; the best time is reported')
+
+    def handle(self, *args, **options):
+        sizes = options['sizes']
+        repeat = options['repeat']
+        request = Request(APIRequestFactory().get('/api/vehicles/', HTTP_HOST='localhost'))
+        renderer = JSONRenderer()
+
+        with transaction.atomic():
+            vehicle_ids = self._make_fixtures(max(sizes))
+
+            self.stdout.write(f"{'size':>6} {'drf ms':>10} {'fast ms':>10} {'speedup':>8}")
+            for size in sizes:
+                ids = vehicle_ids[:size]
+
+                def drf():
+                    vehicles = Vehicle.objects.for_api().filter(pk__in=ids).order_by('id')
+                    data = VehicleSerializer(vehicles, many=True, context={'request': request}).data
+                    return renderer.render(data)
+
+                def fast():
+                    rows = list(vehicle_values_serializer.rows(Vehicle.objects.filter(pk__in=ids).order_by('id')))
+                    return renderer.render(vehicle_values_serializer.serialize(rows, request))
+
+                if drf() != fast():
+                    raise CommandError(f'Fast serializer output differs from DRF at size {size}')
+                drf_time = self._best(drf, repeat)
+                fast_time = self._best(fast, repeat)
+                self.stdout.write(
+                    f'{size:>6} {drf_time * 1000:>10.2f} {fast_time * 1000:>10.2f} {drf_time / fast_time:>7.1f}x'
+                )
+
+            transaction.set_rollback(True)
+
+    def _make_fixtures(self, count):
+        vehicles = Vehicle.objects.bulk_create([
+            Vehicle(
+                type='bike' if i % 2 else 'car', title=f'Bench vehicle {i}', description='Benchmark fixture',
+                make='Make', model='Model', year=2020 + i % 5, seats=1 + i % 5, price_per_day=10 + i % 90,
+                deposit=i % 50, location_city='Pune', location_state='MH',
+            )
+            for i in range(count)
+        ])
+        VehicleImage.objects.bulk_create([
+            VehicleImage(vehicle=v, image='vehicles/images.jpeg', alt_text=f'{v.title} photo {n}')
+            for v in vehicles for n in range(2)
+        ])
+        return [v.pk for v in vehicles]
+
+    def _best(self, func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
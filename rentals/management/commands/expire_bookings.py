@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rentals.holds import complete_finished, expire_holds
+
+
+class Command(BaseCommand):
+    help = 'Cancel pending bookings whose hold expired and complete confirmed bookings that have ended'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per UPDATE')
+        parser.add_argument('--loop', action='store_true', help='Keep running instead of exiting after one pass')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds to sleep between passes with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_holds(options['batch_size'])
+            completed = complete_finished(options['batch_size'])
+            self.stdout.write(f'expired {expired} holds; completed {completed} bookings')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
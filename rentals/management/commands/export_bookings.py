@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from rentals.exports import iter_csv, iter_jsonl
+from rentals.models import Booking
+
+
+class Command(BaseCommand):
+    help = 'Stream bookings to a CSV or JSONL file without loading them into memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--output', '-o', default='-', help='File to write, or - for stdout')
+        parser.add_argument('--status', action='append', help='Only bookings with this status (repeatable)')
+        parser.add_argument('--since', help='Only bookings starting on or after YYYY-MM-DD')
+        parser.add_argument('--until', help='Only bookings starting on or before YYYY-MM-DD')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        queryset = Booking.objects.all()
+        if options['status']:
+            queryset = queryset.filter(status__in=options['status'])
+        for option, lookup in (('since', 'start_date__gte'), ('until', 'start_date__lte')):
+            if options[option]:
+                day = parse_date(options[option])
+                if day is None:
+                    raise CommandError(f'--{option} must be YYYY-MM-DD')
+                queryset = queryset.filter(**{lookup: day})
+
+        csv_format = options['format'] == 'csv'
+        lines = (iter_csv if csv_format else iter_jsonl)(queryset, options['chunk_size'])
+        if options['output'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+            count = 0
+            for line in lines:
+                out.write(line)
+                count += 1
+        if csv_format:
+            count -= 1  # header row
+        self.stderr.write(f"Wrote {count} bookings to {options['output']}")
@@ -0,0 +1,51 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from rentals.images import generate_variants
+from rentals.models import VehicleImage
+
+
+def _generate(image_id, force):
+    try:
+        return image_id, generate_variants(image_id, force=force), None
+    except Exception as exc:
+        return image_id, False, f'{type(exc).__name__}: {exc}'
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Generate resized variants for vehicle images that lack them, in parallel worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                            help='Worker processes (1 = resize in this process)')
+        parser.add_argument('--all', action='store_true', help='Regenerate every image, not only missing or stale ones')
+
+    def handle(self, *args, **options):
+        force = options['all']
+        rows = VehicleImage.objects.exclude(image='').order_by('pk').values_list('pk', 'image', 'variants_source')
+        ids = [pk for pk, image, source in rows if force or source != image]
+        workers = max(1, min(options['workers'], len(ids)))
+
+        if workers == 1:
+            results = (_generate(image_id, force) for image_id in ids)
+            self._report(results, len(ids))
+            return
+        # Forked workers must not share this process's database connections.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            self._report(pool.map(_generate, ids, [force] * len(ids), chunksize=8), len(ids))
+
+    def _report(self, results, total):
+        done = failed = 0
+        for image_id, generated, error in results:
+            if error:
+                failed += 1
+                self.stderr.write(f'VehicleImage {image_id}: {error}')
+            elif generated:
+                done += 1
+        self.stdout.write(f'generated variants for {done} of {total} images; {failed} failed')
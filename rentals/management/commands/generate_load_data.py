@@ -0,0 +1,215 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from rentals.cache import bump_catalog_version
+from rentals.geo import encode as geohash_encode
+from rentals.utils import hold_deadline
+from rentals.models import Booking, Payment, Vehicle
+from rentals.rollups import rebuild as rebuild_rollups
+from rentals.vehicle_stats import recompute
+
+# (city, state, latitude, longitude of the centre)
+CITIES = [
+    ('Pune', 'MH', 18.5204, 73.8567), ('Mumbai', 'MH', 19.0760, 72.8777), ('Bengaluru', 'KA', 12.9716, 77.5946),
+    ('Mysuru', 'KA', 12.2958, 76.6394), ('Chennai', 'TN', 13.0827, 80.2707), ('Hyderabad', 'TG', 17.3850, 78.4867),
+    ('Delhi', 'DL', 28.6139, 77.2090), ('Jaipur', 'RJ', 26.9124, 75.7873), ('Goa', 'GA', 15.4909, 73.8278),
+    ('Kochi', 'KL', 9.9312, 76.2673),
+]
+# Vehicles are scattered up to this many degrees (~15 km) around their city centre.
+CITY_SPREAD = 0.135
+MODELS = {
+    'bike': [('Honda', 'Activa'), ('Royal Enfield', 'Classic 350'), ('Bajaj', 'Pulsar'), ('TVS', 'Jupiter'),
+             ('Yamaha', 'FZ'), ('Ather', '450X')],
+    'car': [('Maruti', 'Swift'), ('Hyundai', 'Creta'), ('Tata', 'Nexon'), ('Mahindra', 'XUV700'),
+            ('Toyota', 'Innova'), ('Honda', 'City')],
+}
+
+
+@contextmanager
+def explicit_created_at(*models):
+    """Let bulk_create keep the created_at values we generate instead of now()."""
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = 'Generate a large deterministic dataset (users, vehicles, bookings) for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--vehicles', type=int, default=1000)
+        parser.add_argument('--bookings', type=int, default=100000)
+        parser.add_argument('--owners', type=float, default=0.01, help='Fraction of users that own vehicles')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create and transaction')
+        parser.add_argument('--prefix', default='load', help='Username prefix for generated users')
+        parser.add_argument('--rollups', action='store_true',
+                            help='Also rebuild the owner rollups (slow for large datasets; '
+                                 'refresh_rollups --full does the same later)')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}user').exists():
+            raise CommandError(f'Users with prefix {prefix!r} already exist; pick another --prefix')
+        if options['bookings'] and not (options['users'] and options['vehicles']):
+            raise CommandError('Bookings need at least one user and one vehicle')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+
+        started = time.monotonic()
+        user_ids = self._create_users(User, options['users'], prefix)
+        owner_ids = user_ids[:max(1, int(len(user_ids) * options['owners']))] if user_ids else []
+        vehicles = self._create_vehicles(options['vehicles'], owner_ids)
+        # bulk_create skips the signals that invalidate the catalog cache.
+        bump_catalog_version()
+        self._create_bookings(options['bookings'], user_ids, vehicles)
+        if options['bookings']:
+            # bulk_create also skips the receivers that count completed bookings and mark rollup days.
+            recompute(self.batch_size)
+            if options['rollups']:
+                rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.monotonic() - started:.1f}s'))
+
+    def _chunks(self, label, total, make_row, model, return_ids=True, after_batch=None):
+        """bulk_create ``total`` rows from make_row(i) in committed batches; returns new ids.
+
+        ``after_batch(created)`` runs in each batch's transaction, so dependent
+        rows are written alongside it rather than held for the whole run.
+        """
+        ids = []
+        started = time.monotonic()
+        for offset in range(0, total, self.batch_size):
+            rows = [make_row(i) for i in range(offset, min(offset + self.batch_size, total))]
+            with transaction.atomic():
+                created = model.objects.bulk_create(rows, batch_size=self.batch_size)
+                if after_batch:
+                    after_batch(created)
+            if return_ids:
+                ids.extend(obj.pk for obj in created)
+            done = offset + len(rows)
+            rate = done / max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f'{label}: {done}/{total} ({rate:,.0f} rows/s)')
+        return ids
+
+    def _create_users(self, User, total, prefix):
+        # Hashing is deliberately slow; every generated user shares one hash.
+        password = make_password('password')
+        joined_span = 3 * 365 * 24 * 3600
+
+        def make(i):
+            return User(
+                username=f'{prefix}user{i}', email=f'{prefix}user{i}@example.com', password=password,
+                date_joined=self.now - timedelta(seconds=self.rng.randrange(joined_span)),
+            )
+        return self._chunks('users', total, make, User)
+
+    def _create_vehicles(self, total, owner_ids):
+        rng = self.rng
+        vehicles = []
+
+        def make(i):
+            vtype = 'bike' if rng.random() < 0.7 else 'car'
+            make_name, model_name = rng.choice(MODELS[vtype])
+            city, state, lat, lng = rng.choice(CITIES)
+            lat = round(lat + rng.uniform(-CITY_SPREAD, CITY_SPREAD), 6)
+            lng = round(lng + rng.uniform(-CITY_SPREAD, CITY_SPREAD), 6)
+            year = rng.randint(2012, 2024)
+            if vtype == 'bike':
+                seats, price = rng.choice((1, 2)), rng.randrange(300, 1500, 50)
+            else:
+                seats, price = rng.choice((4, 5, 5, 7)), rng.randrange(1500, 6000, 100)
+            vehicle = Vehicle(
+                owner_id=rng.choice(owner_ids) if owner_ids and rng.random() < 0.8 else None,
+                type=vtype, title=f'{year} {make_name} {model_name} #{i}', description=f'{make_name} {model_name} in {city}',
+                make=make_name, model=model_name, year=year, seats=seats, price_per_day=price,
+                deposit=price * rng.choice((0, 1, 2)), location_city=city, location_state=state,
+                # bulk_create skips Vehicle.save(), which normally fills the geohash.
+                latitude=lat, longitude=lng, geohash=geohash_encode(lat, lng),
+                is_active=rng.random() < 0.95,
+                created_at=self.now - timedelta(days=rng.randrange(3 * 365), seconds=rng.randrange(86400)),
+            )
+            vehicles.append((vehicle.price_per_day, vehicle.deposit))
+            return vehicle
+
+        with explicit_created_at(Vehicle):
+            ids = self._chunks('vehicles', total, make, Vehicle)
+        return [(pk, price, deposit) for pk, (price, deposit) in zip(ids, vehicles)]
+
+    def _create_bookings(self, total, user_ids, vehicles):
+        """Non-overlapping per-vehicle timelines centred so ~75% of bookings are in the past.
+
+        Pending bookings are fresh checkouts with a live hold; confirmed and
+        completed ones get the paid Payment the checkout webhook would have
+        recorded.
+        """
+        rng = self.rng
+        if not total:
+            return
+        hold = timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+        # (amount, paid_at) or None for each row of the batch being built.
+        payments = []
+        per_vehicle = total / len(vehicles)
+        # Average booking is ~4 days plus a ~3 day gap.
+        span = int(per_vehicle * 7) + 30
+        window_start = self.now.date() - timedelta(days=int(span * 0.75))
+        cursors = [window_start + timedelta(days=rng.randrange(7)) for _ in vehicles]
+        today = self.now.date()
+
+        def make(i):
+            slot = i % len(vehicles)
+            pk, price, deposit = vehicles[slot]
+            start = cursors[slot] + timedelta(days=int(rng.expovariate(1 / 3)))
+            days = min(1 + int(rng.expovariate(1 / 3)), 30)
+            end = start + timedelta(days=days - 1)
+            cursors[slot] = end + timedelta(days=1)
+
+            roll = rng.random()
+            if end < today:
+                status = 'completed' if roll < 0.88 else 'cancelled'
+            elif start <= today:
+                status = 'confirmed' if roll < 0.95 else 'cancelled'
+            else:
+                status = 'confirmed' if roll < 0.6 else 'pending' if roll < 0.9 else 'cancelled'
+            if status == 'pending':
+                created = self.now - timedelta(seconds=rng.randrange(int(hold.total_seconds())))
+            else:
+                lead = timedelta(days=rng.randrange(1, 45), seconds=rng.randrange(86400))
+                created = min(datetime.combine(start, dt_time.min, tzinfo=dt_timezone.utc) - lead, self.now)
+            total_price = price * days + deposit
+            if status in ('confirmed', 'completed'):
+                payments.append((total_price, min(created + timedelta(seconds=rng.randrange(60, 600)), self.now)))
+            else:
+                payments.append(None)
+            return Booking(
+                user_id=rng.choice(user_ids), vehicle_id=pk, start_date=start, end_date=end,
+                total_price=total_price, status=status, created_at=created,
+                hold_expires_at=hold_deadline(created) if status == 'pending' else None,
+            )
+
+        def create_payments(created):
+            Payment.objects.bulk_create([
+                Payment(booking_id=booking.pk, amount=payment[0], paid=True, paid_at=payment[1])
+                for booking, payment in zip(created, payments) if payment
+            ], batch_size=self.batch_size)
+            payments.clear()
+
+        with explicit_created_at(Booking):
+            self._chunks('bookings', total, make, Booking, return_ids=False, after_batch=create_payments)
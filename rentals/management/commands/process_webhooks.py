@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rentals.webhooks import backlog_stats, process_batch
+
+
+class Command(BaseCommand):
+    help = 'Apply stored Stripe webhook events in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when the inbox is empty')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep between polls with --loop')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            handled = process_batch(options['batch_size'])
+            total += handled
+            if handled:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        stats = backlog_stats()
+        self.stdout.write(
+            f"processed {total} events; pending {stats['pending']}, failed {stats['failed']}, "
+            f"lag {stats['lag_seconds']:.1f}s"
+        )
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rentals.rollups import rebuild, refresh
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily utilization and revenue rollups for the days changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every day that has bookings or stats')
+        parser.add_argument('--batch-size', type=int, default=500, help='Vehicles recomputed per transaction')
+        parser.add_argument('--loop', action='store_true', help='Keep running instead of exiting after one pass')
+        parser.add_argument('--interval', type=float, default=300.0, help='Seconds to sleep between passes with --loop')
+
+    def handle(self, *args, **options):
+        run = rebuild if options['full'] else refresh
+        while True:
+            vehicles, days = run(options['batch_size'])
+            self.stdout.write(f'refreshed {vehicles} vehicles over {days} days')
+            if not options['loop']:
+                break
+            run = refresh
+            time.sleep(options['interval'])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from rentals.vehicle_stats import recompute
+
+
+class Command(BaseCommand):
+    help = 'Recount the rating and completed-booking counters on every vehicle and fix the ones that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Vehicles read and updated per query')
+
+    def handle(self, *args, **options):
+        repaired = recompute(options['batch_size'])
+        self.stdout.write(f'repaired {repaired} vehicles')
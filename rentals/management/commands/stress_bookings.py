@@ -0,0 +1,102 @@
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+from django.db.models import Exists, OuterRef
+
+from rentals.models import Booking, Vehicle
+from rentals.utils import VehicleUnavailable, blocking_q, reserve_vehicle
+
+
+def count_overlaps(vehicle_ids):
+    """Blocking bookings that overlap an earlier blocking booking of the same vehicle."""
+    blocking = Booking.objects.filter(vehicle_id__in=vehicle_ids).filter(blocking_q())
+    earlier = blocking.filter(
+        vehicle=OuterRef('vehicle'),
+        pk__lt=OuterRef('pk'),
+        start_date__lte=OuterRef('end_date'),
+        end_date__gte=OuterRef('start_date'),
+    )
+    return blocking.filter(Exists(earlier)).count()
+
+
+class Command(BaseCommand):
+    help = 'Hammer reserve_vehicle from many threads and verify no vehicle is double-booked'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=50, help='Booking attempts per thread')
+        parser.add_argument('--vehicles', type=int, default=4, help='Vehicles to spread attempts over')
+        parser.add_argument('--days', type=int, default=60, help='Width of the date window attempts fall in')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--retries', type=int, default=20, help='Retries per attempt on lock timeouts')
+        parser.add_argument('--keep', action='store_true', help='Keep the stress vehicles and bookings')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        user, _ = User.objects.get_or_create(username='stress-bookings')
+        vehicles = [
+            Vehicle.objects.create(type='bike', title=f'Stress vehicle {i}', price_per_day=10, seats=1)
+            for i in range(options['vehicles'])
+        ]
+        counts = {'created': 0, 'unavailable': 0, 'retries': 0, 'errors': 0}
+        counts_lock = threading.Lock()
+        base = date.today() + timedelta(days=1)
+
+        def worker(n):
+            rng = random.Random(options['seed'] * 1000 + n)
+            local = dict.fromkeys(counts, 0)
+            try:
+                for _ in range(options['attempts']):
+                    vehicle = rng.choice(vehicles)
+                    start = base + timedelta(days=rng.randrange(options['days']))
+                    end = start + timedelta(days=rng.randrange(5))
+                    for retry in range(options['retries'] + 1):
+                        try:
+                            reserve_vehicle(user, vehicle, start, end, vehicle.price_per_day)
+                            local['created'] += 1
+                        except VehicleUnavailable:
+                            local['unavailable'] += 1
+                        except OperationalError:
+                            # SQLite reports lock contention it could not wait out
+                            # (always, for shared-cache in-memory test databases).
+                            if retry == options['retries']:
+                                local['errors'] += 1
+                            else:
+                                local['retries'] += 1
+                                time.sleep(0.001 * 2 ** min(retry, 6))
+                                continue
+                        break
+            finally:
+                connection.close()
+                with counts_lock:
+                    for key, value in local.items():
+                        counts[key] += value
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        vehicle_ids = [v.pk for v in vehicles]
+        overlaps = count_overlaps(vehicle_ids)
+        attempts = options['threads'] * options['attempts']
+        self.stdout.write(f'attempts: {attempts} in {elapsed:.2f}s ({attempts / elapsed:.1f}/sec)')
+        self.stdout.write(f"created: {counts['created']} ({counts['created'] / elapsed:.1f} bookings/sec)")
+        self.stdout.write(f"rejected as unavailable: {counts['unavailable']}")
+        self.stdout.write(f"lock retries: {counts['retries']}")
+        self.stdout.write(f"database errors: {counts['errors']}")
+        self.stdout.write(f'overlapping bookings: {overlaps}')
+
+        if not options['keep']:
+            Vehicle.objects.filter(pk__in=vehicle_ids).delete()
+            user.delete()
+        if overlaps:
+            raise CommandError(f'{overlaps} overlapping bookings found')
@@ -0,0 +1,274 @@
+"""Per-view request metrics, shared across gunicorn workers.
+
+MetricsMiddleware records request latency, DB queries/time and response size
+per resolved URL name into a process-local store. With METRICS_DIR set, each
+worker periodically writes a snapshot of its counters to its own file there
+and the /metrics view sums every file, so a scrape that lands on any worker
+sees the whole server. Files of exited workers are kept: their counters stay
+part of the totals, as Prometheus expects from counters.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('rentals.slow_requests')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+# Statements kept per request for the slow-request log.
+SLOW_LOG_MAX_QUERIES = 50
+
+METRICS_HELP = {
+    'rentals_http_requests_total': 'Requests by view, method and status',
+    'rentals_http_request_duration_seconds': 'Request latency by view',
+    'rentals_http_response_bytes_total': 'Response body bytes by view',
+    'rentals_db_queries_per_request': 'DB queries per request by view',
+    'rentals_db_query_duration_seconds_total': 'Time spent in DB queries by view',
+    'rentals_token_auth_cache_total': 'Token authentication cache lookups by result',
+}
+
+
+class MetricsStore:
+    """Counters and histograms keyed by (metric name, labels)."""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.counters = {}
+        self.histograms = {}
+        self.last_flush = 0.0
+        self.path = None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self.path = os.path.join(self.directory, f'metrics-{self.pid}-{time.time_ns()}.json')
+
+    def _check_fork(self):
+        # A worker forked from a preloaded master must not report the
+        # master's samples (or write to its file) a second time.
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self._check_fork()
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self._check_fork()
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {'buckets': list(buckets), 'counts': [0] * (len(buckets) + 1), 'sum': 0}
+            hist['counts'][bisect_left(buckets, value)] += 1
+            hist['sum'] += value
+
+    def snapshot(self):
+        with self.lock:
+            self._check_fork()
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [
+                    [name, list(labels), {**hist, 'counts': list(hist['counts'])}]
+                    for (name, labels), hist in self.histograms.items()
+                ],
+            }
+
+    def flush(self, interval=0):
+        """Write this process's snapshot if ``interval`` seconds have passed since the last write."""
+        if not self.path or time.monotonic() - self.last_flush < interval:
+            return
+        self.last_flush = time.monotonic()
+        data = self.snapshot()
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as out:
+            json.dump(data, out)
+        os.replace(tmp, self.path)
+
+    def collect(self):
+        """Snapshots of every worker; this process contributes its live numbers."""
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as fh:
+                    snapshots.append(json.load(fh))
+            except (OSError, ValueError):
+                # Being replaced or half-written by an older version; skip it this scrape.
+                continue
+        return snapshots
+
+
+def merge(snapshots):
+    counters, histograms = {}, {}
+    for snap in snapshots:
+        for name, labels, value in snap['counters']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, hist in snap['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total = histograms.get(key)
+            if total is None or total['buckets'] != hist['buckets']:
+                # Buckets changed between deploys; the newest layout wins.
+                histograms[key] = {**hist, 'counts': list(hist['counts'])}
+                continue
+            total['counts'] = [a + b for a, b in zip(total['counts'], hist['counts'])]
+            total['sum'] += hist['sum']
+    return counters, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        f'{key}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound is None else repr(float(bound))
+
+
+def render(snapshots):
+    """Prometheus text exposition of merged snapshots."""
+    counters, histograms = merge(snapshots)
+    names = sorted({name for name, _ in counters} | {name for name, _ in histograms})
+    lines = []
+    for name in names:
+        kind = 'histogram' if any(metric == name for metric, _ in histograms) else 'counter'
+        help_text = METRICS_HELP.get(name)
+        if help_text:
+            lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+        for (metric, labels), hist in sorted(histograms.items(), key=lambda item: item[0]):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(hist['buckets']) + [None], hist['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", _format_bound(bound))])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {hist["sum"]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return ''.join(line + '\n' for line in lines)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MetricsStore(settings.METRICS_DIR or None)
+    return _store
+
+
+class QueryRecorder:
+    """execute_wrapper that times every statement, keeping SQL only when asked."""
+
+    def __init__(self, keep_sql=False):
+        self.count = 0
+        self.seconds = 0.0
+        self.keep_sql = keep_sql
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            if self.keep_sql and len(self.queries) < SLOW_LOG_MAX_QUERIES:
+                self.queries.append((elapsed, sql))
+
+
+class MetricsMiddleware:
+    """Time each request and its DB work under the resolved URL name.
+
+    Under ASGI the middleware stays async so async views never hop to a
+    thread for it. DB work there runs on other threads than the one
+    handling the request, so async requests record no query metrics.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = settings.SLOW_REQUEST_MS
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder(keep_sql=bool(self.slow_ms))
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, None)
+        return response
+
+    def _record(self, request, response, elapsed, recorder):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unresolved'
+        store = get_store()
+        store.inc('rentals_http_requests_total', {'view': view, 'method': request.method, 'status': str(response.status_code)})
+        store.observe('rentals_http_request_duration_seconds', {'view': view}, elapsed, DURATION_BUCKETS)
+        if recorder is not None:
+            store.observe('rentals_db_queries_per_request', {'view': view}, recorder.count, QUERY_COUNT_BUCKETS)
+            store.inc('rentals_db_query_duration_seconds_total', {'view': view}, recorder.seconds)
+        if not response.streaming:
+            store.inc('rentals_http_response_bytes_total', {'view': view}, len(response.content))
+        store.flush(settings.METRICS_FLUSH_INTERVAL)
+
+        if self.slow_ms and elapsed * 1000 >= self.slow_ms:
+            self._log_slow(request, view, response, elapsed, recorder)
+
+    def _log_slow(self, request, view, response, elapsed, recorder):
+        if recorder is None:
+            logger.warning(
+                'Slow request %s %s (%s) %s in %.1fms',
+                request.method, request.get_full_path(), view, response.status_code, elapsed * 1000,
+            )
+            return
+        statements = '\n'.join(f'  {seconds * 1000:.1f}ms {sql}' for seconds, sql in recorder.queries)
+        if recorder.count > len(recorder.queries):
+            statements += f'\n  ... {recorder.count - len(recorder.queries)} more'
+        logger.warning(
+            'Slow request %s %s (%s) %s in %.1fms, %d queries in %.1fms\n%s',
+            request.method, request.get_full_path(), view, response.status_code,
+            elapsed * 1000, recorder.count, recorder.seconds * 1000, statements,
+        )
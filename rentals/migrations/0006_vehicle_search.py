@@ -0,0 +1,74 @@
+from django.db import migrations, models
+import django.db.models.functions.text
+
+# The search schema as of this migration, copied from rentals/search.py so
+# later changes there cannot alter what this migration does.
+FTS_TABLE = 'rentals_vehicle_fts'
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, make, model, description,
+        content='rentals_vehicle', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON rentals_vehicle BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, make, model, description)
+        VALUES (new.id, new.title, new.make, new.model, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON rentals_vehicle BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, make, model, description)
+        VALUES ('delete', old.id, old.title, old.make, old.model, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, make, model, description
+    ON rentals_vehicle BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, make, model, description)
+        VALUES ('delete', old.id, old.title, old.make, old.model, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, make, model, description)
+        VALUES (new.id, new.title, new.make, new.model, new.description);
+    END""",
+]
+POSTGRES_INDEX = 'vehicle_search_idx'
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(make, '') || ' ' || coalesce(model, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        for statement in SQLITE_SCHEMA:
+            schema_editor.execute(statement)
+        schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON rentals_vehicle USING gin (({POSTGRES_VECTOR}))'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {POSTGRES_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0005_payment_stripe_session'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(django.db.models.functions.text.Lower('location_city'), name='vehicle_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(django.db.models.functions.text.Lower('location_state'), name='vehicle_state_idx'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 03:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0007_vehicle_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicleimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='vehicleimage',
+            name='variants_source',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def expire_existing_holds(apps, schema_editor):
+    # Pending bookings from before holds expired get the same deadline a new
+    # one would have had; long-abandoned ones are released on the next run
+    # of expire_bookings.
+    Booking = apps.get_model('rentals', 'Booking')
+    Booking.objects.filter(status='pending', hold_expires_at=None).update(
+        hold_expires_at=F('created_at') + timedelta(minutes=settings.BOOKING_HOLD_MINUTES),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0008_vehicleimage_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='hold_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'hold_expires_at'], name='booking_hold_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'end_date'], name='booking_status_end_idx'),
+        ),
+        migrations.RunPython(expire_existing_holds, migrations.RunPython.noop),
+    ]
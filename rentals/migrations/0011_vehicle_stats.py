@@ -0,0 +1,63 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_vehicle_stats(apps, schema_editor):
+    Vehicle = apps.get_model('rentals', 'Vehicle')
+    stats = {}
+    for model in ('Review', 'ArchivedReview'):
+        rows = apps.get_model('rentals', model).objects.values('booking__vehicle').annotate(n=Count('id'), total=Sum('rating'))
+        for row in rows:
+            entry = stats.setdefault(row['booking__vehicle'], {'rating_count': 0, 'rating_sum': 0, 'bookings_completed': 0})
+            entry['rating_count'] += row['n']
+            entry['rating_sum'] += row['total']
+    for model in ('Booking', 'ArchivedBooking'):
+        rows = apps.get_model('rentals', model).objects.filter(status='completed').values('vehicle').annotate(n=Count('id'))
+        for row in rows:
+            entry = stats.setdefault(row['vehicle'], {'rating_count': 0, 'rating_sum': 0, 'bookings_completed': 0})
+            entry['bookings_completed'] += row['n']
+    for vehicle_id, entry in stats.items():
+        count = entry['rating_count']
+        avg = (Decimal(entry['rating_sum']) / count).quantize(Decimal('0.01'), ROUND_HALF_UP) if count else 0
+        Vehicle.objects.filter(pk=vehicle_id).update(rating_avg=avg, **entry)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0010_booking_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='bookings_completed',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='rating_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['-rating_avg', '-rating_count', '-id'], name='vehicle_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['-bookings_completed', '-id'], name='vehicle_popularity_idx'),
+        ),
+        migrations.RunPython(fill_vehicle_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Min
+import django.db.models.deletion
+
+
+def mark_existing_bookings(apps, schema_editor):
+    """Leave one mark per vehicle so the first refresh_rollups fills the rollups."""
+    RollupMark = apps.get_model('rentals', 'RollupMark')
+    for model in ('Booking', 'ArchivedBooking'):
+        spans = (
+            apps.get_model('rentals', model).objects.filter(status__in=['confirmed', 'completed'])
+            .values('vehicle').annotate(start=Min('start_date'), end=Max('end_date')).order_by()
+        )
+        RollupMark.objects.bulk_create(
+            [RollupMark(vehicle_id=span['vehicle'], start_date=span['start'], end_date=span['end']) for span in spans],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rentals', '0011_vehicle_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupMark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vehicle_id', models.BigIntegerField(null=True)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VehicleDayStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_stats', to='rentals.vehicle')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OwnerDayStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='vehicledaystats',
+            index=models.Index(fields=['day'], name='vehicle_day_stats_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='vehicledaystats',
+            constraint=models.UniqueConstraint(fields=('vehicle', 'day'), name='vehicle_day_stats_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='ownerdaystats',
+            index=models.Index(fields=['day'], name='owner_day_stats_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ownerdaystats',
+            constraint=models.UniqueConstraint(fields=('owner', 'day'), name='owner_day_stats_unique'),
+        ),
+        migrations.RunPython(mark_existing_bookings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0014_review_rating_range'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleSearchIndex',
+            fields=[
+                ('vehicle', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='rentals.vehicle')),
+                ('document', models.TextField(db_column='rentals_vehicle_fts')),
+            ],
+            options={
+                'db_table': 'rentals_vehicle_fts',
+                'managed': False,
+            },
+        ),
+    ]
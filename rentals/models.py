@@ -1,5 +1,21 @@
 from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models.functions import Lower
+
+from .geo import encode as geohash_encode
+
+
+class VehicleQuerySet(models.QuerySet):
+    def for_api(self):
+        """Prefetch what VehicleSerializer renders so a page costs a fixed number of queries."""
+        return self.prefetch_related('images')
+
+
+class BookingQuerySet(models.QuerySet):
+    def for_api(self):
+        """Join the vehicle and prefetch its images for BookingSerializer."""
+        return self.select_related('vehicle').prefetch_related('vehicle__images')
 
 
 class Vehicle(models.Model):
@@ -17,17 +33,91 @@ class Vehicle(models.Model):
     deposit = models.DecimalField(max_digits=8, decimal_places=2, default=0)
     location_city = models.CharField(max_length=100, blank=True)
     location_state = models.CharField(max_length=100, blank=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True,
+                                   validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True,
+                                    validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # Derived from latitude/longitude in save(); indexed for proximity search (see geo.py).
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Review and completion counters maintained by vehicle_stats.py, archived bookings included.
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+    rating_count = models.IntegerField(default=0, editable=False)
+    rating_sum = models.IntegerField(default=0, editable=False)
+    bookings_completed = models.IntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('rating_avg', 'rating_count', 'rating_sum', 'bookings_completed')
+
+    objects = VehicleQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='vehicle_keyset_idx'),
+            # Case-insensitive prefix filters (see search.prefix_range).
+            models.Index(Lower('location_city'), name='vehicle_city_idx'),
+            models.Index(Lower('location_state'), name='vehicle_state_idx'),
+            models.Index(fields=['geohash'], name='vehicle_geohash_idx'),
+            # ?ordering=rating and ?ordering=popularity on the vehicle list.
+            models.Index(fields=['-rating_avg', '-rating_count', '-id'], name='vehicle_rating_idx'),
+            models.Index(fields=['-bookings_completed', '-id'], name='vehicle_popularity_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.type})"
 
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geohash_encode(float(self.latitude), float(self.longitude))
+        else:
+            self.geohash = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'}.intersection(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        elif update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            # The counters change only through F() updates in vehicle_stats.py; writing
+            # back the values loaded with this instance would undo concurrent ones.
+            skipped = {*self.COUNTER_FIELDS, *self.get_deferred_fields()}
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+        self._loaded_owner_id = self.owner_id
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets signals.mark_owner_change see an owner change on save.
+        instance._loaded_owner_id = instance.__dict__.get('owner_id')
+        return instance
+
+
+class VehicleSearchIndex(models.Model):
+    """The SQLite FTS5 index of Vehicle text, so search can join it (see search.py).
+
+    Migration 0006 and signals.py create the table and its triggers; Django
+    never writes to it. ``document`` is FTS5's hidden column named after the
+    table, the left-hand side of MATCH.
+    """
+    vehicle = models.OneToOneField(
+        Vehicle, primary_key=True, db_column='rowid', db_constraint=False,
+        related_name='search_index', on_delete=models.DO_NOTHING,
+    )
+    document = models.TextField(db_column='rentals_vehicle_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'rentals_vehicle_fts'
+
 
 class VehicleImage(models.Model):
     vehicle = models.ForeignKey(Vehicle, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='vehicles/')
     alt_text = models.CharField(max_length=200, blank=True)
+    # Resized copies, filled in the background by images.generate_variants().
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+    variants_source = models.CharField(max_length=100, blank=True, default='', editable=False)
 
 
 class Booking(models.Model):
@@ -45,21 +135,172 @@ class Booking(models.Model):
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
+    # A pending booking stops holding the vehicle after this (null: never).
+    hold_expires_at = models.DateTimeField(null=True, blank=True)
+    # Conditional GETs read this (see cache.py); bulk update() calls must set it too.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BookingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Covers the availability anti-join in utils.filter_available.
+            models.Index(fields=['vehicle', 'status', 'start_date', 'end_date'], name='booking_availability_idx'),
+            # Keyset pagination of a user's bookings.
+            models.Index(fields=['user', 'created_at', 'id'], name='booking_user_keyset_idx'),
+            # Batches of expired holds and finished rentals for holds.expire_bookings.
+            models.Index(fields=['status', 'hold_expires_at'], name='booking_hold_expiry_idx'),
+            models.Index(fields=['status', 'end_date'], name='booking_status_end_idx'),
+            # Validators for a user's booking list, read without touching the table.
+            models.Index(fields=['user', 'updated_at'], name='booking_user_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Booking #{self.id} - {self.vehicle} by {self.user}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the post_save receivers in signals.py see status and date changes.
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_dates = (instance.__dict__.get('start_date'), instance.__dict__.get('end_date'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save has compared against the loaded values; the next save compares against these.
+        self._loaded_status = self.status
+        self._loaded_dates = (self.start_date, self.end_date)
+
 
 class Payment(models.Model):
     booking = models.OneToOneField(Booking, related_name='payment', on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     stripe_payment_intent = models.CharField(max_length=255, blank=True)
+    stripe_session_id = models.CharField(max_length=255, blank=True)
+    stripe_session_expires_at = models.DateTimeField(null=True, blank=True)
     paid = models.BooleanField(default=False)
     paid_at = models.DateTimeField(null=True, blank=True)
 
 
 class Review(models.Model):
     booking = models.OneToOneField(Booking, related_name='review', on_delete=models.CASCADE)
+    # rating_avg on Vehicle is a DecimalField(3, 2), so ratings stay within 1-5.
+    rating = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
+    comment = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets signals.count_review see a rating change on save.
+        instance._loaded_rating = instance.__dict__.get('rating')
+        return instance
+
+
+class ArchivedBooking(models.Model):
+    """A finished Booking moved out of the hot table by archive_bookings (see archive.py).
+
+    Archived rows keep their original ids, so a Payment or Review copy
+    still points at its booking.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='archived_bookings', on_delete=models.CASCADE)
+    vehicle = models.ForeignKey(Vehicle, related_name='archived_bookings', on_delete=models.CASCADE)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    hold_expires_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a user's booking history.
+            models.Index(fields=['user', 'created_at', 'id'], name='archived_booking_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived booking #{self.id} - {self.vehicle} by {self.user}"
+
+
+class ArchivedPayment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    booking = models.OneToOneField(ArchivedBooking, related_name='payment', on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    stripe_payment_intent = models.CharField(max_length=255, blank=True)
+    stripe_session_id = models.CharField(max_length=255, blank=True)
+    stripe_session_expires_at = models.DateTimeField(null=True, blank=True)
+    paid = models.BooleanField(default=False)
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+
+class ArchivedReview(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    booking = models.OneToOneField(ArchivedBooking, related_name='review', on_delete=models.CASCADE)
     rating = models.PositiveSmallIntegerField()
     comment = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+
+
+class VehicleDayStats(models.Model):
+    """One day a vehicle was booked, with the paid revenue attributed to it (see rollups.py)."""
+    vehicle = models.ForeignKey(Vehicle, related_name='day_stats', on_delete=models.CASCADE)
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['vehicle', 'day'], name='vehicle_day_stats_unique'),
+        ]
+        indexes = [
+            # Re-summing owners over a range of days.
+            models.Index(fields=['day'], name='vehicle_day_stats_day_idx'),
+        ]
+
+
+class OwnerDayStats(models.Model):
+    """VehicleDayStats summed over one owner's vehicles; served by /api/owner/stats/."""
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='day_stats', on_delete=models.CASCADE)
+    day = models.DateField()
+    booked = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'day'], name='owner_day_stats_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='owner_day_stats_day_idx'),
+        ]
+
+
+class RollupMark(models.Model):
+    """Days whose rollups refresh_rollups has to recompute; a null vehicle means owner totals only."""
+    # Not a foreign key: the mark left by deleting a vehicle's bookings must outlive the vehicle.
+    vehicle_id = models.BigIntegerField(null=True)
+    start_date = models.DateField()
+    end_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
+
+
+class WebhookEvent(models.Model):
+    """Verified Stripe event waiting for (or done with) processing by process_webhooks."""
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Pending-queue scan: unprocessed events oldest first.
+            models.Index(fields=['processed_at', 'id'], name='webhook_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.event_id}"
@@ -0,0 +1,127 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+# Upper bound for the cheap "at least N" count used when the database
+# cannot give a planner estimate.
+ESTIMATE_CAP = 1000
+
+
+def estimate_count(queryset):
+    """``(count, capped)``: an approximate row count without a full COUNT(*) scan.
+
+    Postgres answers from the planner's row estimate; other backends count at
+    most ESTIMATE_CAP rows, and ``capped`` says the real count may be higher.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), False
+    count = queryset[:ESTIMATE_CAP].count()
+    return count, count >= ESTIMATE_CAP
+
+
+class KeysetPagination(PageNumberPagination):
+    """Page numbers by default, keyset pages when the request carries ``cursor``.
+
+    Keyset mode walks the queryset in ``(created_at, id)`` order (a view may set
+    ``keyset_ordering`` to flip the direction) and seeks past the last row of
+    the previous page, so deep pages cost the same as the first one and no
+    COUNT(*) is issued.
+    Start with ``?cursor=`` and follow ``next``. ``?count=estimate`` adds an
+    approximate ``count``, and ``count_capped`` when that is only a lower bound.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    keyset_ordering = ('created_at', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # A precomputed list (proximity search) is already ordered and sliced
+        # in memory, so it always gets page numbers.
+        self.keyset = self.cursor_query_param in request.query_params and not isinstance(queryset, list)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = getattr(view, 'keyset_ordering', self.keyset_ordering)
+        self.descending = ordering[0].startswith('-')
+        self.time_field, self.pk_field = (f.lstrip('-') for f in ordering)
+        queryset = queryset.order_by(*ordering)
+
+        self.estimated_count = None
+        if request.query_params.get(self.count_query_param) == 'estimate':
+            self.estimated_count, self.count_capped = estimate_count(queryset)
+
+        position = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+        if position is not None:
+            queryset = queryset.filter(self.seek_q(*position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if rows:
+            last = rows[-1]
+            if not isinstance(last, dict):
+                last = {self.time_field: getattr(last, self.time_field), self.pk_field: getattr(last, self.pk_field)}
+            self.last_position = (last[self.time_field], last[self.pk_field])
+        return rows
+
+    def seek_q(self, created_at, pk):
+        op = 'lt' if self.descending else 'gt'
+        return (
+            Q(**{f'{self.time_field}__{op}': created_at})
+            | Q(**{self.time_field: created_at, f'{self.pk_field}__{op}': pk})
+        )
+
+    def encode_cursor(self, position):
+        created_at, pk = position
+        raw = json.dumps([created_at.isoformat(), pk]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound('Invalid cursor')
+        if created_at is None:
+            raise NotFound('Invalid cursor')
+        return created_at, pk
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last_position))
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        fields = [('next', self.get_next_link())]
+        if self.estimated_count is not None:
+            fields.append(('count', self.estimated_count))
+            fields.append(('count_capped', self.count_capped))
+        fields.append(('results', data))
+        return Response(OrderedDict(fields))
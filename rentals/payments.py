@@ -0,0 +1,132 @@
+"""Stripe Checkout helpers shared by the payment views."""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import requests
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .holds import PAYMENT_GRACE, hold_for_checkout
+from .models import Payment
+
+# An open session this close to expiry is replaced rather than handed out.
+SESSION_REUSE_MARGIN = timedelta(minutes=5)
+# Stripe rejects Checkout sessions that would stay open longer than this.
+MAX_SESSION_LIFETIME = timedelta(hours=24)
+
+
+def configure_stripe():
+    """Point the stripe module at a pooled keep-alive HTTP session.
+
+    Async calls (``*_async``, used by the ASGI views) go through httpx
+    instead, so they wait on Stripe without holding a thread.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.STRIPE_HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe.max_network_retries = settings.STRIPE_MAX_NETWORK_RETRIES
+    stripe.default_http_client = stripe.RequestsClient(
+        timeout=settings.STRIPE_TIMEOUT, session=session,
+        async_fallback_client=stripe.HTTPXClient(timeout=settings.STRIPE_TIMEOUT),
+    )
+
+
+def _reusable_session_id(payment, booking):
+    if (
+        payment is not None
+        and payment.stripe_session_id
+        and not payment.paid
+        and payment.amount == booking.total_price
+        and payment.stripe_session_expires_at
+        and payment.stripe_session_expires_at > timezone.now() + SESSION_REUSE_MARGIN
+    ):
+        return payment.stripe_session_id
+    return None
+
+
+def _session_params(booking, success_url, cancel_url, payment, hold):
+    previous = payment.stripe_session_id if payment is not None else ''
+    idempotency_key = f'checkout-{booking.id}-{booking.total_price}-after-{previous or "none"}'
+    params = {
+        'payment_method_types': ['card'],
+        'line_items': [{
+            'price_data': {
+                'currency': 'usd',
+                'product_data': {'name': f'Booking #{booking.id} - {booking.vehicle.title}'},
+                'unit_amount': int(booking.total_price * 100),
+            },
+            'quantity': 1,
+        }],
+        'mode': 'payment',
+        'success_url': success_url,
+        'cancel_url': cancel_url,
+        'metadata': {'booking_id': str(booking.id)},
+    }
+    if hold is not None and hold - timezone.now() <= MAX_SESSION_LIFETIME:
+        # Close the session before the hold runs out, so a payment never
+        # lands on dates that were released (see holds.py).
+        params['expires_at'] = int((hold - PAYMENT_GRACE).timestamp())
+        idempotency_key += f'-until-{params["expires_at"]}'
+    params['idempotency_key'] = idempotency_key
+    return params
+
+
+def _payment_defaults(booking, session):
+    return {
+        'amount': booking.total_price,
+        'stripe_session_id': session.id,
+        'stripe_session_expires_at': datetime.fromtimestamp(session.expires_at, tz=dt_timezone.utc),
+    }
+
+
+def _store_session(booking, payment, session):
+    """Save a new session on the booking's Payment with a single write.
+
+    update_or_create's SELECT-then-write transaction cannot wait for SQLite's
+    write lock and fails with "database is locked" under concurrent checkouts.
+    """
+    defaults = _payment_defaults(booking, session)
+    if payment is None:
+        try:
+            with transaction.atomic():
+                Payment.objects.create(booking=booking, **defaults)
+            return
+        except IntegrityError:
+            pass  # A concurrent checkout of the same booking created it first.
+    Payment.objects.filter(booking=booking).update(**defaults)
+
+
+def get_or_create_checkout_session(booking, success_url, cancel_url, client=stripe):
+    """Return the id of an open Checkout session for ``booking``, creating one if needed.
+
+    A session stored on the booking's Payment is reused while it has not
+    expired and the amount is unchanged, so repeated clicks cost no Stripe
+    round trip. New sessions carry an idempotency key, so concurrent requests
+    that both miss still get the same session back from Stripe. Raises
+    HoldExpired if the booking no longer holds its dates.
+    """
+    hold = hold_for_checkout(booking)
+    payment = Payment.objects.filter(booking=booking).first()
+    session_id = _reusable_session_id(payment, booking)
+    if session_id:
+        return session_id
+    session = client.checkout.Session.create(**_session_params(booking, success_url, cancel_url, payment, hold))
+    _store_session(booking, payment, session)
+    return session.id
+
+
+async def aget_or_create_checkout_session(booking, success_url, cancel_url, client=stripe):
+    """Async get_or_create_checkout_session; ``booking.vehicle`` must already be loaded."""
+    hold = await sync_to_async(hold_for_checkout)(booking)
+    payment = await Payment.objects.filter(booking=booking).afirst()
+    session_id = _reusable_session_id(payment, booking)
+    if session_id:
+        return session_id
+    session = await client.checkout.Session.create_async(**_session_params(booking, success_url, cancel_url, payment, hold))
+    # The racy INSERT needs a savepoint, which the async ORM cannot open.
+    await sync_to_async(_store_session)(booking, payment, session)
+    return session.id
@@ -0,0 +1,188 @@
+"""Daily utilization and revenue rollups for owner analytics.
+
+VehicleDayStats has a row for each day a vehicle was booked by a confirmed
+or completed booking, archived ones included. The row carries the paid
+amount of that booking spread evenly over its days. OwnerDayStats sums
+those rows per owner and day, so /api/owner/stats/ reads at most one row
+per day of the requested range, however large the fleet.
+
+Changes that can move the numbers record the affected days as a RollupMark
+(signals.py, and the admin confirm action for its bulk update). The
+refresh_rollups job recomputes only the marked days, then deletes the
+marks it has handled; marks added meanwhile wait for the next run.
+``refresh_rollups --full`` rebuilds every day that has data.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_DOWN, Decimal
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+
+from .models import ArchivedBooking, Booking, OwnerDayStats, RollupMark, Vehicle, VehicleDayStats
+
+BOOKED_STATUSES = ['confirmed', 'completed']
+CENT = Decimal('0.01')
+
+
+def mark(vehicle_id, start, end):
+    RollupMark.objects.create(vehicle_id=vehicle_id, start_date=start, end_date=end)
+
+
+def _mark_spans(queryset, start_field, end_field):
+    """One mark per vehicle in ``queryset``, from its first ``start_field`` to its last ``end_field``."""
+    spans = queryset.order_by().values('vehicle_id').annotate(start=Min(start_field), end=Max(end_field))
+    RollupMark.objects.bulk_create(
+        [RollupMark(vehicle_id=span['vehicle_id'], start_date=span['start'], end_date=span['end']) for span in spans],
+        batch_size=1000,
+    )
+
+
+def mark_bookings(queryset):
+    """Mark the days of every booking in ``queryset`` (for bulk updates, which skip signals)."""
+    _mark_spans(queryset, 'start_date', 'end_date')
+
+
+def mark_owner_days(vehicle_id):
+    """Mark the days a vehicle has stats for, to re-sum them under its current owner."""
+    span = VehicleDayStats.objects.filter(vehicle_id=vehicle_id).aggregate(start=Min('day'), end=Max('day'))
+    if span['start']:
+        mark(None, span['start'], span['end'])
+
+
+def _days(start, end):
+    return [start + timedelta(days=n) for n in range((end - start).days + 1)]
+
+
+def _merge(ranges):
+    """Sorted, non-overlapping [start, end] ranges covering ``ranges``."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def vehicle_days(vehicle_id, start, end):
+    """``{day: revenue}`` for the days between ``start`` and ``end`` the vehicle was booked."""
+    days = defaultdict(Decimal)
+    for model in (Booking, ArchivedBooking):
+        bookings = model.objects.filter(
+            vehicle_id=vehicle_id, status__in=BOOKED_STATUSES, start_date__lte=end, end_date__gte=start,
+        ).values_list('start_date', 'end_date', 'payment__amount', 'payment__paid')
+        for first, last, amount, paid in bookings:
+            length = (last - first).days + 1
+            if paid:
+                # Whole cents per day; the first day takes what is left over.
+                share = (amount / length).quantize(CENT, ROUND_DOWN)
+                remainder = amount - share * length
+            else:
+                share = remainder = Decimal(0)
+            for day in _days(max(first, start), min(last, end)):
+                days[day] += share + remainder if day == first else share
+    return days
+
+
+def _refresh_vehicle(vehicle_id, start, end):
+    days = vehicle_days(vehicle_id, start, end)
+    VehicleDayStats.objects.filter(vehicle_id=vehicle_id, day__range=(start, end)).delete()
+    VehicleDayStats.objects.bulk_create(
+        [VehicleDayStats(vehicle_id=vehicle_id, day=day, revenue=revenue) for day, revenue in days.items()],
+        batch_size=1000,
+    )
+
+
+def _refresh_owners(start, end):
+    rows = list(
+        VehicleDayStats.objects.filter(day__range=(start, end), vehicle__owner__isnull=False)
+        .values('vehicle__owner_id', 'day').annotate(booked=Count('id'), revenue=Sum('revenue')).order_by()
+    )
+    OwnerDayStats.objects.filter(day__range=(start, end)).delete()
+    OwnerDayStats.objects.bulk_create([
+        OwnerDayStats(owner_id=row['vehicle__owner_id'], day=row['day'], booked=row['booked'], revenue=row['revenue'])
+        for row in rows
+    ], batch_size=1000)
+
+
+def refresh(batch_size=500):
+    """Recompute the days marked since the last run; returns (vehicles, days) recomputed.
+
+    Vehicles are recomputed ``batch_size`` per transaction, then the owner
+    totals for every marked day. The marks are deleted last, so a run that
+    dies part way is simply repeated.
+    """
+    # Only the marks read here are deleted: ids are not handed out in commit
+    # order, so a mark committed during the run can have a lower id than one
+    # read now.
+    ids = []
+    by_vehicle = defaultdict(list)
+    for pk, vehicle_id, start, end in RollupMark.objects.values_list('id', 'vehicle_id', 'start_date', 'end_date'):
+        ids.append(pk)
+        by_vehicle[vehicle_id].append((start, end))
+    if not ids:
+        return 0, 0
+    owner_ranges = [span for ranges in by_vehicle.values() for span in ranges]
+    by_vehicle.pop(None, None)
+
+    vehicles = list(by_vehicle.items())
+    for offset in range(0, len(vehicles), batch_size):
+        with transaction.atomic():
+            for vehicle_id, ranges in vehicles[offset:offset + batch_size]:
+                for start, end in _merge(ranges):
+                    _refresh_vehicle(vehicle_id, start, end)
+    days = 0
+    for start, end in _merge(owner_ranges):
+        with transaction.atomic():
+            _refresh_owners(start, end)
+        days += (end - start).days + 1
+    for offset in range(0, len(ids), batch_size):
+        RollupMark.objects.filter(id__in=ids[offset:offset + batch_size]).delete()
+    return len(vehicles), days
+
+
+def rebuild(batch_size=500):
+    """Mark every day with bookings or stats, then refresh; returns what refresh() does."""
+    mark_bookings(Booking.objects.filter(status__in=BOOKED_STATUSES))
+    mark_bookings(ArchivedBooking.objects.filter(status__in=BOOKED_STATUSES))
+    # Existing rows too, so stats nothing backs any more are cleared.
+    _mark_spans(VehicleDayStats.objects, 'day', 'day')
+    span = OwnerDayStats.objects.aggregate(start=Min('day'), end=Max('day'))
+    if span['start']:
+        mark(None, span['start'], span['end'])
+    return refresh(batch_size)
+
+
+def _money(value):
+    return str(value.quantize(CENT))
+
+
+def owner_stats(owner, start, end, vehicle=None):
+    """Booked days, utilization and revenue per day of ``owner``'s fleet, or of one of its vehicles.
+
+    Two queries: the fleet size and the rollup rows in the range.
+    """
+    if vehicle is None:
+        vehicles = Vehicle.objects.filter(owner=owner).count()
+        rows = OwnerDayStats.objects.filter(owner=owner, day__range=(start, end)).values_list('day', 'booked', 'revenue')
+    else:
+        vehicles = 1
+        rows = ((day, 1, revenue) for day, revenue in VehicleDayStats.objects.filter(
+            vehicle=vehicle, day__range=(start, end)).values_list('day', 'revenue'))
+    by_day = {day: (booked, revenue) for day, booked, revenue in rows}
+    series = []
+    for day in _days(start, end):
+        booked, revenue = by_day.get(day, (0, Decimal(0)))
+        series.append({'day': day.isoformat(), 'booked': booked, 'revenue': _money(revenue)})
+    booked_days = sum(booked for booked, _ in by_day.values())
+    capacity = vehicles * len(series)
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'vehicles': vehicles,
+        'booked_days': booked_days,
+        'utilization': round(booked_days / capacity, 4) if capacity else 0,
+        'revenue': _money(sum((revenue for _, revenue in by_day.values()), Decimal(0))),
+        'days': series,
+    }
@@ -0,0 +1,127 @@
+"""Full-text vehicle search over title, make, model and description.
+
+SQLite keeps an FTS5 index in ``rentals_vehicle_fts``, an external-content
+table that triggers on ``rentals_vehicle`` keep in step with every insert,
+update and delete (bulk_create and queryset.update() included); queries
+join it through the unmanaged VehicleSearchIndex model. Postgres
+uses a GIN index on the weighted ``tsvector`` expression below; queries
+repeat the exact expression so the planner can match the index. Other
+backends fall back to an unindexed ``icontains`` scan without ranking.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Lookup, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import VehicleSearchIndex
+
+FTS_TABLE = VehicleSearchIndex._meta.db_table
+# Relevance weights per column, in FTS5 column order.
+FTS_COLUMNS = (('title', 10.0), ('make', 4.0), ('model', 4.0), ('description', 1.0))
+# Longer queries rarely narrow results further and cost a doclist each.
+MAX_TOKENS = 8
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, make, model, description,
+        content='rentals_vehicle', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON rentals_vehicle BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, make, model, description)
+        VALUES (new.id, new.title, new.make, new.model, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON rentals_vehicle BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, make, model, description)
+        VALUES ('delete', old.id, old.title, old.make, old.model, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, make, model, description
+    ON rentals_vehicle BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, make, model, description)
+        VALUES ('delete', old.id, old.title, old.make, old.model, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, make, model, description)
+        VALUES (new.id, new.title, new.make, new.model, new.description);
+    END""",
+]
+
+
+@VehicleSearchIndex._meta.get_field('document').register_lookup
+class Match(Lookup):
+    """``document__match=query``: an FTS5 MATCH against the whole index."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+POSTGRES_CONFIG = 'english'
+POSTGRES_VECTOR = (
+    f"setweight(to_tsvector('{POSTGRES_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{POSTGRES_CONFIG}', coalesce(make, '') || ' ' || coalesce(model, '')), 'B') || "
+    f"setweight(to_tsvector('{POSTGRES_CONFIG}', coalesce(description, '')), 'C')"
+)
+POSTGRES_INDEX = 'vehicle_search_idx'
+
+
+def install_sqlite_search(connection, rebuild=False):
+    """Create the FTS5 table and triggers if missing.
+
+    Django rebuilds SQLite tables for many schema changes, which silently
+    drops their triggers, so this also runs after every migrate (see
+    signals.py). The indexed text is unchanged by a rebuild; ``rebuild`` is only
+    needed to index rows written while the triggers did not exist.
+    """
+    with connection.cursor() as cursor:
+        for statement in SQLITE_SCHEMA:
+            cursor.execute(statement)
+        if rebuild:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def search_tokens(text):
+    """Lower-cased word tokens; FTS operators and punctuation are dropped."""
+    return re.findall(r'\w+', text.lower())[:MAX_TOKENS]
+
+
+def search_vehicles(queryset, text):
+    """Vehicles matching every word of ``text`` (the last one as a prefix),
+    annotated with ``search_rank`` where higher is more relevant."""
+    tokens = search_tokens(text)
+    if not tokens:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{token}"' for token in tokens) + '*'
+        weights = ', '.join(str(weight) for _, weight in FTS_COLUMNS)
+        # bm25() is lower-is-better and only valid while joined to the MATCH.
+        return queryset.filter(search_index__document__match=match).annotate(
+            search_rank=RawSQL(f'-bm25({FTS_TABLE}, {weights})', [], output_field=FloatField()),
+        )
+    if vendor == 'postgresql':
+        tsquery = ' & '.join(tokens) + ':*'
+        return queryset.filter(RawSQL(
+            f'({POSTGRES_VECTOR}) @@ to_tsquery(%s, %s)', [POSTGRES_CONFIG, tsquery], output_field=BooleanField(),
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank_cd({POSTGRES_VECTOR}, to_tsquery(%s, %s))', [POSTGRES_CONFIG, tsquery],
+            output_field=FloatField(),
+        ))
+    for token in tokens:
+        queryset = queryset.filter(
+            Q(title__icontains=token) | Q(make__icontains=token)
+            | Q(model__icontains=token) | Q(description__icontains=token)
+        )
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+def prefix_range(prefix):
+    """``(low, high)`` bounds that select lower-cased values starting with ``prefix``.
+
+    A range on ``Lower(column)`` can use an expression index on every
+    backend, unlike ``LIKE``/``icontains``.
+    """
+    prefix = prefix.strip().lower()
+    if not prefix:
+        return None
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
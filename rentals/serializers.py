@@ -1,13 +1,30 @@
 from rest_framework import serializers
-from .models import Vehicle, Booking, VehicleImage
-from .utils import is_vehicle_available
+from rest_framework.settings import api_settings
+from .images import srcset, variant_urls
+from .models import ArchivedBooking, ArchivedPayment, ArchivedReview, Vehicle, Booking, Payment, VehicleImage
+from .utils import VehicleUnavailable, is_vehicle_available, reserve_vehicle
 from datetime import timedelta
 
 
 class VehicleImageSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = VehicleImage
-        fields = ('id', 'image', 'alt_text')
+        fields = ('id', 'image', 'alt_text', 'variants', 'srcset')
+
+    def _url(self, name):
+        # Same URLs as the ImageField: absolute when there is a request.
+        url = VehicleImage._meta.get_field('image').storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def get_variants(self, obj):
+        return variant_urls(obj.image.name, obj.variants, obj.variants_source, self._url)
+
+    def get_srcset(self, obj):
+        return srcset(self.get_variants(obj))
 
 
 class VehicleSerializer(serializers.ModelSerializer):
@@ -15,7 +32,7 @@ class VehicleSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Vehicle
-        fields = '__all__'
+        exclude = ('geohash', 'rating_sum')
 
 
 class VehicleDetailSerializer(serializers.ModelSerializer):
@@ -23,7 +40,7 @@ class VehicleDetailSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Vehicle
-        fields = '__all__'
+        exclude = ('geohash', 'rating_sum')
 
 
 class BookingCreateSerializer(serializers.ModelSerializer):
@@ -47,15 +64,11 @@ class BookingCreateSerializer(serializers.ModelSerializer):
         end = validated_data['end_date']
         days = (end - start).days + 1  # inclusive of end_date
         total = vehicle.price_per_day * days + vehicle.deposit
-        booking = Booking.objects.create(
-            user=self.context['request'].user,
-            vehicle=vehicle,
-            start_date=start,
-            end_date=end,
-            total_price=total,
-            status='pending'
-        )
-        return booking
+        # validate() is only a fast pre-check; reserve_vehicle re-checks under a lock.
+        try:
+            return reserve_vehicle(self.context['request'].user, vehicle, start, end, total)
+        except VehicleUnavailable:
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Vehicle not available for these dates']})
 
 
 class BookingSerializer(serializers.ModelSerializer):
@@ -64,3 +77,37 @@ class BookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
         fields = '__all__'
+
+
+class PaymentStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = ('paid', 'paid_at', 'amount')
+
+
+class DashboardBookingSerializer(BookingSerializer):
+    """A booking as the dashboard shows it, with its payment status (null before checkout)."""
+    payment = PaymentStatusSerializer(read_only=True)
+
+
+class ArchivedPaymentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedPayment
+        fields = ('paid', 'paid_at', 'amount')
+
+
+class ArchivedReviewSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedReview
+        fields = ('rating', 'comment', 'created_at')
+
+
+class ArchivedBookingSerializer(serializers.ModelSerializer):
+    """A booking from the user's history; payment and review are null when there were none."""
+    vehicle = VehicleSerializer(read_only=True)
+    payment = ArchivedPaymentSerializer(read_only=True)
+    review = ArchivedReviewSerializer(read_only=True)
+
+    class Meta:
+        model = ArchivedBooking
+        fields = '__all__'
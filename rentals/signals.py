@@ -0,0 +1,142 @@
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .cache import bump_catalog_version, bump_version, user_auth_version_key
+from .images import delete_variants, schedule_variants, variant_paths
+from .models import Booking, Payment, Review, Vehicle, VehicleImage
+from .rollups import BOOKED_STATUSES, mark as mark_rollup, mark_owner_days
+from .search import install_sqlite_search
+from .usernames import username_index
+from .vehicle_stats import add_completed, add_ratings, is_frozen as stats_frozen
+
+
+@receiver([post_save, post_delete], sender=Vehicle)
+@receiver([post_save, post_delete], sender=VehicleImage)
+def invalidate_catalog(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=VehicleImage)
+def resize_vehicle_image(sender, instance, raw=False, **kwargs):
+    if not raw and instance.image and instance.variants_source != instance.image.name:
+        schedule_variants(instance.pk)
+
+
+@receiver(post_delete, sender=VehicleImage)
+def delete_vehicle_image_variants(sender, instance, **kwargs):
+    paths = variant_paths(instance.variants)
+    if paths:
+        storage = instance.image.storage
+        transaction.on_commit(lambda: delete_variants(storage, paths))
+
+
+@receiver(post_save, sender=Booking)
+def count_completed_booking(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    if created:
+        before = None
+    elif hasattr(instance, '_loaded_status'):
+        before = instance._loaded_status
+    else:
+        return  # Not loaded from the database, so the previous status is unknown.
+    delta = (instance.status == 'completed') - (before == 'completed')
+    if delta:
+        add_completed({instance.vehicle_id: delta})
+
+
+@receiver(post_delete, sender=Booking)
+def uncount_completed_booking(sender, instance, **kwargs):
+    if instance.status == 'completed' and not stats_frozen():
+        add_completed({instance.vehicle_id: -1})
+
+
+def _review_vehicle_id(review):
+    return Booking.objects.filter(pk=review.booking_id).values_list('vehicle_id', flat=True).first()
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, **kwargs):
+    if created:
+        count_delta, sum_delta = 1, instance.rating
+    else:
+        count_delta, sum_delta = 0, instance.rating - getattr(instance, '_loaded_rating', instance.rating)
+    if count_delta or sum_delta:
+        add_ratings(_review_vehicle_id(instance), count_delta, sum_delta)
+    instance._loaded_rating = instance.rating
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    if not stats_frozen():
+        rating = getattr(instance, '_loaded_rating', instance.rating)
+        add_ratings(_review_vehicle_id(instance), -1, -rating)
+
+
+@receiver(post_save, sender=Booking)
+def mark_booking_days(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not {'status', 'start_date', 'end_date'}.intersection(update_fields):
+        return
+    before = None if created else getattr(instance, '_loaded_status', None)
+    if instance.status in BOOKED_STATUSES or before in BOOKED_STATUSES:
+        mark_rollup(instance.vehicle_id, instance.start_date, instance.end_date)
+        loaded = getattr(instance, '_loaded_dates', None)
+        if not created and loaded and loaded != (instance.start_date, instance.end_date):
+            mark_rollup(instance.vehicle_id, *loaded)
+
+
+@receiver(post_delete, sender=Booking)
+def unmark_booking_days(sender, instance, **kwargs):
+    if instance.status in BOOKED_STATUSES and not stats_frozen():
+        mark_rollup(instance.vehicle_id, instance.start_date, instance.end_date)
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def mark_payment_days(sender, instance, signal, **kwargs):
+    if instance.paid and not (signal is post_delete and stats_frozen()):
+        booking = instance.booking
+        mark_rollup(booking.vehicle_id, booking.start_date, booking.end_date)
+
+
+@receiver(post_save, sender=Vehicle)
+def mark_owner_change(sender, instance, created, **kwargs):
+    if not created and getattr(instance, '_loaded_owner_id', instance.owner_id) != instance.owner_id:
+        mark_owner_days(instance.pk)
+
+
+@receiver(pre_delete, sender=Vehicle)
+def mark_deleted_vehicle_days(sender, instance, **kwargs):
+    # Its stats rows go with it; the owner totals for those days need re-summing.
+    mark_owner_days(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_user_auth(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which cached authentication never serves stale.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump_version(user_auth_version_key(instance.pk))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def index_username(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    username_index.saved(instance, created)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token_auth(sender, instance, **kwargs):
+    bump_version(user_auth_version_key(instance.user_id))
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    # SQLite table rebuilds in later migrations drop the FTS triggers.
+    connection = connections[using]
+    if sender.name == 'rentals' and connection.vendor == 'sqlite' \
+            and Vehicle._meta.db_table in connection.introspection.table_names():
+        install_sqlite_search(connection)
@@ -1,11 +1,50 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.core.management.base import CommandError
+from django.db.transaction import TransactionManagementError
+from io import StringIO
+import csv
+import json
+import os
+import tempfile
 from django.contrib.auth import get_user_model
-from .models import Vehicle, Booking
-from .utils import is_vehicle_available
+from django.contrib.admin.sites import site as admin_site
+from .models import ArchivedBooking, ArchivedPayment, OwnerDayStats, RollupMark, Vehicle, VehicleDayStats, VehicleImage, Booking, Payment, Review, WebhookEvent
+from .utils import is_vehicle_available, filter_available, lock_vehicle, month_calendar, reserve_vehicle
+from .management.commands.benchmark_api import percentile
+from .management.commands.stress_bookings import count_overlaps
+from .cache import bump_catalog_version, bump_version, catalog_cache_stats
+from .payments import get_or_create_checkout_session
+from .holds import HoldExpired
+from .archive import archive_bookings, months_before
+from .vehicle_stats import recompute
+from .rollups import rebuild, refresh
+from .images import variant_paths
+from .jobs import apply_webhooks, run_job
+from .webhooks import MAX_ATTEMPTS, backlog_stats, process_batch, process_event
+from .metrics import MetricsStore, get_store as get_metrics_store, merge, render as render_metrics
+from . import authentication
+from .authentication import VERSION_CHECK_SECONDS as AUTH_VERSION_CHECK_SECONDS, TokenLRU
+from .usernames import RESYNC_SECONDS, USERNAMES_RELOAD_KEY, USERNAMES_VERSION_KEY, VERSION_CHECK_SECONDS, BloomFilter, username_index
+from .geo import cover, encode as geohash_encode, radius_box
+from .fast_serializers import booking_values_serializer, vehicle_values_serializer
+from .serializers import BookingSerializer, DashboardBookingSerializer, VehicleSerializer
 from datetime import date, timedelta
-from rest_framework.test import APIClient
-from django.urls import reverse
+from decimal import Decimal
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.throttling import ScopedRateThrottle
+from django.core.cache import cache
+from django.conf import settings
+from django.urls import resolve, reverse
+from django.utils import timezone
 import stripe
+import time
 from unittest import mock
 
 
@@ -81,7 +120,7 @@ class APITests(TestCase):
 
         # mock stripe.checkout.Session.create
         with mock.patch('rentals.views.stripe.checkout.Session.create') as mock_create:
-            mock_create.return_value = mock.MagicMock(id='sess_123')
+            mock_create.return_value = mock.MagicMock(id='sess_123', expires_at=int(time.time()) + 3600)
             url2 = reverse('create-checkout')
             resp2 = self.client.post(url2, {'booking_id': booking_id}, format='json')
             self.assertEqual(resp2.status_code, 200)
@@ -89,11 +128,1508 @@ class APITests(TestCase):
     def test_stripe_webhook_marks_booking_confirmed(self):
         # create a pending booking
         b = Booking.objects.create(user=self.user, vehicle=self.vehicle, start_date=date(2025,11,20), end_date=date(2025,11,22), total_price=90)
-        payload = {'type': 'checkout.session.completed', 'data': {'object': {'metadata': {'booking_id': str(b.id)}, 'payment_intent': 'pi_123'}}}
+        payload = {'id': 'evt_123', 'type': 'checkout.session.completed', 'data': {'object': {'metadata': {'booking_id': str(b.id)}, 'payment_intent': 'pi_123'}}}
         # mock stripe.Webhook.construct_event to return payload
         with mock.patch('rentals.views.stripe.Webhook.construct_event', return_value=payload):
             url = reverse('stripe-webhook')
             resp = self.client.post(url, data=b'{}', content_type='application/json', HTTP_STRIPE_SIGNATURE='sig')
             self.assertEqual(resp.status_code, 200)
+            # the view only stores the event; the worker applies it
+            b.refresh_from_db()
+            self.assertEqual(b.status, 'pending')
+            call_command('process_webhooks', stdout=StringIO())
             b.refresh_from_db()
             self.assertEqual(b.status, 'confirmed')
+            self.assertTrue(b.payment.paid)
+
+
+class VehicleDateFilterTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('df', 'df@example.com', 'pass')
+        self.booked = Vehicle.objects.create(type='car', title='Booked', price_per_day=10, deposit=0, seats=4)
+        self.free = Vehicle.objects.create(type='car', title='Free', price_per_day=10, deposit=0, seats=4)
+        self.cancelled = Vehicle.objects.create(type='bike', title='Cancelled', price_per_day=10, deposit=0, seats=1)
+        Booking.objects.create(user=self.user, vehicle=self.booked, start_date=date(2025,6,10), end_date=date(2025,6,15), total_price=60)
+        Booking.objects.create(user=self.user, vehicle=self.cancelled, start_date=date(2025,6,10), end_date=date(2025,6,15), total_price=60, status='cancelled')
+        self.client = APIClient()
+
+    def _titles(self, params):
+        resp = self.client.get(reverse('vehicle-list'), params)
+        self.assertEqual(resp.status_code, 200)
+        return {v['title'] for v in resp.data['results']}
+
+    def test_overlapping_booking_excluded(self):
+        self.assertEqual(self._titles({'start_date': '2025-06-12', 'end_date': '2025-06-20'}), {'Free', 'Cancelled'})
+
+    def test_non_overlapping_range_returns_all(self):
+        self.assertEqual(self._titles({'start_date': '2025-06-16', 'end_date': '2025-06-20'}), {'Booked', 'Free', 'Cancelled'})
+
+    def test_single_date(self):
+        self.assertEqual(self._titles({'start_date': '2025-06-15'}), {'Free', 'Cancelled'})
+
+    def test_invalid_dates_ignored(self):
+        self.assertEqual(len(self._titles({'start_date': 'nope', 'end_date': '2025-13-40'})), 3)
+
+    def test_filter_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            ids = list(filter_available(Vehicle.objects.all(), date(2025,6,1), date(2025,6,30)).values_list('id', flat=True))
+        self.assertEqual(sorted(ids), sorted([self.free.id, self.cancelled.id]))
+
+
+class QueryBudgetTests(TestCase):
+    """Endpoints must cost a fixed number of queries regardless of page size."""
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('qb', 'qb@example.com', 'pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _make_vehicles(self, n):
+        vehicles = []
+        for i in range(n):
+            v = Vehicle.objects.create(type='car', title=f'V{i}', price_per_day=10, deposit=0, seats=4)
+            VehicleImage.objects.create(vehicle=v, image='vehicles/images.jpeg', alt_text=f'img {i}')
+            VehicleImage.objects.create(vehicle=v, image='vehicles/images.jpeg', alt_text=f'img {i}b')
+            vehicles.append(v)
+        return vehicles
+
+    def _make_bookings(self, vehicles):
+        for i, v in enumerate(vehicles):
+            Booking.objects.create(user=self.user, vehicle=v, start_date=date(2025,1,1) + timedelta(days=i), end_date=date(2025,1,1) + timedelta(days=i), total_price=10)
+
+    def test_vehicle_list_budget(self):
+        for n in (1, 10):
+            Vehicle.objects.all().delete()
+            self._make_vehicles(n)
+            # count + vehicles + images
+            with self.assertNumQueries(3):
+                resp = self.client.get(reverse('vehicle-list'))
+            self.assertEqual(len(resp.data['results']), n)
+            self.assertEqual(len(resp.data['results'][0]['images']), 2)
+
+    def test_vehicle_detail_budget(self):
+        v = self._make_vehicles(1)[0]
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('vehicle-detail', args=[v.id]))
+        self.assertEqual(len(resp.data['images']), 2)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_booking_list_budget(self):
+        for n in (1, 10):
+            Vehicle.objects.all().delete()
+            self._make_bookings(self._make_vehicles(n))
+            # validators + count + bookings joined to vehicles + images
+            with self.assertNumQueries(4):
+                resp = self.client.get(reverse('booking-list'))
+            self.assertEqual(len(resp.data['results']), n)
+            self.assertEqual(len(resp.data['results'][0]['vehicle']['images']), 2)
+
+    def test_booking_detail_budget(self):
+        self._make_bookings(self._make_vehicles(1))
+        booking = Booking.objects.get()
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('booking-detail', args=[booking.id]))
+        self.assertEqual(resp.data['vehicle']['title'], 'V0')
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('kp', 'kp@example.com', 'pass')
+        # 25 vehicles sharing one created_at so the id tie-breaker matters.
+        Vehicle.objects.bulk_create([
+            Vehicle(type='car', title=f'K{i}', price_per_day=10, deposit=0, seats=4) for i in range(25)
+        ])
+        Vehicle.objects.update(created_at=Vehicle.objects.first().created_at)
+        # Bulk writes skip the post_save signal that invalidates the catalog cache.
+        bump_catalog_version()
+        self.client = APIClient()
+
+    def _walk(self, url):
+        seen = []
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotIn('previous', resp.data)
+            seen.extend(item['id'] for item in resp.data['results'])
+            url = resp.data['next']
+        return seen
+
+    def test_cursor_walk_visits_every_vehicle_once(self):
+        seen = self._walk(reverse('vehicle-list') + '?cursor=')
+        self.assertEqual(seen, sorted(Vehicle.objects.values_list('id', flat=True)))
+
+    def test_cursor_page_skips_count_query(self):
+        # vehicles + images only
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('vehicle-list'), {'cursor': ''})
+        self.assertNotIn('count', resp.data)
+        self.assertEqual(len(resp.data['results']), 10)
+
+    def test_count_estimate(self):
+        resp = self.client.get(reverse('vehicle-list'), {'cursor': '', 'count': 'estimate'})
+        self.assertEqual(resp.data['count'], 25)
+        self.assertFalse(resp.data['count_capped'])
+        self.assertNotIn('count=', resp.data['next'])
+
+    def test_count_estimate_reports_cap(self):
+        with mock.patch('rentals.pagination.ESTIMATE_CAP', 10):
+            resp = self.client.get(reverse('vehicle-list'), {'cursor': '', 'count': 'estimate'})
+        self.assertEqual(resp.data['count'], 10)
+        self.assertTrue(resp.data['count_capped'])
+
+    def test_booking_cursor_walk_is_newest_first(self):
+        v = Vehicle.objects.first()
+        for i in range(12):
+            Booking.objects.create(user=self.user, vehicle=v, start_date=date(2025,1,1), end_date=date(2025,1,1), total_price=10)
+        self.client.force_authenticate(self.user)
+        seen = self._walk(reverse('booking-list') + '?cursor=')
+        self.assertEqual(seen, sorted(Booking.objects.values_list('id', flat=True), reverse=True))
+
+    def test_invalid_cursor(self):
+        resp = self.client.get(reverse('vehicle-list'), {'cursor': 'garbage!'})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_page_number_mode_unchanged(self):
+        resp = self.client.get(reverse('vehicle-list'), {'page': 3})
+        self.assertEqual(resp.data['count'], 25)
+        self.assertEqual(len(resp.data['results']), 5)
+
+
+@override_settings(SHARED_CACHE=True)
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        self.vehicle = Vehicle.objects.create(type='car', title='Cached', price_per_day=10, deposit=0, seats=4)
+        self.client = APIClient()
+
+    def test_repeat_request_served_from_cache(self):
+        url = reverse('vehicle-list')
+        first = self.client.get(url, {'type': 'car', 'seats': 4})
+        before = catalog_cache_stats()
+        # Same params in a different order hit the same entry.
+        with self.assertNumQueries(0):
+            second = self.client.get(url + '?seats=4&type=car&format=json')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(catalog_cache_stats()['hits'], before['hits'] + 1)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_process_local_cache_is_skipped(self):
+        url = reverse('vehicle-list')
+        self.client.get(url)
+        before = catalog_cache_stats()
+        resp = self.client.get(url)
+        self.assertEqual(catalog_cache_stats(), before)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_vehicle_save_invalidates(self):
+        url = reverse('vehicle-detail', args=[self.vehicle.id])
+        self.client.get(url)
+        self.vehicle.title = 'Renamed'
+        self.vehicle.save()
+        self.assertEqual(self.client.get(url).data['title'], 'Renamed')
+
+    def test_image_delete_invalidates(self):
+        image = VehicleImage.objects.create(vehicle=self.vehicle, image='vehicles/images.jpeg')
+        url = reverse('vehicle-list')
+        self.assertEqual(len(self.client.get(url).data['results'][0]['images']), 1)
+        image.delete()
+        self.assertEqual(self.client.get(url).data['results'][0]['images'], [])
+
+    def test_date_filtered_lists_bypass_cache(self):
+        url = reverse('vehicle-list')
+        params = {'start_date': '2025-06-01', 'end_date': '2025-06-02'}
+        self.client.get(url, params)
+        with self.assertNumQueries(3):
+            self.client.get(url, params)
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('vehicle-list'))
+        resp = self.client.get(reverse('catalog-cache-metrics'), HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b'rentals_catalog_cache_misses_total', resp.content)
+
+
+@override_settings(SHARED_CACHE=True)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('cg', 'cg@example.com', 'pass')
+        self.vehicle = Vehicle.objects.create(type='car', title='Etag', price_per_day=10, deposit=0, seats=4)
+        self.client = APIClient()
+
+    def test_vehicle_list_not_modified(self):
+        url = reverse('vehicle-list')
+        first = self.client.get(url)
+        etag = first['ETag']
+        with self.assertNumQueries(0):
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        resp = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(resp.status_code, 304)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_no_validators_without_shared_cache(self):
+        # Another process's catalog change would never move this one's version.
+        self.assertNotIn('ETag', self.client.get(reverse('vehicle-list')))
+        self.client.force_authenticate(self.user)
+        self.assertNotIn('ETag', self.client.get(reverse('booking-list')))
+
+    def test_vehicle_change_yields_new_etag(self):
+        url = reverse('vehicle-detail', args=[self.vehicle.id])
+        etag = self.client.get(url)['ETag']
+        self.vehicle.price_per_day = 12
+        self.vehicle.save()
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+
+    def test_missing_vehicle_has_no_validators(self):
+        resp = self.client.get(reverse('vehicle-detail', args=[self.vehicle.id + 100]))
+        self.assertEqual(resp.status_code, 404)
+        self.assertFalse(resp.has_header('ETag'))
+
+    def test_my_bookings_see_bulk_updates_and_deletes(self):
+        booking = Booking.objects.create(user=self.user, vehicle=self.vehicle, start_date=date(2025,4,1), end_date=date(2025,4,2), total_price=20)
+        self.client.force_authenticate(self.user)
+        url = reverse('booking-list')
+        first = self.client.get(url)
+        self.assertIn('private', first['Cache-Control'])
+        # Only the validators' aggregate, which sees changes made by any process.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        Booking.objects.filter(pk=booking.pk).update(status='cancelled', updated_at=timezone.now())
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['results'][0]['status'], 'cancelled')
+        etag = resp['ETag']
+        booking.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_my_bookings_revalidate_after_cancel(self):
+        booking = Booking.objects.create(user=self.user, vehicle=self.vehicle, start_date=date(2025,4,1), end_date=date(2025,4,2), total_price=20)
+        self.client.force_authenticate(self.user)
+        url = reverse('booking-list')
+        first = self.client.get(url)
+        self.client.post(reverse('cancel-booking', args=[booking.id]))
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['results'][0]['status'], 'cancelled')
+
+    def test_my_bookings_etag_is_per_user(self):
+        other = get_user_model().objects.create_user('cg2', 'cg2@example.com', 'pass')
+        self.client.force_authenticate(self.user)
+        etag = self.client.get(reverse('booking-list'))['ETag']
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(reverse('booking-list'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class FastSerializerTests(TestCase):
+    """The values-based serializers must render byte-identical JSON to DRF."""
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('fs', 'fs@example.com', 'pass')
+        self.full = Vehicle.objects.create(
+            owner=self.user, type='bike', title='Vélo électrique', description='Line one\nline "two"', make='Ather',
+            model='450X', year=2023, seats=2, price_per_day='12.5', deposit='1000', location_city='Pune',
+            location_state='MH',
+        )
+        self.bare = Vehicle.objects.create(type='car', title='Bare', price_per_day=30, seats=4)
+        VehicleImage.objects.create(vehicle=self.full, image='vehicles/images.jpeg', alt_text='front')
+        VehicleImage.objects.create(vehicle=self.full, image='vehicles/images.jpeg')
+        Booking.objects.create(user=self.user, vehicle=self.full, start_date=date(2025,5,1), end_date=date(2025,5,3), total_price='1037.50')
+        Booking.objects.create(user=self.user, vehicle=self.bare, start_date=date(2025,6,1), end_date=date(2025,6,1), total_price=30, status='confirmed')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.request = Request(APIRequestFactory().get('/', HTTP_HOST='testserver'))
+
+    def _drf_bytes(self, serializer_class, queryset):
+        data = serializer_class(queryset, many=True, context={'request': self.request}).data
+        return JSONRenderer().render(data)
+
+    def test_vehicles_match_drf(self):
+        queryset = Vehicle.objects.order_by('id')
+        rows = list(vehicle_values_serializer.rows(queryset))
+        fast = JSONRenderer().render(vehicle_values_serializer.serialize(rows, self.request))
+        self.assertEqual(fast, self._drf_bytes(VehicleSerializer, queryset))
+
+    def test_bookings_match_drf(self):
+        queryset = Booking.objects.order_by('id')
+        rows = list(booking_values_serializer.rows(queryset))
+        fast = JSONRenderer().render(booking_values_serializer.serialize(rows, self.request))
+        self.assertEqual(fast, self._drf_bytes(BookingSerializer, queryset))
+
+    def test_endpoints_match_drf(self):
+        resp = self.client.get(reverse('vehicle-detail', args=[self.full.id]))
+        drf = VehicleSerializer(self.full, context={'request': resp.wsgi_request}).data
+        self.assertEqual(resp.content, JSONRenderer().render(drf))
+        resp = self.client.get(reverse('booking-list'))
+        self.assertEqual(resp.data['count'], 2)
+        drf = BookingSerializer(Booking.objects.order_by('-created_at'), many=True, context={'request': resp.wsgi_request}).data
+        self.assertEqual(JSONRenderer().render(resp.data['results']), JSONRenderer().render(drf))
+
+    def test_unquantized_decimal_uses_drf_rounding(self):
+        row = dict(next(iter(vehicle_values_serializer.rows(Vehicle.objects.filter(pk=self.bare.pk)))))
+        row['price_per_day'] = Decimal('12.345')
+        expected = VehicleSerializer().fields['price_per_day'].to_representation(Decimal('12.345'))
+        self.assertEqual(vehicle_values_serializer.serialize([row])[0]['price_per_day'], expected)
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+    def test_threads_never_double_book(self):
+        out = StringIO()
+        call_command('stress_bookings', threads=6, attempts=15, vehicles=2, days=10, keep=True, stdout=out)
+        vehicle_ids = list(Vehicle.objects.filter(title__startswith='Stress vehicle').values_list('id', flat=True))
+        self.assertEqual(count_overlaps(vehicle_ids), 0)
+        self.assertIn('database errors: 0', out.getvalue())
+        # 10-day window, 2 vehicles: most of the 90 attempts must be turned away.
+        self.assertGreater(Booking.objects.count(), 0)
+        self.assertLessEqual(Booking.objects.count(), 20)
+
+    def test_lock_requires_atomic_block(self):
+        vehicle = Vehicle.objects.create(type='car', title='L', price_per_day=10, seats=4)
+        with self.assertRaises(TransactionManagementError):
+            lock_vehicle(vehicle.pk)
+
+
+class WebhookInboxTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('wh', 'wh@example.com', 'pass')
+        self.vehicle = Vehicle.objects.create(type='car', title='W', price_per_day=30, seats=4)
+        self.booking = Booking.objects.create(user=self.user, vehicle=self.vehicle, start_date=date(2025,8,1), end_date=date(2025,8,2), total_price=60)
+        self.client = APIClient()
+
+    def _post(self, event):
+        with mock.patch('rentals.views.stripe.Webhook.construct_event', return_value=event):
+            return self.client.post(reverse('stripe-webhook'), data=b'{}', content_type='application/json', HTTP_STRIPE_SIGNATURE='sig')
+
+    def _completed(self, event_id, booking_id=None):
+        metadata = {'booking_id': str(booking_id or self.booking.id)}
+        return {'id': event_id, 'type': 'checkout.session.completed', 'data': {'object': {'metadata': metadata, 'payment_intent': 'pi_1'}}}
+
+    def test_retried_delivery_is_stored_once(self):
+        for _ in range(3):
+            self.assertEqual(self._post(self._completed('evt_dup')).status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(process_batch(), 1)
+        self.assertEqual(process_batch(), 0)
+        payment = Payment.objects.get(booking=self.booking)
+        self.assertTrue(payment.paid)
+        self.assertEqual(payment.amount, 60)
+        self.assertIsNotNone(payment.paid_at)
+
+    def test_webhook_request_does_no_booking_writes(self):
+        with mock.patch('rentals.webhooks.handle_checkout_completed') as handler:
+            self._post(self._completed('evt_fast'))
+        handler.assert_not_called()
+
+    def test_batches_and_backlog(self):
+        for n in range(5):
+            self._post(self._completed(f'evt_{n}'))
+        self._post({'id': 'evt_other', 'type': 'customer.created', 'data': {'object': {}}})
+        self.assertEqual(backlog_stats()['pending'], 6)
+        self.assertEqual(process_batch(batch_size=4), 4)
+        self.assertEqual(backlog_stats()['pending'], 2)
+        self.assertEqual(process_batch(batch_size=4), 2)
+        self.assertEqual(backlog_stats(), {'pending': 0, 'lag_seconds': 0.0, 'failed': 0})
+
+    def test_failing_event_is_retried_then_parked(self):
+        self._post(self._completed('evt_bad'))
+        with mock.patch('rentals.webhooks.HANDLERS', {'checkout.session.completed': mock.Mock(side_effect=RuntimeError('boom'))}):
+            for _ in range(MAX_ATTEMPTS + 1):
+                process_batch()
+        event = WebhookEvent.objects.get()
+        self.assertIsNone(event.processed_at)
+        self.assertEqual(event.attempts, MAX_ATTEMPTS)
+        self.assertIn('boom', event.last_error)
+        self.assertEqual(backlog_stats()['failed'], 1)
+
+    def test_event_transaction_locks_vehicle_first(self):
+        self._post(self._completed('evt_lock'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(process_batch(), 1)
+        sql = [query['sql'] for query in ctx.captured_queries]
+        opened = next(n for n, statement in enumerate(sql) if statement.startswith('SAVEPOINT'))
+        self.assertIn('UPDATE "rentals_vehicle"', sql[opened + 1])
+        self.assertEqual(Booking.objects.get(pk=self.booking.pk).status, 'confirmed')
+
+    def test_in_process_job_runs_once_per_lease(self):
+        cache.clear()
+        self._post(self._completed('evt_job'))
+        self.assertTrue(run_job('webhooks', 60, apply_webhooks))
+        self.assertEqual(Booking.objects.get(pk=self.booking.pk).status, 'confirmed')
+        # Another process (or this one) within the interval finds the lease taken.
+        job = mock.Mock()
+        self.assertFalse(run_job('webhooks', 60, job))
+        job.assert_not_called()
+        cache.delete('jobs:webhooks')
+        self.assertTrue(run_job('webhooks', 60, mock.Mock(side_effect=RuntimeError('boom'))))
+
+    def test_claimed_event_is_skipped(self):
+        self._post(self._completed('evt_once'))
+        event = WebhookEvent.objects.get()
+        args = (event.pk, event.event_id, event.type, event.payload)
+        self.assertTrue(process_event(*args))
+        self.assertFalse(process_event(*args))
+        self.assertEqual(WebhookEvent.objects.get().attempts, 1)
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_metrics_endpoint(self):
+        self._post(self._completed('evt_m'))
+        resp = self.client.get(reverse('webhook-metrics'), HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertIn(b'rentals_webhook_pending_events 1', resp.content)
+
+
+class FakeStripe:
+    """Stands in for the stripe module in checkout tests."""
+
+    def __init__(self):
+        self.calls = []
+        self.sessions = {}
+        self.checkout = mock.Mock()
+        self.checkout.Session.create.side_effect = self._create
+
+    def _create(self, idempotency_key, **params):
+        self.calls.append(idempotency_key)
+        if idempotency_key not in self.sessions:
+            self.sessions[idempotency_key] = mock.Mock(id=f'cs_{len(self.sessions) + 1}', expires_at=int(time.time()) + 24 * 3600)
+        return self.sessions[idempotency_key]
+
+
+class CheckoutSessionReuseTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('co', 'co@example.com', 'pass')
+        self.vehicle = Vehicle.objects.create(type='car', title='C', price_per_day=30, seats=4)
+        self.booking = Booking.objects.create(user=self.user, vehicle=self.vehicle, start_date=date(2025,9,1), end_date=date(2025,9,2), total_price=60)
+        self.stripe = FakeStripe()
+
+    def _checkout(self):
+        return get_or_create_checkout_session(self.booking, 'https://x/ok', 'https://x/cancel', client=self.stripe)
+
+    def test_open_session_is_reused(self):
+        first = self._checkout()
+        with self.assertNumQueries(1):
+            self.assertEqual(self._checkout(), first)
+        self.assertEqual(len(self.stripe.calls), 1)
+        payment = Payment.objects.get(booking=self.booking)
+        self.assertEqual(payment.stripe_session_id, first)
+        self.assertGreater(payment.stripe_session_expires_at, timezone.now())
+
+    def test_expired_session_is_replaced(self):
+        first = self._checkout()
+        Payment.objects.filter(booking=self.booking).update(stripe_session_expires_at=timezone.now() - timedelta(minutes=1))
+        second = self._checkout()
+        self.assertNotEqual(second, first)
+        self.assertEqual(len(set(self.stripe.calls)), 2)
+
+    def test_price_change_gets_new_session(self):
+        first = self._checkout()
+        self.booking.total_price = 90
+        self.booking.save()
+        self.assertNotEqual(self._checkout(), first)
+
+    def test_concurrent_misses_share_idempotency_key(self):
+        # Both requests saw no stored session; Stripe dedupes on the key.
+        with mock.patch('rentals.payments.Payment.objects.filter') as no_payment:
+            no_payment.return_value.first.return_value = None
+            self.assertEqual(self._checkout(), self._checkout())
+        self.assertEqual(len(self.stripe.calls), 2)
+        self.assertEqual(len(self.stripe.sessions), 1)
+
+
+class BookingExportTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('ex', 'ex@example.com', 'pass')
+        vehicles = [Vehicle.objects.create(type='car', title=f'E{i}', price_per_day=10, seats=4) for i in range(3)]
+        for i, v in enumerate(vehicles):
+            Booking.objects.create(user=self.user, vehicle=v, start_date=date(2025,1,1 + i), end_date=date(2025,1,2 + i), total_price=20, status='confirmed' if i else 'pending')
+
+    def _admin_export(self, queryset):
+        return admin_site._registry[Booking].export_csv(None, queryset)
+
+    def test_admin_export_streams_with_one_query(self):
+        response = self._admin_export(Booking.objects.all())
+        self.assertTrue(response.streaming)
+        with self.assertNumQueries(1):
+            body = b''.join(response.streaming_content).decode()
+        lines = body.splitlines()
+        self.assertEqual(lines[0], 'id,vehicle,user,start_date,end_date,total_price,status')
+        first = Booking.objects.order_by('id').first()
+        self.assertEqual(lines[1], f'{first.id},{first.vehicle},ex,2025-01-01,2025-01-02,20.00,pending')
+        self.assertEqual(len(lines), 4)
+
+    def test_command_jsonl_with_filters(self):
+        out = StringIO()
+        call_command('export_bookings', format='jsonl', status=['confirmed'], since='2025-01-03', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r['vehicle'] for r in rows], ['E2 (car)'])
+        self.assertEqual(rows[0]['total_price'], '20.00')
+
+    def test_command_writes_csv_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bookings.csv')
+            err = StringIO()
+            call_command('export_bookings', output=path, chunk_size=1, stderr=err)
+            with open(path, newline='') as f:
+                self.assertEqual(len(list(csv.reader(f))), 4)
+        self.assertIn('Wrote 3 bookings', err.getvalue())
+
+
+class GenerateLoadDataTests(TestCase):
+    def _generate(self, **options):
+        call_command('generate_load_data', users=20, vehicles=5, bookings=200, batch_size=64, seed=7, stdout=StringIO(), **options)
+        return list(Booking.objects.order_by('id').values_list('vehicle__title', 'start_date', 'end_date', 'status', 'total_price'))
+
+    def test_deterministic_and_non_overlapping(self):
+        first = self._generate()
+        self.assertEqual(len(first), 200)
+        self.assertEqual(count_overlaps(list(Vehicle.objects.values_list('id', flat=True))), 0)
+        self.assertTrue(Booking.objects.filter(status='completed').exists())
+        self.assertTrue(Booking.objects.filter(created_at__lt=timezone.now() - timedelta(days=1)).exists())
+        pending = Booking.objects.filter(status='pending')
+        self.assertTrue(pending.exists())
+        self.assertFalse(pending.filter(hold_expires_at__isnull=True).exists())
+        self.assertFalse(pending.filter(hold_expires_at__lte=timezone.now()).exists())
+        booked = Booking.objects.filter(status__in=['confirmed', 'completed'])
+        self.assertEqual(Payment.objects.filter(paid=True).count(), booked.count())
+        self.assertFalse(booked.filter(payment__isnull=True).exists())
+        # bulk_create marks no rollup days; --rollups (or refresh_rollups --full) fills them.
+        self.assertFalse(OwnerDayStats.objects.exists())
+        Booking.objects.all().delete()
+        Vehicle.objects.all().delete()
+        get_user_model().objects.filter(username__startswith='loaduser').delete()
+        self.assertEqual(self._generate(rollups=True), first)
+        self.assertTrue(OwnerDayStats.objects.exclude(revenue=0).exists())
+
+    def test_refuses_existing_prefix(self):
+        get_user_model().objects.create_user('loaduser0')
+        with self.assertRaises(CommandError):
+            call_command('generate_load_data', users=1, vehicles=1, bookings=0, stdout=StringIO())
+
+
+class BenchmarkApiTests(TestCase):
+    def test_in_process_report(self):
+        for i in range(3):
+            Vehicle.objects.create(type='bike', title=f'BA{i}', price_per_day=10, seats=1, location_city='Pune')
+        out = StringIO()
+        scenarios = ['vehicle_list', 'vehicle_detail', 'booking_create', 'my_bookings', 'booking_cancel']
+        call_command('benchmark_api', requests=5, warmup=1, scenario=scenarios, stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['meta']['mode'], 'wsgi')
+        self.assertEqual(list(report['scenarios']), scenarios)
+        for name, result in report['scenarios'].items():
+            self.assertEqual(set(result['latency_ms']), {'p50', 'p95', 'p99', 'mean'})
+            self.assertIsNotNone(result['db_queries_per_request'])
+        self.assertEqual(report['scenarios']['booking_create']['statuses'], {'201': 5})
+        self.assertEqual(report['scenarios']['booking_cancel']['statuses'], {'200': 5})
+        # benchmark bookings are cleaned up afterwards
+        self.assertFalse(Booking.objects.exists())
+
+    def test_rejects_zero_requests(self):
+        Vehicle.objects.create(type='bike', title='BA', price_per_day=10, seats=1)
+        with self.assertRaises(CommandError):
+            call_command('benchmark_api', requests=0, stdout=StringIO(), stderr=StringIO())
+
+    def test_nearest_rank_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile([1, 2], 50), 1)
+        self.assertEqual(percentile(values, 7), 7)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99.5), 100)
+        self.assertEqual(percentile([5], 99), 5)
+        self.assertIsNone(percentile([], 50))
+
+
+class MetricsTests(TestCase):
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_view_metrics_exposed(self):
+        Vehicle.objects.create(type='bike', title='M1', price_per_day=10, seats=1)
+        client = APIClient()
+        client.get(reverse('vehicle-list'), {'type': 'car'})
+        body = client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').content.decode()
+        self.assertIn('rentals_http_requests_total{method="GET",status="200",view="vehicle-list"}', body)
+        self.assertIn('rentals_http_request_duration_seconds_bucket{view="vehicle-list",le="+Inf"}', body)
+        self.assertIn('rentals_db_queries_per_request_sum{view="vehicle-list"}', body)
+        self.assertIn('rentals_catalog_cache_misses_total', body)
+        self.assertIn('rentals_webhook_pending_events 0', body)
+
+    def test_metrics_need_staff_or_token(self):
+        urls = ['/metrics', reverse('catalog-cache-metrics'), reverse('webhook-metrics')]
+        client = APIClient()
+        user = get_user_model().objects.create_user('plain', 'plain@example.com', 'pass')
+        with override_settings(METRICS_TOKEN='scrape'):
+            for url in urls:
+                self.assertEqual(client.get(url).status_code, 403)
+                self.assertEqual(client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+                self.assertEqual(client.get(url, HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+        # No token configured: an empty bearer must not match.
+        self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        client.force_login(user)
+        self.assertEqual(client.get('/metrics').status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(client.get('/metrics').status_code, 200)
+
+    def test_workers_are_summed_from_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            workers = [MetricsStore(directory), MetricsStore(directory)]
+            for n, store in enumerate(workers, start=1):
+                store.inc('rentals_http_requests_total', {'view': 'vehicle-list'}, n)
+                store.observe('rentals_http_request_duration_seconds', {'view': 'vehicle-list'}, 0.02 * n, (0.025, 0.05))
+                store.flush()
+            body = render_metrics(MetricsStore(directory).collect())
+        self.assertIn('rentals_http_requests_total{view="vehicle-list"} 3', body)
+        self.assertIn('rentals_http_request_duration_seconds_bucket{view="vehicle-list",le="0.025"} 1', body)
+        self.assertIn('rentals_http_request_duration_seconds_bucket{view="vehicle-list",le="0.05"} 2', body)
+        self.assertIn('rentals_http_request_duration_seconds_count{view="vehicle-list"} 2', body)
+
+    @override_settings(SLOW_REQUEST_MS=0.001)
+    def test_slow_request_log_includes_sql(self):
+        with self.assertLogs('rentals.slow_requests', 'WARNING') as logs:
+            APIClient().get(reverse('vehicle-list'), {'start_date': '2030-01-01'})
+        self.assertIn('(vehicle-list)', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+class VehicleSearchTests(TestCase):
+    def setUp(self):
+        self.url = reverse('vehicle-list')
+        self.activa = Vehicle.objects.create(type='bike', title='Honda Activa', make='Honda', model='Activa',
+                                             price_per_day=10, seats=2, location_city='Pune', location_state='MH')
+        self.swift = Vehicle.objects.create(type='car', title='Maruti Swift', make='Maruti', model='Swift',
+                                            description='Cheaper than a Honda', price_per_day=30, seats=5,
+                                            location_city='Bengaluru', location_state='KA')
+
+    def titles(self, **params):
+        return [v['title'] for v in APIClient().get(self.url, params).json()['results']]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.titles(q='honda'), ['Honda Activa', 'Maruti Swift'])
+        self.assertEqual(self.titles(q='maruti swi'), ['Maruti Swift'])
+        self.assertEqual(self.titles(q='AND "OR'), [])
+
+    def test_index_follows_updates_and_bulk_inserts(self):
+        Vehicle.objects.filter(pk=self.swift.pk).update(title='Maruti Dzire', model='Dzire')
+        Vehicle.objects.bulk_create([Vehicle(type='car', title='Tata Nexon', make='Tata', price_per_day=40)])
+        bump_catalog_version()
+        self.assertEqual(self.titles(q='swift'), [])
+        self.assertEqual(self.titles(q='dzire'), ['Maruti Dzire'])
+        self.assertEqual(self.titles(q='nexon'), ['Tata Nexon'])
+        self.activa.delete()
+        self.assertEqual(self.titles(q='activa'), [])
+
+    def test_city_and_state_prefix_filters(self):
+        self.assertEqual(self.titles(city='pun'), ['Honda Activa'])
+        self.assertEqual(self.titles(city='BENGALURU'), ['Maruti Swift'])
+        self.assertEqual(self.titles(state='ka', q='honda'), ['Maruti Swift'])
+        self.assertEqual(self.titles(city='une'), [])
+
+
+class ProximitySearchTests(TestCase):
+    # Around Pune: ~0.5 km, ~3.1 km, ~6.2 km north-east (inside the 5 km
+    # bounding box but outside the circle) and ~150 km away.
+    POINTS = [('Near', 18.5245, 73.8567), ('Mid', 18.5484, 73.8567), ('Corner', 18.5594, 73.8980),
+              ('Far', 19.0760, 72.8777)]
+
+    def setUp(self):
+        self.url = reverse('vehicle-list')
+        for title, lat, lng in self.POINTS:
+            Vehicle.objects.create(type='bike', title=title, price_per_day=10, seats=1, latitude=lat, longitude=lng)
+        Vehicle.objects.create(type='bike', title='Nowhere', price_per_day=10, seats=1)
+
+    def results(self, **params):
+        return APIClient().get(self.url, params).json()['results']
+
+    def test_radius_filter_sorted_by_distance(self):
+        results = self.results(lat=18.5204, lng=73.8567, radius_km=5, ordering='distance')
+        self.assertEqual([v['title'] for v in results], ['Near', 'Mid'])
+        self.assertAlmostEqual(results[0]['distance_km'], 0.456, places=2)
+        self.assertNotIn('geohash', results[0])
+
+    def test_bbox_filter(self):
+        titles = [v['title'] for v in self.results(bbox='73.85,18.52,73.87,18.55')]
+        self.assertEqual(titles, ['Near', 'Mid'])
+
+    def test_invalid_params_are_ignored(self):
+        self.assertEqual(len(self.results(lat='north', lng=73.8)), 5)
+
+    def test_geohash_follows_coordinates(self):
+        vehicle = Vehicle.objects.get(title='Far')
+        vehicle.latitude, vehicle.longitude = Decimal('18.5204'), Decimal('73.8567')
+        vehicle.save(update_fields=['latitude', 'longitude'])
+        vehicle.refresh_from_db()
+        self.assertEqual(vehicle.geohash, geohash_encode(18.5204, 73.8567))
+        self.assertEqual(Vehicle.objects.get(title='Nowhere').geohash, '')
+
+    def test_candidate_rows_are_capped(self):
+        with mock.patch('rentals.geo.MAX_CANDIDATES', 1), CaptureQueriesContext(connection) as queries:
+            results = self.results(lat=18.5204, lng=73.8567, radius_km=5)
+        self.assertEqual(len(results), 1)
+        self.assertTrue(any('LIMIT 1' in query['sql'] for query in queries.captured_queries))
+
+    def test_cover_contains_box(self):
+        box = radius_box(18.5204, 73.8567, 5)
+        cells = cover(*box)
+        self.assertLessEqual(len(cells), 16)
+        for lat in (box[0], box[2]):
+            for lng in (box[1], box[3]):
+                self.assertTrue(any(geohash_encode(lat, lng).startswith(cell) for cell in cells))
+
+
+class VehicleCalendarTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('cal', 'cal@example.com', 'pass')
+        self.vehicle = Vehicle.objects.create(type='car', title='Cal', price_per_day=10, seats=4)
+        self.url = reverse('vehicle-calendar', args=[self.vehicle.pk])
+        self.booking = Booking.objects.create(user=self.user, vehicle=self.vehicle, start_date=date(2030, 1, 30),
+                                              end_date=date(2030, 2, 2), total_price=40)
+        Booking.objects.create(user=self.user, vehicle=self.vehicle, start_date=date(2030, 2, 10),
+                               end_date=date(2030, 2, 11), total_price=20, status='confirmed')
+        Booking.objects.create(user=self.user, vehicle=self.vehicle, start_date=date(2030, 2, 20),
+                               end_date=date(2030, 2, 21), total_price=20, status='cancelled')
+
+    def test_month_bitmap_and_ranges(self):
+        data = APIClient().get(self.url, {'month': '2030-02'}).json()
+        self.assertEqual(data['days'], 28)
+        self.assertEqual(data['booked'], '11' + '0' * 7 + '11' + '0' * 17)
+        self.assertEqual(data['ranges'], [{'start': '2030-02-01', 'end': '2030-02-02'},
+                                          {'start': '2030-02-10', 'end': '2030-02-11'}])
+
+    def test_cached_until_a_booking_changes(self):
+        client = APIClient()
+        client.get(self.url, {'month': '2030-02'})
+        with self.assertNumQueries(1):  # the validators' aggregate
+            client.get(self.url, {'month': '2030-02'})
+        self.booking.status = 'cancelled'
+        self.booking.save()
+        data = client.get(self.url, {'month': '2030-02'}).json()
+        self.assertEqual(data['ranges'], [{'start': '2030-02-10', 'end': '2030-02-11'}])
+
+    def test_expired_hold_changes_validators(self):
+        client = APIClient()
+        first = client.get(self.url, {'month': '2030-02'})
+        # The hold runs out without the booking being saved.
+        Booking.objects.filter(pk=self.booking.pk).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+        resp = client.get(self.url, {'month': '2030-02'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['ranges'], [{'start': '2030-02-10', 'end': '2030-02-11'}])
+
+    def test_cache_timeout_stops_at_next_hold_expiry(self):
+        cache.clear()
+        Booking.objects.filter(pk=self.booking.pk).update(hold_expires_at=timezone.now() + timedelta(seconds=90))
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            APIClient().get(self.url, {'month': '2030-02'})
+        self.assertLessEqual(cache_set.call_args.args[2], 90)
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            APIClient().get(self.url, {'month': '2030-03'})
+        self.assertEqual(cache_set.call_args.args[2], settings.CALENDAR_CACHE_TIMEOUT)
+
+    def test_conditional_get(self):
+        client = APIClient()
+        etag = client.get(self.url, {'month': '2030-01'})['ETag']
+        self.assertEqual(client.get(self.url, {'month': '2030-01'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(client.get(self.url, {'month': '2030-02'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_bad_month_and_unknown_vehicle(self):
+        self.assertEqual(APIClient().get(self.url, {'month': '2030-13'}).status_code, 400)
+        missing = reverse('vehicle-calendar', args=[self.vehicle.pk + 100])
+        self.assertEqual(APIClient().get(missing).status_code, 404)
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('dash', 'dash@example.com', 'pass', first_name='Dee')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+
+    def _make_bookings(self, n):
+        for i in range(n):
+            v = Vehicle.objects.create(type='car', title=f'D{i}', price_per_day=10, seats=4)
+            VehicleImage.objects.create(vehicle=v, image='vehicles/images.jpeg')
+            b = Booking.objects.create(user=self.user, vehicle=v, start_date=date(2030, 1, 1) + timedelta(days=i),
+                                       end_date=date(2030, 1, 1) + timedelta(days=i), total_price=10)
+            if i % 2:
+                Payment.objects.create(booking=b, amount=10, paid=True, paid_at=timezone.now())
+
+    @override_settings(SHARED_CACHE=True)
+    def test_query_budget(self):
+        for n, token_query in ((1, 1), (10, 0)):
+            Booking.objects.all().delete()
+            self._make_bookings(n)
+            # token (cached after the first request) + count + bookings/vehicles/payments + images
+            with self.assertNumQueries(3 + token_query):
+                resp = self.client.get(reverse('dashboard'))
+            self.assertEqual(resp.data['user']['first_name'], 'Dee')
+            self.assertEqual(resp.data['bookings']['count'], n)
+            self.assertEqual(len(resp.data['bookings']['results'][0]['vehicle']['images']), 1)
+
+    def test_matches_drf(self):
+        self._make_bookings(3)
+        resp = self.client.get(reverse('dashboard'))
+        queryset = Booking.objects.order_by('-created_at', '-id')
+        drf = DashboardBookingSerializer(queryset, many=True, context={'request': resp.wsgi_request}).data
+        self.assertEqual(JSONRenderer().render(resp.data['bookings']['results']), JSONRenderer().render(drf))
+        payments = [b['payment'] for b in resp.data['bookings']['results']]
+        self.assertIsNone(payments[0])
+        self.assertTrue(payments[1]['paid'])
+
+
+@override_settings(ROOT_URLCONF='config.urls_async')
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('as', 'as@example.com', 'pass')
+        self.token = Token.objects.create(user=self.user).key
+        self.vehicle = Vehicle.objects.create(type='car', title='A', price_per_day=30, seats=4)
+        self.booking = Booking.objects.create(user=self.user, vehicle=self.vehicle, start_date=date(2030,1,1), end_date=date(2030,1,2), total_price=60)
+
+    def _checkout(self, booking_id, **headers):
+        return self.client.post(reverse('create-checkout'), {'booking_id': booking_id}, content_type='application/json', **headers)
+
+    def test_async_views_are_routed(self):
+        from rentals import async_views
+        self.assertIs(resolve(reverse('create-checkout')).func, async_views.create_checkout_session)
+        self.assertIs(resolve(reverse('api-check-username')).func, async_views.check_username)
+
+    def test_checkout_creates_then_reuses_session(self):
+        session = mock.Mock(id='cs_async', expires_at=int(time.time()) + 3600)
+        with mock.patch('stripe.checkout.Session.create_async', new=mock.AsyncMock(return_value=session)) as create:
+            auth = {'HTTP_AUTHORIZATION': f'Token {self.token}'}
+            self.assertEqual(self._checkout(self.booking.id, **auth).json(), {'sessionId': 'cs_async'})
+            self.assertEqual(self._checkout(self.booking.id, **auth).json(), {'sessionId': 'cs_async'})
+        self.assertEqual(create.await_count, 1)
+        self.assertEqual(Payment.objects.get(booking=self.booking).stripe_session_id, 'cs_async')
+
+    def test_checkout_auth_and_ownership(self):
+        resp = self._checkout(self.booking.id)
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(resp.json(), {'detail': 'Authentication credentials were not provided.'})
+        self.assertEqual(self._checkout(self.booking.id, HTTP_AUTHORIZATION='Token nope').status_code, 403)
+        other = Token.objects.create(user=get_user_model().objects.create_user('as2')).key
+        self.assertEqual(self._checkout(self.booking.id, HTTP_AUTHORIZATION=f'Token {other}').status_code, 404)
+        self.assertEqual(self.client.get(reverse('create-checkout')).status_code, 405)
+
+    def test_webhook_records_event_once(self):
+        event = {'id': 'evt_async', 'type': 'checkout.session.completed', 'data': {'object': {}}}
+        with mock.patch('rentals.async_views.stripe.Webhook.construct_event', return_value=event):
+            for _ in range(2):
+                resp = self.client.post(reverse('stripe-webhook'), data=b'{}', content_type='application/json', HTTP_STRIPE_SIGNATURE='sig')
+                self.assertEqual(resp.json(), {'status': 'received'})
+        self.assertEqual(WebhookEvent.objects.filter(event_id='evt_async').count(), 1)
+
+    def test_check_username(self):
+        url = reverse('api-check-username')
+        self.assertEqual(self.client.get(url, {'username': 'as'}).json(), {'available': False})
+        self.assertEqual(self.client.get(url, {'username': 'free'}).json(), {'available': True})
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+    async def test_metrics_middleware_stays_async(self):
+        await self.async_client.get(reverse('api-check-username'), {'username': 'free'})
+        body = render_metrics([get_metrics_store().snapshot()])
+        self.assertIn('rentals_http_requests_total{method="GET",status="200",view="api-check-username"}', body)
+
+
+class BenchmarkCheckoutTests(TestCase):
+    def test_reports_both_modes(self):
+        Vehicle.objects.create(type='bike', title='BC', price_per_day=10, seats=1)
+        out = StringIO()
+        call_command('benchmark_checkout', requests=3, warmup=1, concurrency=1, latency_ms=0, stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(list(report['modes']), ['sync', 'async'])
+        for result in report['modes'].values():
+            self.assertEqual(result['statuses'], {'200': 3})
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(Payment.objects.exists())
+
+
+@override_settings(SHARED_CACHE=True)
+class CachedTokenAuthTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('ct', 'ct@example.com', 'pass')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('api-current-user')
+
+    def _after_version_check(self):
+        later = time.time() + AUTH_VERSION_CHECK_SECONDS
+        return mock.patch('rentals.authentication.time.time', return_value=later)
+
+    def _auth_counts(self):
+        counters, _ = merge([get_metrics_store().snapshot()])
+        return {result: counters.get(('rentals_token_auth_cache_total', (('result', result),)), 0) for result in ('hit', 'miss')}
+
+    def test_second_request_skips_token_query(self):
+        before = self._auth_counts()
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url)
+        self.assertEqual(resp.data['username'], 'ct')
+        after = self._auth_counts()
+        self.assertEqual(after['miss'] - before['miss'], 1)
+        self.assertEqual(after['hit'] - before['hit'], 1)
+
+    def test_version_is_read_only_every_few_seconds(self):
+        self.client.get(self.url)
+        with mock.patch.object(authentication, 'get_version', wraps=authentication.get_version) as read_version:
+            self.client.get(self.url)
+            read_version.assert_not_called()
+            with self._after_version_check():
+                self.client.get(self.url)
+                self.client.get(self.url)
+        read_version.assert_called_once()
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get(self.url)
+        self.token.delete()
+        with self._after_version_check():
+            self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        with self._after_version_check():
+            self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_profile_change_is_not_served_stale(self):
+        self.client.get(self.url)
+        self.client.put(self.url, {'first_name': 'New'}, format='json')
+        with self._after_version_check():
+            self.assertEqual(self.client.get(self.url).data['first_name'], 'New')
+
+    def test_entries_expire_after_ttl(self):
+        self.client.get(self.url)
+        later = time.time() + settings.TOKEN_AUTH_CACHE_TTL
+        with mock.patch('rentals.authentication.time.time', return_value=later), self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_lru_is_bounded_and_expires(self):
+        lru = TokenLRU(size=2, ttl=60)
+        for key in 'abc':
+            lru.set(key, key)
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(lru.get('c'), 'c')
+        with mock.patch('rentals.authentication.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(lru.get('c'))
+
+    @override_settings(SHARED_CACHE=False)
+    def test_process_local_cache_queries_every_time(self):
+        # Another process could delete the token without this one seeing the version bump.
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        Token.objects.filter(pk=self.token.pk).delete()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    @override_settings(TOKEN_AUTH_CACHE='shared')
+    def test_shared_mode(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+        self.token.delete()
+        with self._after_version_check():
+            self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+@override_settings(SHARED_CACHE=True)
+class UsernameIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Forget filters and check times left by other tests (some move the clock).
+        username_index.__init__()
+        self.url = reverse('api-check-username')
+        get_user_model().objects.create_user('taken')
+
+    def _available(self, username):
+        return APIClient().get(self.url, {'username': username}).json()['available']
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        names = [f'user{i}' for i in range(1000)]
+        for name in names:
+            bloom.add(name)
+        self.assertTrue(all(name in bloom for name in names))
+        false_positives = sum(f'other{i}' in bloom for i in range(1000))
+        self.assertLess(false_positives, 30)
+
+    def test_free_name_skips_the_database(self):
+        self._available('warmup')
+        with self.assertNumQueries(0):
+            self.assertTrue(self._available('never-seen-before'))
+        self.assertFalse(self._available('taken'))
+
+    def test_new_and_renamed_users(self):
+        self._available('warmup')
+        user = get_user_model().objects.create_user('fresh')
+        self.assertFalse(self._available('fresh'))
+        user.username = 'renamed'
+        user.save()
+        self.assertFalse(self._available('renamed'))
+        self.assertTrue(self._available('fresh'))
+
+    def test_users_created_by_other_workers(self):
+        self._available('warmup')
+        # No signals here, as for a signup handled by another process.
+        get_user_model().objects.bulk_create([get_user_model()(username='elsewhere')])
+        bump_version(USERNAMES_VERSION_KEY)
+        later = time.monotonic() + VERSION_CHECK_SECONDS
+        with mock.patch('rentals.usernames.time.monotonic', return_value=later):
+            self.assertFalse(self._available('elsewhere'))
+
+    def test_versions_are_read_together_and_not_on_every_check(self):
+        self._available('warmup')
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            self.assertTrue(self._available('never-seen-before'))
+            self.assertEqual(get_many.call_count, 0)
+            later = time.monotonic() + VERSION_CHECK_SECONDS
+            with mock.patch('rentals.usernames.time.monotonic', return_value=later):
+                self.assertTrue(self._available('never-seen-before'))
+        get_many.assert_called_once_with([USERNAMES_VERSION_KEY, USERNAMES_RELOAD_KEY])
+
+    def test_bulk_created_users_are_seen_after_resync(self):
+        self._available('warmup')
+        get_user_model().objects.bulk_create([get_user_model()(username='imported')])
+        later = time.monotonic() + RESYNC_SECONDS
+        with mock.patch('rentals.usernames.time.monotonic', return_value=later):
+            self.assertFalse(self._available('imported'))
+
+    @override_settings(SHARED_CACHE=False)
+    def test_process_local_cache_queries_every_time(self):
+        self._available('warmup')
+        get_user_model().objects.bulk_create([get_user_model()(username='imported')])
+        with self.assertNumQueries(1):
+            self.assertFalse(self._available('imported'))
+        # Signups do not load or update the unused filter.
+        with mock.patch('rentals.usernames.UsernameIndex._refresh') as refresh:
+            get_user_model().objects.create_user('signup')
+        refresh.assert_not_called()
+
+    def test_throttled(self):
+        with mock.patch.object(ScopedRateThrottle, 'THROTTLE_RATES', {'username-check': '2/min'}):
+            for urlconf in ('config.urls', 'config.urls_async'):
+                cache.clear()
+                with override_settings(ROOT_URLCONF=urlconf):
+                    client = APIClient()
+                    statuses = [client.get(self.url, {'username': 'x'}).status_code for _ in range(3)]
+                    self.assertEqual(statuses, [200, 200, 429])
+                    self.assertIn('Retry-After', client.get(self.url, {'username': 'x'}))
+
+
+@override_settings(IMAGE_WORKERS=0)
+class VehicleImageVariantTests(TestCase):
+    def setUp(self):
+        from PIL import Image
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        os.makedirs(os.path.join(media.name, 'vehicles'))
+        Image.new('RGB', (1600, 1000), (200, 40, 40)).save(os.path.join(media.name, 'vehicles', 'big.jpg'))
+        Image.new('RGBA', (100, 80), (0, 0, 255, 128)).save(os.path.join(media.name, 'vehicles', 'small.png'))
+        self.media = media.name
+        self.vehicle = Vehicle.objects.create(type='car', title='Photo', price_per_day=30, seats=4)
+
+    def _upload(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = VehicleImage.objects.create(vehicle=self.vehicle, image=name)
+        image.refresh_from_db()
+        return image
+
+    def test_upload_generates_variants(self):
+        from PIL import Image
+        image = self._upload('vehicles/big.jpg')
+        self.assertEqual(image.variants_source, 'vehicles/big.jpg')
+        sizes = {name: (v['width'], v['height']) for name, v in image.variants.items()}
+        self.assertEqual(sizes, {'thumb': (160, 100), 'card': (400, 250), 'detail': (1200, 750)})
+        with Image.open(os.path.join(self.media, image.variants['card']['webp'])) as webp:
+            self.assertEqual((webp.format, webp.size), ('WEBP', (400, 250)))
+        with Image.open(os.path.join(self.media, image.variants['detail']['jpeg'])) as jpeg:
+            self.assertEqual(jpeg.format, 'JPEG')
+
+    def test_small_transparent_image_is_not_upscaled(self):
+        image = self._upload('vehicles/small.png')
+        self.assertEqual({(v['width'], v['height']) for v in image.variants.values()}, {(100, 80)})
+
+    def test_api_srcset_matches_drf(self):
+        self._upload('vehicles/big.jpg')
+        VehicleImage.objects.create(vehicle=self.vehicle, image='vehicles/small.png')  # still pending
+        resp = APIClient().get(reverse('vehicle-detail', args=[self.vehicle.id]))
+        ready, pending = resp.json()['images']
+        self.assertEqual(list(ready['variants']), ['thumb', 'card', 'detail'])
+        self.assertTrue(ready['variants']['card']['webp'].startswith('http://testserver/media/vehicles/variants/'))
+        self.assertEqual(ready['srcset']['webp'].count('w, '), 2)
+        self.assertIn(ready['variants']['detail']['jpeg'] + ' 1200w', ready['srcset']['jpeg'])
+        self.assertEqual((pending['variants'], pending['srcset']), ({}, {}))
+        drf = VehicleSerializer(self.vehicle, context={'request': resp.wsgi_request}).data
+        self.assertEqual(resp.content, JSONRenderer().render(drf))
+
+    def test_replaced_original_hides_stale_variants(self):
+        image = self._upload('vehicles/big.jpg')
+        VehicleImage.objects.filter(pk=image.pk).update(image='vehicles/small.png')
+        image.refresh_from_db()
+        self.assertEqual(VehicleSerializer(self.vehicle).data['images'][0]['variants'], {})
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        image.refresh_from_db()
+        self.assertEqual(image.variants_source, 'vehicles/small.png')
+
+    def test_old_variant_files_are_deleted(self):
+        image = self._upload('vehicles/big.jpg')
+        old = [os.path.join(self.media, path) for path in variant_paths(image.variants)]
+        self.assertEqual(len(old), 6)
+        image.image = 'vehicles/small.png'
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        image.refresh_from_db()
+        self.assertFalse(any(os.path.exists(path) for path in old))
+        new = [os.path.join(self.media, path) for path in variant_paths(image.variants)]
+        self.assertTrue(all(os.path.exists(path) for path in new))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehicle.delete()
+        self.assertFalse(any(os.path.exists(path) for path in new))
+
+    def test_backfill_command(self):
+        VehicleImage.objects.create(vehicle=self.vehicle, image='vehicles/big.jpg')
+        VehicleImage.objects.create(vehicle=self.vehicle, image='vehicles/missing.jpg')
+        out, err = StringIO(), StringIO()
+        call_command('generate_image_variants', workers=1, stdout=out, stderr=err)
+        self.assertIn('generated variants for 1 of 2 images; 1 failed', out.getvalue())
+        self.assertIn('missing.jpg', err.getvalue())
+        self.assertTrue(VehicleImage.objects.get(image='vehicles/big.jpg').variants)
+        out = StringIO()
+        call_command('generate_image_variants', workers=1, stdout=out)
+        self.assertIn('generated variants for 0 of 1 images', out.getvalue())
+
+
+class BookingHoldTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('hold', 'hold@example.com', 'pass')
+        self.vehicle = Vehicle.objects.create(type='car', title='H', price_per_day=30, seats=4)
+        self.start = date.today() + timedelta(days=10)
+
+    def _booking(self, offset=0, **kwargs):
+        start = self.start + timedelta(days=offset)
+        return Booking.objects.create(user=self.user, vehicle=self.vehicle, start_date=start, end_date=start, total_price=30, **kwargs)
+
+    def test_reserve_sets_hold(self):
+        booking = reserve_vehicle(self.user, self.vehicle, self.start, self.start, 30)
+        remaining = booking.hold_expires_at - timezone.now()
+        self.assertAlmostEqual(remaining.total_seconds(), 30 * 60, delta=60)
+
+    def test_expired_hold_stops_blocking_before_the_job(self):
+        self._booking(hold_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(is_vehicle_available(self.vehicle, self.start, self.start))
+        self.assertEqual(filter_available(Vehicle.objects.all(), self.start, self.start).count(), 1)
+        self.assertEqual(month_calendar(self.vehicle.id, self.start.year, self.start.month)['ranges'], [])
+        # Holds without a deadline (e.g. made in the admin) still block.
+        self._booking()
+        self.assertFalse(is_vehicle_available(self.vehicle, self.start, self.start))
+
+    def test_job_expires_holds_and_completes_bookings_in_batches(self):
+        past = timezone.now() - timedelta(minutes=1)
+        expired = [self._booking(i, hold_expires_at=past).pk for i in range(5)]
+        held = self._booking(10, hold_expires_at=timezone.now() + timedelta(minutes=10))
+        yesterday = date.today() - timedelta(days=1)
+        ended = Booking.objects.create(user=self.user, vehicle=self.vehicle, start_date=yesterday, end_date=yesterday, total_price=30, status='confirmed')
+        upcoming = self._booking(20, status='confirmed')
+        out = StringIO()
+        # A SELECT and an UPDATE per batch of expiries (three); the completion batch also
+        # locks its rows and bumps the vehicle counters in a savepoint.
+        with self.assertNumQueries(13):
+            call_command('expire_bookings', batch_size=2, stdout=out)
+        self.assertIn('expired 5 holds; completed 1 bookings', out.getvalue())
+        self.assertEqual(set(Booking.objects.filter(status='cancelled').values_list('pk', flat=True)), set(expired))
+        self.assertEqual(Booking.objects.get(pk=ended.pk).status, 'completed')
+        self.assertEqual([Booking.objects.get(pk=b.pk).status for b in (held, upcoming)], ['pending', 'confirmed'])
+        # update() skips auto_now; the job sets updated_at for the calendars' and lists' validators.
+        self.assertGreater(Booking.objects.get(pk=ended.pk).updated_at, ended.updated_at)
+
+    def test_checkout_extends_short_hold(self):
+        booking = self._booking(hold_expires_at=timezone.now() + timedelta(minutes=5))
+        stripe_stub = FakeStripe()
+        get_or_create_checkout_session(booking, 'https://x/ok', 'https://x/cancel', client=stripe_stub)
+        hold = Booking.objects.get(pk=booking.pk).hold_expires_at
+        self.assertGreater(hold, timezone.now() + timedelta(minutes=35))
+        params = stripe_stub.checkout.Session.create.call_args.kwargs
+        self.assertEqual(params['expires_at'], int((hold - timedelta(minutes=5)).timestamp()))
+
+    def test_checkout_of_expired_hold_is_refused(self):
+        booking = self._booking(hold_expires_at=timezone.now() - timedelta(minutes=1))
+        with self.assertRaises(HoldExpired):
+            get_or_create_checkout_session(booking, 'https://x/ok', 'https://x/cancel', client=FakeStripe())
+        client = APIClient()
+        client.force_authenticate(self.user)
+        resp = client.post(reverse('create-checkout'), {'booking_id': booking.id}, format='json')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_late_payment_takes_free_dates_back(self):
+        paid = self._booking(status='cancelled')
+        rebooked = self._booking(1, status='cancelled')
+        self._booking(1, status='confirmed')
+        for booking in (paid, rebooked):
+            WebhookEvent.objects.create(event_id=f'evt_{booking.pk}', type='checkout.session.completed', payload={
+                'data': {'object': {'metadata': {'booking_id': str(booking.pk)}, 'payment_intent': 'pi'}},
+            })
+        with self.assertLogs('rentals.webhooks', 'WARNING'):
+            self.assertEqual(process_batch(), 2)
+        self.assertEqual(Booking.objects.get(pk=paid.pk).status, 'confirmed')
+        self.assertEqual(Booking.objects.get(pk=rebooked.pk).status, 'cancelled')
+        self.assertTrue(Payment.objects.get(booking=rebooked).paid)
+
+
+class BookingArchiveTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('arch', 'arch@example.com', 'pass')
+        self.vehicle = Vehicle.objects.create(type='car', title='Old', price_per_day=30, seats=4)
+        old = date.today() - timedelta(days=400)
+        recent = date.today() - timedelta(days=10)
+
+        def booking(day, status):
+            return Booking.objects.create(user=self.user, vehicle=self.vehicle, start_date=day, end_date=day, total_price=30, status=status)
+        self.completed = booking(old, 'completed')
+        self.cancelled = booking(old, 'cancelled')
+        self.confirmed = booking(old, 'confirmed')  # not finished yet as far as the data says
+        self.recent = booking(recent, 'completed')
+        Payment.objects.create(booking=self.completed, amount=30, paid=True, paid_at=timezone.now(), stripe_session_id='cs_old')
+        Review.objects.create(booking=self.completed, rating=4, comment='Fine')
+
+    def test_months_before(self):
+        self.assertEqual(months_before(date(2025, 3, 31), 1), date(2025, 2, 28))
+        self.assertEqual(months_before(date(2025, 1, 15), 14), date(2023, 11, 15))
+
+    def test_archive_moves_bookings_payments_and_reviews(self):
+        out = StringIO()
+        call_command('archive_bookings', months=6, batch_size=1, stdout=out)
+        self.assertIn('archived 2 bookings, 1 payments and 1 reviews', out.getvalue())
+        self.assertEqual(set(Booking.objects.values_list('pk', flat=True)), {self.confirmed.pk, self.recent.pk})
+        archived = ArchivedBooking.objects.get(pk=self.completed.pk)
+        self.assertEqual((archived.created_at, archived.status), (self.completed.created_at, 'completed'))
+        self.assertEqual(ArchivedPayment.objects.get(booking=archived).stripe_session_id, 'cs_old')
+        self.assertEqual(archived.review.rating, 4)
+        self.assertFalse(Payment.objects.exists() or Review.objects.exists())
+        call_command('archive_bookings', months=6, stdout=out)
+        self.assertEqual(ArchivedBooking.objects.count(), 2)
+
+    def test_history_endpoint(self):
+        call_command('archive_bookings', months=6, stdout=StringIO())
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get(reverse('booking-list')).data['count'], 2)
+        resp = client.get(reverse('booking-history'), {'cursor': ''})
+        self.assertEqual(resp.status_code, 200)
+        by_id = {b['id']: b for b in resp.json()['results']}
+        self.assertEqual(set(by_id), {self.completed.pk, self.cancelled.pk})
+        self.assertEqual(by_id[self.completed.pk]['payment']['paid'], True)
+        self.assertEqual(by_id[self.completed.pk]['review']['comment'], 'Fine')
+        self.assertEqual(by_id[self.completed.pk]['vehicle']['title'], 'Old')
+        self.assertIsNone(by_id[self.cancelled.pk]['payment'])
+        other = APIClient()
+        other.force_authenticate(get_user_model().objects.create_user('other'))
+        self.assertEqual(other.get(reverse('booking-history')).data['count'], 0)
+
+
+class VehicleStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('stats', 'stats@example.com', 'pass')
+        self.car = Vehicle.objects.create(type='car', title='Car', price_per_day=30, seats=4)
+        self.bike = Vehicle.objects.create(type='bike', title='Bike', price_per_day=10, seats=2)
+        self.old = date.today() - timedelta(days=400)
+
+    def booking(self, vehicle, status='completed', day=None):
+        day = day or self.old
+        return Booking.objects.create(user=self.user, vehicle=vehicle, start_date=day, end_date=day, total_price=30, status=status)
+
+    def stats(self, vehicle):
+        return Vehicle.objects.values_list('rating_avg', 'rating_count', 'rating_sum', 'bookings_completed').get(pk=vehicle.pk)
+
+    def test_reviews_update_rating(self):
+        first = Review.objects.create(booking=self.booking(self.car), rating=5)
+        Review.objects.create(booking=self.booking(self.car), rating=4)
+        self.assertEqual(self.stats(self.car), (Decimal('4.50'), 2, 9, 2))
+        first = Review.objects.get(pk=first.pk)
+        first.rating = 2
+        first.save()
+        self.assertEqual(self.stats(self.car)[:3], (Decimal('3.00'), 2, 6))
+        first.delete()
+        Review.objects.get().delete()
+        self.assertEqual(self.stats(self.car)[:3], (Decimal('0'), 0, 0))
+
+    def test_vehicle_save_keeps_concurrent_counts(self):
+        loaded = Vehicle.objects.get(pk=self.car.pk)
+        Review.objects.create(booking=self.booking(self.car), rating=4)
+        loaded.title = 'Renamed'
+        loaded.save()
+        self.assertEqual(self.stats(self.car), (Decimal('4.00'), 1, 4, 1))
+        self.assertEqual(Vehicle.objects.get(pk=self.car.pk).title, 'Renamed')
+        partial = Vehicle.objects.only('pk', 'price_per_day').get(pk=self.car.pk)
+        partial.price_per_day = 35
+        partial.save()
+        self.assertEqual(Vehicle.objects.get(pk=self.car.pk).title, 'Renamed')
+
+    def test_rating_must_be_one_to_five(self):
+        review = Review(booking=self.booking(self.car), rating=6)
+        with self.assertRaises(ValidationError):
+            review.full_clean()
+
+    def test_status_changes_count_completions(self):
+        booking = self.booking(self.car, status='confirmed')
+        self.assertEqual(self.stats(self.car)[3], 0)
+        booking.status = 'completed'
+        booking.save()
+        booking.save()
+        self.assertEqual(self.stats(self.car)[3], 1)
+        self.booking(self.car, status='confirmed')
+        call_command('expire_bookings', stdout=StringIO())
+        self.assertEqual(self.stats(self.car)[3], 2)
+        admin = admin_site._registry[Booking]
+        admin.confirm_bookings(None, Booking.objects.filter(vehicle=self.car))
+        self.assertEqual(self.stats(self.car)[3], 0)
+        self.booking(self.bike).delete()
+        self.assertEqual(self.stats(self.bike)[3], 0)
+
+    def test_archiving_keeps_counts(self):
+        Review.objects.create(booking=self.booking(self.car), rating=3)
+        call_command('archive_bookings', months=6, stdout=StringIO())
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(self.stats(self.car), (Decimal('3.00'), 1, 3, 1))
+        self.assertEqual(recompute(), 0)
+
+    def test_repair_command(self):
+        Review.objects.create(booking=self.booking(self.car), rating=4)
+        Review.objects.create(booking=self.booking(self.car), rating=5)
+        self.booking(self.bike)
+        Vehicle.objects.update(rating_avg=0, rating_count=0, rating_sum=0, bookings_completed=7)
+        out = StringIO()
+        call_command('repair_vehicle_stats', stdout=out)
+        self.assertIn('repaired 2 vehicles', out.getvalue())
+        self.assertEqual(self.stats(self.car), (Decimal('4.50'), 2, 9, 2))
+        self.assertEqual(self.stats(self.bike), (Decimal('0'), 0, 0, 1))
+        self.assertEqual(recompute(), 0)
+
+    def test_list_ordering(self):
+        Review.objects.create(booking=self.booking(self.bike), rating=5)
+        for _ in range(2):
+            Review.objects.create(booking=self.booking(self.car), rating=3)
+        client = APIClient()
+        titles = lambda ordering: [v['title'] for v in client.get(reverse('vehicle-list'), {'ordering': ordering}).data['results']]
+        self.assertEqual(titles('rating'), ['Bike', 'Car'])
+        self.assertEqual(titles('popularity'), ['Car', 'Bike'])
+        self.assertEqual(titles(''), ['Car', 'Bike'])
+        resp = client.get(reverse('vehicle-detail', args=[self.bike.pk]))
+        self.assertEqual((resp.json()['rating_avg'], resp.json()['rating_count']), ('5.00', 1))
+        self.assertNotIn('rating_sum', resp.json())
+        request = Request(APIRequestFactory().get('/', HTTP_HOST='testserver'))
+        queryset = Vehicle.objects.order_by('id')
+        fast = vehicle_values_serializer.serialize(list(vehicle_values_serializer.rows(queryset)), request)
+        drf = VehicleSerializer(queryset, many=True, context={'request': request}).data
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(drf))
+
+
+class OwnerRollupTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create_user('fleet', 'fleet@example.com', 'pass')
+        self.renter = User.objects.create_user('renter', 'renter@example.com', 'pass')
+        self.car = Vehicle.objects.create(owner=self.owner, type='car', title='Car', price_per_day=30, seats=4)
+        self.bike = Vehicle.objects.create(owner=self.owner, type='bike', title='Bike', price_per_day=10, seats=2)
+        self.day = date(2026, 3, 10)
+        # Three days paid for 100.00: 33.34 on the first day, 33.33 on the others.
+        self.paid = self.booking(self.car, 0, 2, 'confirmed')
+        Payment.objects.create(booking=self.paid, amount=100, paid=True, paid_at=timezone.now())
+        self.booking(self.bike, 1, 1, 'completed')
+        self.booking(self.bike, 5, 6, 'pending')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def booking(self, vehicle, offset, last, status):
+        return Booking.objects.create(
+            user=self.renter, vehicle=vehicle, start_date=self.day + timedelta(days=offset),
+            end_date=self.day + timedelta(days=last), total_price=100, status=status,
+        )
+
+    def stats(self, **params):
+        params = {'start': self.day.isoformat(), 'end': (self.day + timedelta(days=6)).isoformat(), **params}
+        return self.client.get(reverse('owner-stats'), params)
+
+    def test_refresh_fills_rollups(self):
+        out = StringIO()
+        call_command('refresh_rollups', stdout=out)
+        self.assertIn('refreshed 2 vehicles over 3 days', out.getvalue())
+        self.assertFalse(RollupMark.objects.exists())
+        self.assertEqual(
+            list(VehicleDayStats.objects.filter(vehicle=self.car).order_by('day').values_list('revenue', flat=True)),
+            [Decimal('33.34'), Decimal('33.33'), Decimal('33.33')],
+        )
+        self.assertEqual(OwnerDayStats.objects.get(day=self.day + timedelta(days=1)).booked, 2)
+        self.assertEqual(refresh(), (0, 0))
+
+    def test_mark_committed_during_refresh_survives(self):
+        gap = RollupMark.objects.create(vehicle_id=self.car.pk, start_date=self.day, end_date=self.day).pk
+        RollupMark.objects.create(vehicle_id=self.car.pk, start_date=self.day, end_date=self.day)
+        RollupMark.objects.filter(pk=gap).delete()
+        late = {'vehicle_id': self.bike.pk, 'start_date': self.day, 'end_date': self.day}
+        # Another transaction can commit a lower id than the last one read.
+        with mock.patch('rentals.rollups._refresh_owners', side_effect=lambda *args: RollupMark.objects.create(id=gap, **late)):
+            refresh()
+        self.assertEqual(list(RollupMark.objects.values_list('id', flat=True)), [gap])
+
+    def test_only_marked_days_are_recomputed(self):
+        refresh()
+        pending = Booking.objects.get(status='pending')
+        pending.save()
+        self.assertFalse(RollupMark.objects.exists())
+        pending.status = 'confirmed'
+        pending.save()
+        self.assertEqual(refresh(), (1, 2))
+        admin_site._registry[Booking].confirm_bookings(None, Booking.objects.filter(pk=pending.pk))
+        self.assertEqual(RollupMark.objects.count(), 1)
+        self.paid.status = 'cancelled'
+        self.paid.save()
+        refresh()
+        self.assertFalse(VehicleDayStats.objects.filter(vehicle=self.car).exists())
+        self.assertEqual(OwnerDayStats.objects.filter(day__gte=self.day + timedelta(days=5)).count(), 2)
+
+    def test_archived_bookings_and_owner_changes(self):
+        refresh()
+        Booking.objects.filter(pk=self.paid.pk).update(status='completed')
+        archive_bookings(1, today=self.day + timedelta(days=90))
+        self.assertFalse(Booking.objects.filter(status='completed').exists())
+        self.assertFalse(RollupMark.objects.exists())
+        self.assertEqual(rebuild(), (2, 3))
+        self.assertEqual(OwnerDayStats.objects.get(day=self.day).revenue, Decimal('33.34'))
+        other = get_user_model().objects.create_user('buyer')
+        self.car.owner = other
+        self.car.save()
+        refresh()
+        self.assertEqual(OwnerDayStats.objects.get(owner=other, day=self.day).revenue, Decimal('33.34'))
+        self.assertFalse(OwnerDayStats.objects.filter(owner=self.owner, day=self.day).exists())
+
+    def test_endpoint(self):
+        refresh()
+        with self.assertNumQueries(2):
+            resp = self.stats()
+        data = resp.json()
+        self.assertEqual((data['vehicles'], data['booked_days'], data['revenue']), (2, 4, '100.00'))
+        self.assertEqual(data['utilization'], round(4 / 14, 4))
+        self.assertEqual(len(data['days']), 7)
+        self.assertEqual(data['days'][1], {'day': '2026-03-11', 'booked': 2, 'revenue': '33.33'})
+        data = self.stats(vehicle=self.bike.pk).json()
+        self.assertEqual((data['vehicles'], data['booked_days'], data['revenue']), (1, 1, '0.00'))
+        self.assertEqual(self.stats(start='2026-03-20').status_code, 400)
+        self.assertEqual(self.stats(start='2025-01-01').status_code, 400)
+        self.assertEqual(self.stats(end='March').status_code, 400)
+        self.assertEqual(self.client.get(reverse('owner-stats')).json()['vehicles'], 2)
+        self.client.force_authenticate(self.renter)
+        self.assertEqual(self.stats(vehicle=self.car.pk).status_code, 404)
+        self.assertEqual(self.stats().json()['booked_days'], 0)
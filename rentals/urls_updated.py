@@ -15,9 +15,13 @@ urlpatterns = [
     # API endpoints
     path('api/vehicles/', views.VehicleListView.as_view(), name='vehicle-list'),
     path('api/vehicles/<int:pk>/', views.VehicleDetailView.as_view(), name='vehicle-detail'),
+    path('api/vehicles/<int:pk>/calendar/', views.VehicleCalendarView.as_view(), name='vehicle-calendar'),
     path('api/bookings/', views.BookingCreateView.as_view(), name='booking-create'),
     path('api/bookings/<int:pk>/', views.BookingDetailView.as_view(), name='booking-detail'),
     path('api/bookings/my/', views.BookingListView.as_view(), name='booking-list'),
+    path('api/bookings/history/', views.BookingHistoryView.as_view(), name='booking-history'),
+    path('api/dashboard/', views.DashboardView.as_view(), name='dashboard'),
+    path('api/owner/stats/', views.OwnerStatsView.as_view(), name='owner-stats'),
     path('api/payments/create-checkout/', views.create_checkout_session, name='create-checkout'),
     path('api/webhooks/stripe/', views.stripe_webhook, name='stripe-webhook'),
     path('api/auth/token/', obtain_auth_token, name='api-token-auth'),
@@ -25,4 +29,7 @@ urlpatterns = [
     path('api/auth/check-username/', views.CheckUsernameView.as_view(), name='api-check-username'),
     path('api/auth/user/', views.CurrentUserView.as_view(), name='api-current-user'),
     path('api/bookings/<int:booking_id>/cancel/', views.CancelBookingView.as_view(), name='cancel-booking'),
+    path('api/metrics/cache/', views.catalog_cache_metrics, name='catalog-cache-metrics'),
+    path('api/metrics/webhooks/', views.webhook_metrics, name='webhook-metrics'),
+    path('metrics', views.metrics, name='metrics'),
 ]
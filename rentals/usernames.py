@@ -0,0 +1,146 @@
+"""In-memory username index for the availability check.
+
+Each process keeps a Bloom filter of every username. A name the filter has
+never seen is certainly free, so most answers while someone types a new
+username cost no query. A "maybe" (a taken name or a ~1% false positive)
+is confirmed with the usual exact query, which also keeps deleted, renamed
+and rolled-back usernames from ever being reported as taken.
+
+The filter is loaded on first use in each process. A signup adds its name
+locally right away, and bumps a version in the default cache once it
+commits; other workers read both versions in one cache call at most every
+VERSION_CHECK_SECONDS, and on a bump read just the users created since
+their last load. A rename bumps a second version that
+makes every worker reload. Users created without the signal (bulk_create)
+bump nothing, so each process also reads new users every RESYNC_SECONDS.
+
+Other workers only see those bumps through a shared cache. Without
+SHARED_CACHE the filter is neither used nor kept up to date, and every
+check queries, since a stale filter would report a taken name as free.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache import bump_version, get_version
+
+USERNAMES_VERSION_KEY = 'usernames:version'
+USERNAMES_RELOAD_KEY = 'usernames:reload'
+FALSE_POSITIVE_RATE = 0.01
+MIN_CAPACITY = 10000
+# Ids re-read on each refresh: a signup can commit after one with a higher id.
+REFRESH_OVERLAP = 20
+# How long another worker's signup can go unseen: the versions are read at
+# most this often, so most checks cost no cache round trip either.
+VERSION_CHECK_SECONDS = 2
+# Longest a user created without the post_save signal can go unseen.
+RESYNC_SECONDS = 30
+LOAD_CHUNK_SIZE = 5000
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        # Double hashing: k positions from two 64-bit halves.
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, value):
+        """Add ``value``; returns False if it (or a colliding value) was already present."""
+        new = False
+        for pos in self._positions(value):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not self.array[byte] & mask:
+                self.array[byte] |= mask
+                new = True
+        self.count += new
+        return new
+
+    def __contains__(self, value):
+        return all(self.array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+
+class UsernameIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.max_id = 0
+        self.version = None
+        self.reload_version = None
+        self.synced_at = 0
+        self.checked_at = 0
+
+    def _add_rows(self, rows):
+        for pk, username in rows:
+            self.bloom.add(username)
+            self.max_id = max(self.max_id, pk)
+
+    def _load(self):
+        users = get_user_model().objects
+        self.bloom = BloomFilter(max(MIN_CAPACITY, 2 * users.count()))
+        self.max_id = 0
+        self._add_rows(users.values_list('pk', 'username').iterator(chunk_size=LOAD_CHUNK_SIZE))
+
+    def _versions(self):
+        versions = cache.get_many([USERNAMES_VERSION_KEY, USERNAMES_RELOAD_KEY])
+        # get_version() seeds a counter the cache has lost.
+        return (
+            versions.get(USERNAMES_VERSION_KEY) or get_version(USERNAMES_VERSION_KEY),
+            versions.get(USERNAMES_RELOAD_KEY) or get_version(USERNAMES_RELOAD_KEY),
+        )
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self.bloom is not None and now - self.checked_at < VERSION_CHECK_SECONDS:
+            return
+        self.checked_at = now
+        version, reload_version = self._versions()
+        if self.bloom is None or reload_version != self.reload_version or self.bloom.count > self.bloom.capacity:
+            # First use, a rename somewhere, or grown past the intended false-positive rate.
+            self._load()
+            self.synced_at = now
+        elif version != self.version or now - self.synced_at >= RESYNC_SECONDS:
+            users = get_user_model().objects.filter(pk__gt=self.max_id - REFRESH_OVERLAP)
+            self._add_rows(users.values_list('pk', 'username'))
+            self.synced_at = now
+        self.version, self.reload_version = version, reload_version
+
+    def might_exist(self, username):
+        """False only if no user has this username."""
+        with self.lock:
+            self._refresh()
+            return username in self.bloom
+
+    def is_taken(self, username):
+        if settings.SHARED_CACHE and not self.might_exist(username):
+            return False
+        return get_user_model().objects.filter(username=username).exists()
+
+    def saved(self, user, created):
+        """Record a saved user's username (see signals.py)."""
+        if not settings.SHARED_CACHE:
+            return
+        with self.lock:
+            self._refresh()
+            new = self.bloom.add(user.username)
+        # Other workers read the change only once it is visible to them.
+        if created:
+            transaction.on_commit(lambda: bump_version(USERNAMES_VERSION_KEY))
+        elif new:
+            transaction.on_commit(lambda: bump_version(USERNAMES_RELOAD_KEY))
+
+
+username_index = UsernameIndex()
@@ -1,12 +1,116 @@
-from django.db.models import Q
+import calendar
+from datetime import date, timedelta
 
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.transaction import TransactionManagementError
+from django.utils import timezone
 
-def is_vehicle_available(vehicle, start_date, end_date):
+from .models import Booking, Vehicle
+
+
+def blocking_q(now=None):
+    """Bookings that hold their vehicle: confirmed, or pending with an unexpired hold.
+
+    Expired holds stop blocking at their deadline, before expire_bookings
+    gets round to marking them cancelled.
+    """
+    now = now or timezone.now()
+    unexpired = Q(hold_expires_at__isnull=True) | Q(hold_expires_at__gt=now)
+    return Q(status='confirmed') | (Q(status='pending') & unexpired)
+
+
+def overlap_q(start_date, end_date):
     # Overlap rule: existing.start_date <= new.end_date AND existing.end_date >= new.start_date
-    conflicts = vehicle.bookings.filter(
-        status__in=['pending', 'confirmed']
-    ).filter(
-        start_date__lte=end_date,
-        end_date__gte=start_date
-    )
+    return Q(start_date__lte=end_date, end_date__gte=start_date)
+
+
+def is_vehicle_available(vehicle, start_date, end_date):
+    conflicts = vehicle.bookings.filter(blocking_q()).filter(overlap_q(start_date, end_date))
     return not conflicts.exists()
+
+
+def filter_available(queryset, start_date, end_date):
+    """Drop vehicles with a blocking booking in the range using one NOT EXISTS subquery."""
+    conflicts = Booking.objects.filter(vehicle=OuterRef('pk')).filter(blocking_q()).filter(overlap_q(start_date, end_date))
+    return queryset.filter(~Exists(conflicts))
+
+
+def month_calendar(vehicle_id, year, month):
+    """Occupancy of one vehicle for one month.
+
+    ``booked`` has one character per day ('1' = held by a confirmed booking
+    or an unexpired pending one) and ``ranges`` lists the same days as merged
+    inclusive ranges clipped to the month.
+    """
+    days = calendar.monthrange(year, month)[1]
+    first, last = date(year, month, 1), date(year, month, days)
+    held = [False] * days
+    bookings = Booking.objects.filter(vehicle_id=vehicle_id).filter(blocking_q()).filter(overlap_q(first, last))
+    for start, end in bookings.values_list('start_date', 'end_date'):
+        for day in range((max(start, first) - first).days, (min(end, last) - first).days + 1):
+            held[day] = True
+
+    ranges = []
+    for day, is_held in enumerate(held):
+        if not is_held:
+            continue
+        if ranges and ranges[-1][1] == day - 1:
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return {
+        'vehicle': vehicle_id,
+        'month': f'{first:%Y-%m}',
+        'days': days,
+        'booked': ''.join('1' if is_held else '0' for is_held in held),
+        'ranges': [
+            {'start': (first + timedelta(days=start)).isoformat(), 'end': (first + timedelta(days=end)).isoformat()}
+            for start, end in ranges
+        ],
+    }
+
+
+class VehicleUnavailable(Exception):
+    pass
+
+
+def lock_vehicle(vehicle_id):
+    """Serialize booking writes for one vehicle until the current transaction ends.
+
+    Backends with row locks (Postgres, MySQL) take ``SELECT ... FOR UPDATE`` on
+    the vehicle row, so bookings for other vehicles never wait. SQLite has no
+    row locks; there a no-op UPDATE takes the database write lock, which
+    serializes all writers. Call this before any other query in the atomic
+    block: on SQLite a transaction that has already read cannot wait for the
+    write lock and fails with "database is locked" instead.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        raise TransactionManagementError('lock_vehicle() must be called inside an atomic block.')
+    if connection.features.has_select_for_update:
+        Vehicle.objects.select_for_update().only('pk').get(pk=vehicle_id)
+    else:
+        Vehicle.objects.filter(pk=vehicle_id).update(seats=F('seats'))
+
+
+def hold_deadline(now=None):
+    return (now or timezone.now()) + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+
+
+def reserve_vehicle(user, vehicle, start_date, end_date, total_price):
+    """Create a pending booking held for BOOKING_HOLD_MINUTES, or raise VehicleUnavailable."""
+    with transaction.atomic():
+        lock_vehicle(vehicle.pk)
+        if not is_vehicle_available(vehicle, start_date, end_date):
+            raise VehicleUnavailable()
+        return Booking.objects.create(
+            user=user,
+            vehicle=vehicle,
+            start_date=start_date,
+            end_date=end_date,
+            total_price=total_price,
+            status='pending',
+            hold_expires_at=hold_deadline(),
+        )
@@ -0,0 +1,114 @@
+"""Denormalized review and booking counters on Vehicle.
+
+``rating_count``/``rating_sum``/``rating_avg`` and ``bookings_completed``
+let the catalog show and sort by rating and popularity without aggregating
+reviews per request. Signals (signals.py) apply each change as a single
+``UPDATE ... SET col = col + delta``, so concurrent changes never overwrite
+each other, and rating_avg is recomputed from the new sum and count in the
+same statement. Bulk status changes (holds.complete_finished, the admin
+confirm action) apply their deltas per vehicle. Archiving bookings moves
+rows without changing the counters, which cover archived bookings too.
+
+Vehicle.save() leaves the counters out of its UPDATE, so editing a vehicle
+loaded before a review arrived does not write the old values back.
+
+Anything that bypasses these paths (bulk_create, raw SQL) is corrected by
+``python manage.py repair_vehicle_stats``.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Case, Count, DecimalField, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
+
+from .cache import bump_catalog_version
+from .models import ArchivedBooking, ArchivedReview, Booking, Review, Vehicle
+
+CENT = Decimal('0.01')
+_frozen = ContextVar('vehicle_stats_frozen', default=False)
+
+
+@contextmanager
+def frozen():
+    """Deletes inside this block leave the counters and rollups alone (used when archiving)."""
+    token = _frozen.set(True)
+    try:
+        yield
+    finally:
+        _frozen.reset(token)
+
+
+def is_frozen():
+    return _frozen.get()
+
+
+def add_ratings(vehicle_id, count_delta, sum_delta):
+    # Both SET expressions read the row's values from before the UPDATE.
+    count = F('rating_count') + count_delta
+    total = F('rating_sum') + sum_delta
+    Vehicle.objects.filter(pk=vehicle_id).update(
+        rating_count=count,
+        rating_sum=total,
+        rating_avg=Case(
+            When(rating_count__gt=-count_delta, then=Cast(total, FloatField()) / count),
+            default=Value(0),
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        ),
+    )
+    # update() skips the signals that invalidate cached catalog payloads.
+    bump_catalog_version()
+
+
+def add_completed(deltas):
+    """Apply ``{vehicle_id: delta}`` to bookings_completed."""
+    changed = False
+    for vehicle_id, delta in deltas.items():
+        if delta:
+            Vehicle.objects.filter(pk=vehicle_id).update(bookings_completed=F('bookings_completed') + delta)
+            changed = True
+    if changed:
+        bump_catalog_version()
+
+
+def completed_per_vehicle(queryset):
+    """``{vehicle_id: count}`` of the completed bookings in ``queryset``."""
+    rows = queryset.filter(status='completed').order_by().values('vehicle_id').annotate(n=Count('id'))
+    return {row['vehicle_id']: row['n'] for row in rows}
+
+
+def _grouped(queryset, vehicle_field, **aggregates):
+    rows = queryset.order_by().values(vehicle_field).annotate(**aggregates)
+    return {row[vehicle_field]: row for row in rows}
+
+
+def recompute(batch_size=1000):
+    """Recount every vehicle from reviews and bookings, hot and archived; returns how many were wrong."""
+    ratings = Counter()
+    sums = Counter()
+    for queryset in (Review.objects, ArchivedReview.objects):
+        for vehicle_id, row in _grouped(queryset, 'booking__vehicle', n=Count('id'), total=Sum('rating')).items():
+            ratings[vehicle_id] += row['n']
+            sums[vehicle_id] += row['total']
+    completed = Counter()
+    for queryset in (Booking.objects, ArchivedBooking.objects):
+        completed.update(completed_per_vehicle(queryset))
+
+    counters = ['rating_count', 'rating_sum', 'bookings_completed']
+    stale = []
+    for vehicle in Vehicle.objects.only('pk', 'rating_avg', *counters).iterator(chunk_size=batch_size):
+        count, total = ratings[vehicle.pk], sums[vehicle.pk]
+        expected = {'rating_count': count, 'rating_sum': total, 'bookings_completed': completed[vehicle.pk]}
+        avg = (Decimal(total) / count).quantize(CENT, ROUND_HALF_UP) if count else Decimal(0)
+        # Backends round the stored average differently in the last place.
+        if any(getattr(vehicle, name) != value for name, value in expected.items()) \
+                or abs(vehicle.rating_avg - avg) >= CENT:
+            for name, value in expected.items():
+                setattr(vehicle, name, value)
+            vehicle.rating_avg = avg
+            stale.append(vehicle)
+    Vehicle.objects.bulk_update(stale, ['rating_avg', *counters], batch_size=batch_size)
+    if stale:
+        bump_catalog_version()
+    return len(stale)
@@ -6,26 +6,71 @@ from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import get_object_or_404
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.settings import api_settings
+from rest_framework.throttling import ScopedRateThrottle
+from datetime import date, timedelta
+from functools import wraps
+import calendar
+import math
 import stripe
 
-from .models import Vehicle, Booking, Payment
-from .serializers import VehicleSerializer, BookingCreateSerializer, BookingSerializer
-
-stripe.api_key = settings.STRIPE_SECRET_KEY
-
-
-class VehicleListView(generics.ListAPIView):
+from .models import ArchivedBooking, Vehicle, Booking
+from .serializers import ArchivedBookingSerializer, VehicleSerializer, BookingCreateSerializer, BookingSerializer
+from .utils import filter_available, month_calendar
+from .search import prefix_range, search_vehicles
+from .geo import nearby
+from .webhooks import backlog_stats, record_event
+from .payments import configure_stripe, get_or_create_checkout_session
+from .metrics import get_store as get_metrics_store, render as render_metrics
+from .usernames import username_index
+from .rollups import owner_stats
+from .fast_serializers import (
+    FastReadMixin, booking_values_serializer, dashboard_booking_values_serializer, vehicle_values_serializer,
+)
+from .cache import (
+    CatalogCacheMixin, CatalogConditionalMixin, ConditionalGetMixin, UserBookingsConditionalMixin,
+    catalog_cache_stats, vehicle_calendar_state,
+)
+
+configure_stripe()
+
+# Proximity search radius (km) when ``radius_km`` is omitted, and its ceiling.
+DEFAULT_RADIUS_KM = 5
+MAX_RADIUS_KM = 200
+# Owner stats cover the last DEFAULT_STATS_DAYS days by default, and at most MAX_STATS_DAYS.
+DEFAULT_STATS_DAYS = 30
+MAX_STATS_DAYS = 366
+
+
+class VehicleListView(CatalogConditionalMixin, CatalogCacheMixin, FastReadMixin, generics.ListAPIView):
     serializer_class = VehicleSerializer
+    values_serializer = vehicle_values_serializer
     renderer_classes = [JSONRenderer]
+    # ?ordering= values backed by the counters in vehicle_stats.py.
+    ORDERINGS = {
+        'rating': ('-rating_avg', '-rating_count', '-id'),
+        'popularity': ('-bookings_completed', '-id'),
+    }
 
     def get_queryset(self):
-        qs = Vehicle.objects.filter(is_active=True)
+        qs = Vehicle.objects.filter(is_active=True).for_api().order_by('created_at', 'id')
         vtype = self.request.query_params.get('type')
         seats = self.request.query_params.get('seats')
         min_price = self.request.query_params.get('min_price')
         max_price = self.request.query_params.get('max_price')
         city = self.request.query_params.get('city')
+        state = self.request.query_params.get('state')
+        q = self.request.query_params.get('q')
+        start_date = self.request.query_params.get('start_date')
+        end_date = self.request.query_params.get('end_date')
         if vtype:
             qs = qs.filter(type=vtype)
         if seats:
@@ -37,41 +82,227 @@ class VehicleListView(generics.ListAPIView):
             qs = qs.filter(price_per_day__gte=min_price)
         if max_price:
             qs = qs.filter(price_per_day__lte=max_price)
-        if city:
-            qs = qs.filter(location_city__icontains=city)
+        for field, prefix in (('location_city', city), ('location_state', state)):
+            bounds = prefix_range(prefix or '')
+            if bounds:
+                qs = qs.alias(**{f'{field}_lower': Lower(field)}).filter(**{
+                    f'{field}_lower__gte': bounds[0], f'{field}_lower__lt': bounds[1],
+                })
+        if start_date or end_date:
+            # A single date means "free on that day".
+            try:
+                start = parse_date(start_date or end_date)
+                end = parse_date(end_date or start_date)
+            except ValueError:
+                start = end = None
+            if start and end and start <= end:
+                qs = filter_available(qs, start, end)
+        if q:
+            # Keyset pages (?cursor=) reorder by created_at; page numbers keep relevance order.
+            qs = search_vehicles(qs, q).order_by('-search_rank', 'created_at', 'id')
+        ordering = self.ORDERINGS.get(self.request.query_params.get('ordering'))
+        if ordering:
+            # Served by vehicle_rating_idx/vehicle_popularity_idx; keyset pages still use created_at.
+            qs = qs.order_by(*ordering)
         return qs
 
-
-class VehicleDetailView(generics.RetrieveAPIView):
-    queryset = Vehicle.objects.filter(is_active=True)
+    def get_geo_filter(self):
+        """``lat``/``lng`` with ``radius_km`` and/or ``bbox=min_lng,min_lat,max_lng,max_lat``;
+        None when absent or invalid, like the other filters."""
+        params = self.request.query_params
+        center = box = None
+        try:
+            if params.get('lat') and params.get('lng'):
+                center = (float(params['lat']), float(params['lng']))
+                if not (-90 <= center[0] <= 90 and -180 <= center[1] <= 180):
+                    center = None
+            if params.get('bbox'):
+                min_lng, min_lat, max_lng, max_lat = (float(v) for v in params['bbox'].split(','))
+                if min_lat <= max_lat and min_lng <= max_lng:
+                    box = (min_lat, min_lng, max_lat, max_lng)
+            radius_km = float(params.get('radius_km') or DEFAULT_RADIUS_KM)
+        except ValueError:
+            return None
+        if not (center or box) or not 0 < radius_km <= MAX_RADIUS_KM:
+            return None
+        return {'center': center, 'radius_km': radius_km, 'box': box}
+
+    def list(self, request, *args, **kwargs):
+        geo = self.get_geo_filter()
+        if geo is None:
+            return super().list(request, *args, **kwargs)
+        matches = nearby(self.filter_queryset(self.get_queryset()), **geo)
+        if geo['center'] and request.query_params.get('ordering') == 'distance':
+            matches.sort(key=lambda match: match[1])
+        page = self.paginate_queryset(matches)
+        selected = matches if page is None else page
+        rows = self.values_serializer.rows(Vehicle.objects.filter(pk__in=[pk for pk, _ in selected]))
+        by_pk = {row['id']: row for row in rows}
+        data = self.values_serializer.serialize([by_pk[pk] for pk, _ in selected], request)
+        if geo['center']:
+            for item, (_, distance) in zip(data, selected):
+                item['distance_km'] = round(distance, 3)
+        return Response(data) if page is None else self.get_paginated_response(data)
+
+
+class VehicleDetailView(CatalogConditionalMixin, CatalogCacheMixin, FastReadMixin, generics.RetrieveAPIView):
+    queryset = Vehicle.objects.filter(is_active=True).for_api()
     serializer_class = VehicleSerializer
+    values_serializer = vehicle_values_serializer
     renderer_classes = [JSONRenderer]
 
 
+class VehicleCalendarView(ConditionalGetMixin, generics.RetrieveAPIView):
+    """Booked days of one vehicle for ``?month=YYYY-MM`` (default: this month).
+
+    Validators and the cache key come from one aggregate over the month's
+    bookings (cache.vehicle_calendar_state), so a booking changed by any
+    process, or a hold that expired, is seen on the next request.
+    """
+    renderer_classes = [JSONRenderer]
+
+    def get_month(self, request):
+        value = request.query_params.get('month')
+        if not value:
+            return timezone.localdate().replace(day=1)
+        try:
+            year, month = (int(part) for part in value.split('-'))
+            return date(year, month, 1)
+        except ValueError:
+            raise ValidationError({'month': ['Use the YYYY-MM format.']})
+
+    def get_validators(self, request):
+        first = self.get_month(request)
+        last = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+        tag, version, self.next_expiry = vehicle_calendar_state(self.kwargs['pk'], first, last)
+        self.state = tag, version
+        return self.state
+
+    def retrieve(self, request, pk):
+        month = self.get_month(request)
+        tag, version = self.state
+        key = f'{tag}-{version}'
+        data = cache.get(key)
+        if data is None:
+            if not Vehicle.objects.filter(pk=pk, is_active=True).exists():
+                raise NotFound()
+            data = month_calendar(pk, month.year, month.month)
+            timeout = settings.CALENDAR_CACHE_TIMEOUT
+            if self.next_expiry is not None:
+                # The held days free up when the hold lapses; don't keep them past that.
+                timeout = min(timeout, math.ceil((self.next_expiry - timezone.now()).total_seconds()))
+            cache.set(key, data, timeout)
+        return Response(data)
+
+
 class BookingCreateView(generics.CreateAPIView):
     serializer_class = BookingCreateSerializer
     permission_classes = [permissions.IsAuthenticated]
     renderer_classes = [JSONRenderer]
 
 
-class BookingListView(generics.ListAPIView):
+class BookingListView(UserBookingsConditionalMixin, FastReadMixin, generics.ListAPIView):
     serializer_class = BookingSerializer
+    values_serializer = booking_values_serializer
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [JSONRenderer]
+    keyset_ordering = ('-created_at', '-id')
+
+    def get_queryset(self):
+        return Booking.objects.filter(user=self.request.user).for_api().order_by('-created_at')
+
+
+class BookingHistoryView(generics.ListAPIView):
+    """The user's archived bookings, newest first (see archive.py).
+
+    Bookings that ended more than ARCHIVE_AFTER_MONTHS ago are no longer in
+    /api/bookings/my/; the dashboard loads them from here on request.
+    """
+    serializer_class = ArchivedBookingSerializer
     permission_classes = [permissions.IsAuthenticated]
     renderer_classes = [JSONRenderer]
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user).order_by('-created_at')
+        return (
+            ArchivedBooking.objects.filter(user=self.request.user)
+            .select_related('vehicle', 'payment', 'review').prefetch_related('vehicle__images')
+            .order_by('-created_at', '-id')
+        )
+
+
+class DashboardView(APIView):
+    """Everything the dashboard loads, in one round trip: the profile and a
+    page of bookings (paginated like /api/bookings/my/) with vehicle, images
+    and payment status.
+
+    Three queries whatever the page size: the page count, bookings joined to
+    vehicle and payment, and the vehicles' images. A token lookup the
+    authentication cache misses adds a fourth (see authentication.py).
+    """
+    renderer_classes = [JSONRenderer]
+    permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = BookingListView.keyset_ordering
+
+    def get(self, request):
+        queryset = Booking.objects.filter(user=request.user).order_by('-created_at', '-id')
+        rows = dashboard_booking_values_serializer.rows(queryset)
+        paginator = api_settings.DEFAULT_PAGINATION_CLASS()
+        page = paginator.paginate_queryset(rows, request, view=self)
+        bookings = dashboard_booking_values_serializer.serialize(page, request)
+        return Response({
+            'user': user_profile(request.user),
+            'bookings': paginator.get_paginated_response(bookings).data,
+        })
+
+
+class OwnerStatsView(APIView):
+    """Utilization and revenue of the user's vehicles per day, read from the
+    daily rollups (see rollups.py), so a year costs two small queries.
+
+    ``?start=YYYY-MM-DD&end=YYYY-MM-DD`` (default: the last 30 days) and
+    optionally ``vehicle=<id>`` for one of the user's vehicles.
+    """
+    renderer_classes = [JSONRenderer]
+    permission_classes = [permissions.IsAuthenticated]
 
+    def get_date(self, name, default):
+        value = self.request.query_params.get(name)
+        if not value:
+            return default
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValidationError({name: ['Use the YYYY-MM-DD format.']})
+        return day
 
-class BookingDetailView(generics.RetrieveAPIView):
+    def get(self, request):
+        end = self.get_date('end', timezone.localdate())
+        start = self.get_date('start', end - timedelta(days=DEFAULT_STATS_DAYS - 1))
+        if not 0 <= (end - start).days < MAX_STATS_DAYS:
+            raise ValidationError({'end': [f'Must be on or after start and within {MAX_STATS_DAYS} days of it.']})
+        vehicle = None
+        if request.query_params.get('vehicle'):
+            try:
+                vehicle_id = int(request.query_params['vehicle'])
+            except ValueError:
+                raise ValidationError({'vehicle': ['Must be a vehicle id.']})
+            vehicle = get_object_or_404(Vehicle, pk=vehicle_id, owner=request.user)
+        return Response(owner_stats(request.user, start, end, vehicle))
+
+
+class BookingDetailView(FastReadMixin, generics.RetrieveAPIView):
     """Retrieve a single booking by ID (only owner can view)."""
     serializer_class = BookingSerializer
+    values_serializer = booking_values_serializer
     permission_classes = [permissions.IsAuthenticated]
     renderer_classes = [JSONRenderer]
 
     def get_queryset(self):
         # Only allow user to view their own bookings
-        return Booking.objects.filter(user=self.request.user)
+        return Booking.objects.filter(user=self.request.user).for_api()
 
 
 class RegisterView(APIView):
@@ -102,13 +333,25 @@ class CheckUsernameView(APIView):
     """Check whether a username is available (GET ?username=...)."""
     renderer_classes = [JSONRenderer]
     permission_classes = []
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'username-check'
 
     def get(self, request):
         username = request.query_params.get('username', '')
         if not username:
             return Response({'available': False, 'error': 'username required'}, status=status.HTTP_400_BAD_REQUEST)
-        is_taken = User.objects.filter(username=username).exists()
-        return Response({'available': not is_taken})
+        return Response({'available': not username_index.is_taken(username)})
+
+
+def user_profile(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'date_joined': user.date_joined
+    }
 
 
 class CurrentUserView(APIView):
@@ -117,15 +360,7 @@ class CurrentUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        return Response({
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'date_joined': user.date_joined
-        })
+        return Response(user_profile(request.user))
 
     def put(self, request):
         """Update user profile (email, first_name, last_name)."""
@@ -162,7 +397,7 @@ class CancelBookingView(APIView):
 
     def post(self, request, booking_id):
         try:
-            booking = Booking.objects.get(pk=booking_id, user=request.user)
+            booking = Booking.objects.for_api().get(pk=booking_id, user=request.user)
             if booking.status in ['confirmed', 'completed']:
                 return Response({'error': 'Cannot cancel a confirmed or completed booking'}, status=status.HTTP_400_BAD_REQUEST)
             booking.status = 'cancelled'
@@ -179,24 +414,12 @@ def create_checkout_session(request):
     booking_id = request.data.get('booking_id')
     booking = get_object_or_404(Booking, pk=booking_id, user=request.user)
     try:
-        session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'usd',
-                    'product_data': {'name': f'Booking #{booking.id} - {booking.vehicle.title}'},
-                    'unit_amount': int(booking.total_price * 100),
-                },
-                'quantity': 1,
-            }],
-            mode='payment',
+        session_id = get_or_create_checkout_session(
+            booking,
             success_url=request.build_absolute_uri('/payments/success/'),
             cancel_url=request.build_absolute_uri('/payments/cancel/'),
-            metadata={'booking_id': str(booking.id)},
         )
-        # create Payment record
-        Payment.objects.update_or_create(booking=booking, defaults={'amount': booking.total_price})
-        return Response({'sessionId': session.id})
+        return Response({'sessionId': session_id})
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -210,22 +433,73 @@ def stripe_webhook(request):
         event = stripe.Webhook.construct_event(payload, sig_header, endpoint_secret)
     except ValueError:
         return Response(status=400)
-    except stripe.error.SignatureVerificationError:
+    except stripe.SignatureVerificationError:
         return Response(status=400)
 
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        booking_id = session.get('metadata', {}).get('booking_id')
-        if booking_id:
-            try:
-                booking = Booking.objects.get(pk=booking_id)
-                booking.status = 'confirmed'
-                booking.save()
-                payment, _ = Payment.objects.get_or_create(booking=booking)
-                payment.paid = True
-                payment.stripe_payment_intent = session.get('payment_intent', '')
-                payment.save()
-            except Booking.DoesNotExist:
-                pass
-
+    # Applied later by the process_webhooks command; duplicates are dropped.
+    record_event(event)
     return Response({'status': 'received'})
+
+
+def _catalog_cache_lines():
+    stats = catalog_cache_stats()
+    return [
+        '# TYPE rentals_catalog_cache_hits_total counter',
+        f"rentals_catalog_cache_hits_total {stats['hits']}",
+        '# TYPE rentals_catalog_cache_misses_total counter',
+        f"rentals_catalog_cache_misses_total {stats['misses']}",
+        '# TYPE rentals_catalog_cache_hit_ratio gauge',
+        f"rentals_catalog_cache_hit_ratio {stats['hit_ratio']:.4f}",
+    ]
+
+
+def _webhook_lines():
+    stats = backlog_stats()
+    return [
+        '# TYPE rentals_webhook_pending_events gauge',
+        f"rentals_webhook_pending_events {stats['pending']}",
+        '# TYPE rentals_webhook_failed_events gauge',
+        f"rentals_webhook_failed_events {stats['failed']}",
+        '# TYPE rentals_webhook_lag_seconds gauge',
+        f"rentals_webhook_lag_seconds {stats['lag_seconds']:.3f}",
+    ]
+
+
+def _prometheus_response(text):
+    return HttpResponse(text, content_type='text/plain; version=0.0.4')
+
+
+def metrics_view(view):
+    """Serve ``view`` to staff sessions and to scrapers sending ``Authorization: Bearer <METRICS_TOKEN>``.
+
+    Anyone else gets a 403: the metrics expose traffic, error rates and the
+    payment backlog. Without METRICS_TOKEN only staff can read them.
+    """
+    @wraps(view)
+    def guarded(request):
+        token = settings.METRICS_TOKEN
+        scraper = token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+        if not (scraper or request.user.is_staff):
+            return HttpResponseForbidden()
+        return view(request)
+    return guarded
+
+
+@metrics_view
+def catalog_cache_metrics(request):
+    """Catalog cache hit/miss counters in Prometheus text format."""
+    return _prometheus_response('\n'.join(_catalog_cache_lines()) + '\n')
+
+
+@metrics_view
+def webhook_metrics(request):
+    """Stripe webhook inbox backlog in Prometheus text format."""
+    return _prometheus_response('\n'.join(_webhook_lines()) + '\n')
+
+
+@metrics_view
+def metrics(request):
+    """Every metric in Prometheus text format: per-view request metrics summed
+    over all workers (see rentals/metrics.py), catalog cache and webhook inbox."""
+    text = render_metrics(get_metrics_store().collect())
+    return _prometheus_response(text + '\n'.join(_catalog_cache_lines() + _webhook_lines()) + '\n')
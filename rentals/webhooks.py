@@ -0,0 +1,150 @@
+"""Stripe webhook inbox.
+
+The webhook view only verifies and stores events (record_event); the
+process_webhooks command applies them later in batches. Stripe retries and
+duplicate deliveries share an event id, so they are stored once and applied
+once.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from .models import Booking, Payment, WebhookEvent
+from .utils import is_vehicle_available, lock_vehicle
+
+logger = logging.getLogger(__name__)
+
+# Events that keep failing stop being retried after this many attempts.
+MAX_ATTEMPTS = 5
+
+
+def record_event(event):
+    """Store a verified event; returns False if it was already stored."""
+    try:
+        with transaction.atomic():
+            WebhookEvent.objects.create(event_id=event['id'], type=event['type'], payload=event)
+    except IntegrityError:
+        return False
+    return True
+
+
+async def arecord_event(event):
+    """Async record_event for the ASGI webhook view.
+
+    One hop to the ORM's thread for the INSERT and the savepoint that keeps
+    a duplicate's IntegrityError from breaking an enclosing transaction.
+    """
+    return await sync_to_async(record_event)(event)
+
+
+def _booking_id(payload):
+    return payload['data']['object'].get('metadata', {}).get('booking_id')
+
+
+def checkout_vehicle(payload):
+    """The vehicle whose bookings handle_checkout_completed may change, or None."""
+    booking_id = _booking_id(payload)
+    if not booking_id:
+        return None
+    return Booking.objects.filter(pk=booking_id).values_list('vehicle_id', flat=True).first()
+
+
+def handle_checkout_completed(payload):
+    """Confirm and mark paid the booking of a completed checkout.
+
+    Runs with the booking's vehicle locked (see VEHICLE_LOCKS).
+    """
+    session = payload['data']['object']
+    booking_id = _booking_id(payload)
+    if not booking_id:
+        return
+    try:
+        booking = Booking.objects.get(pk=booking_id)
+    except Booking.DoesNotExist:
+        return
+    if booking.status == 'cancelled':
+        # Paid after its hold expired: take the dates back only if nobody
+        # else has booked them since.
+        if is_vehicle_available(booking.vehicle, booking.start_date, booking.end_date):
+            booking.status = 'confirmed'
+            booking.save()
+        else:
+            logger.warning('Booking %s was paid after its dates were rebooked; refund it', booking.pk)
+    elif booking.status != 'confirmed':
+        booking.status = 'confirmed'
+        booking.save()
+    payment, _ = Payment.objects.get_or_create(booking=booking, defaults={'amount': booking.total_price})
+    if not payment.paid:
+        payment.paid = True
+        payment.paid_at = timezone.now()
+    payment.stripe_payment_intent = session.get('payment_intent') or ''
+    payment.save()
+
+
+HANDLERS = {
+    'checkout.session.completed': handle_checkout_completed,
+}
+
+# The vehicle an event's handler writes bookings for, read before its
+# transaction opens so lock_vehicle() can be the transaction's first query.
+VEHICLE_LOCKS = {
+    'checkout.session.completed': checkout_vehicle,
+}
+
+
+def pending_events():
+    return WebhookEvent.objects.filter(processed_at__isnull=True, attempts__lt=MAX_ATTEMPTS)
+
+
+def process_event(pk, event_id, event_type, payload):
+    """Apply one event in its own transaction; returns False if another worker claimed it first.
+
+    The transaction takes the vehicle lock, then claims the event by
+    counting the attempt with an UPDATE that only matches while it is still
+    pending, so the handler's writes commit together with its processed_at
+    mark and a concurrent worker finds nothing left to claim.
+    """
+    locate = VEHICLE_LOCKS.get(event_type)
+    vehicle_id = locate(payload) if locate is not None else None
+    event = pending_events().filter(pk=pk)
+    with transaction.atomic():
+        if vehicle_id is not None:
+            lock_vehicle(vehicle_id)
+        if not event.update(attempts=F('attempts') + 1):
+            return False
+        try:
+            with transaction.atomic():
+                handler = HANDLERS.get(event_type)
+                if handler is not None:
+                    handler(payload)
+                WebhookEvent.objects.filter(pk=pk).update(processed_at=timezone.now(), last_error='')
+        except Exception as exc:
+            logger.exception('Stripe event %s failed', event_id)
+            WebhookEvent.objects.filter(pk=pk).update(last_error=repr(exc))
+    return True
+
+
+def process_batch(batch_size=100):
+    """Apply up to ``batch_size`` pending events; returns how many were handled.
+
+    The pending ids are read without locks, then each event is claimed and
+    applied in its own transaction (process_event), so no lock is held from
+    one event to the next and a slow handler holds up only its own vehicle.
+    Events another worker got to first are skipped.
+    """
+    events = pending_events().order_by('id').values_list('pk', 'event_id', 'type', 'payload')[:batch_size]
+    return sum(process_event(*event) for event in events)
+
+
+def backlog_stats():
+    """Pending count and age in seconds of the oldest pending event."""
+    pending = pending_events()
+    oldest = pending.aggregate(oldest=Min('received_at'))['oldest']
+    return {
+        'pending': pending.count(),
+        'lag_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+        'failed': WebhookEvent.objects.filter(processed_at__isnull=True, attempts__gte=MAX_ATTEMPTS).count(),
+    }